@@ -0,0 +1,277 @@
+"""
+This module calculates chance-corrected agreement between any number of annotators, or annotation methods, each of
+which has produced a batch of Document objects for the same notes. The annotations of all the annotators are aligned
+once, and pairwise Cohen's kappa and Krippendorff's alpha are then calculated from the aligned labels, so that adding an
+annotator does not require comparing every pair of batches with DocumentComparison.
+"""
+
+from ..Annotations.MentionLevelAnnotation import MentionLevelAnnotation
+from .DocumentComparison import CandidateIndexer
+from collections import namedtuple
+import itertools
+
+AlignedLabels = namedtuple('AlignedLabels', ['labelMatrix', 'labelNames', 'annotatorNames', 'unitDocuments', 'unitSpans'])
+PairwiseAgreement = namedtuple('PairwiseAgreement', ['kappa', 'alpha', 'observedAgreement', 'numUnits'])
+AgreementResults = namedtuple('AgreementResults', ['pairwise', 'alpha', 'numUnits', 'labelNames'])
+
+# The code of a unit an annotator read but did not annotate, and of a unit whose document the annotator did not read.
+_noAnnotationCode = 0
+_missingCode = -1
+
+
+def _annotatorNames(batches, annotatorNames):
+    """Returns the annotator names, defaulting to the annotationGroup of each batch when those are distinct."""
+    if annotatorNames is not None:
+        if len(annotatorNames) != len(batches) or len(set(annotatorNames)) != len(annotatorNames):
+            raise ValueError("annotatorNames must contain one unique name per batch. Got %s." % annotatorNames)
+        return list(annotatorNames)
+    groups = [batch[0].annotationGroup if batch else None for batch in batches]
+    if None not in groups and len(set(groups)) == len(groups):
+        return groups
+    return ["annotator%i" % (index + 1) for index in range(len(batches))]
+
+
+def _documentsByName(batches):
+    """Returns a list with one dictionary per batch mapping document names to documents, and the sorted set of names."""
+    if len(batches) < 2:
+        raise ValueError("At least two batches of documents are required to calculate agreement. Got %i." % len(batches))
+    documentMaps = []
+    for batch in batches:
+        documentMap = {}
+        for document in batch:
+            if document.documentName in documentMap:
+                raise ValueError("Each batch may only contain one document named %s." % document.documentName)
+            documentMap[document.documentName] = document
+        documentMaps.append(documentMap)
+    documentNames = sorted(set(itertools.chain.from_iterable(documentMaps)))
+    return documentMaps, documentNames
+
+
+def _overlapClusters(annotations):
+    """
+    Groups annotations into clusters of transitively overlapping annotations, i.e. the connected components of the graph
+    in which two annotations are joined if MentionLevelAnnotation.overlap() is True. Returns a list of lists of indices
+    into 'annotations', ordered by the start of each cluster.
+    """
+    parents = range(len(annotations))
+
+    def findRoot(index):
+        while parents[index] != index:
+            parents[index] = parents[parents[index]]
+            index = parents[index]
+        return index
+
+    useIntervalIndex = all(annotation.start <= annotation.end for annotation in annotations)
+    candidates = CandidateIndexer(annotations, "intervalTree", useIntervalIndex)
+    for index, annotation in enumerate(annotations):
+        for candidateIndex in candidates(annotation):
+            if candidateIndex <= index:
+                continue
+            if MentionLevelAnnotation.overlap(annotation, annotations[candidateIndex]):
+                root, candidateRoot = findRoot(index), findRoot(candidateIndex)
+                if root != candidateRoot:
+                    parents[max(root, candidateRoot)] = min(root, candidateRoot)
+
+    clusters = {}
+    for index in range(len(annotations)):
+        clusters.setdefault(findRoot(index), []).append(index)
+    return sorted(clusters.values(), key=lambda cluster: min(annotations[index].start for index in cluster))
+
+
+def AlignAnnotations(batches, annotatorNames=None, labelFunction=None):
+    """
+    Aligns the mention level annotations of several annotators. Within each document the annotations of all the annotators are pooled and grouped into units of transitively overlapping annotations, as judged by MentionLevelAnnotation.overlap(), using an AnnotationIntervalIndex so that every annotation is only checked against the annotations near it. Each annotator then receives one label per unit: the most common label among their annotations in the unit, with ties broken by the label that sorts first, or 'None' if they read the document but made no annotation in the unit. Units in which no annotator made an annotation do not exist, so agreement about the absence of annotations elsewhere in the notes is not counted.
+
+    :param batches: [list of lists] One list of Document objects per annotator. Documents are matched across batches by name. An annotator whose batch does not contain a document is treated as not having read it.
+    :param annotatorNames: [list of strings] Optional names for the annotators. Defaults to the annotationGroup of each batch when those are all distinct, and otherwise to 'annotator1', 'annotator2', etc.
+    :param labelFunction: [function] Optional function that takes a MentionLevelAnnotation and returns its label. Defaults to the annotation's annotationClass.
+    :return: [AlignedLabels] A namedtuple with the fields 'labelMatrix', an int32 numpy array with one row per unit and one column per annotator holding the index of each label in 'labelNames', or -1 where the annotator did not read the document, 'labelNames', whose first entry is None, 'annotatorNames', 'unitDocuments', the name of the document of each unit, and 'unitSpans', the (start, end) span covered by each unit.
+    """
+    # numpy is slow to import, so it is only imported when agreement is calculated.
+    import numpy as np
+
+    if labelFunction is None:
+        labelFunction = lambda annotation: annotation.annotationClass
+    documentMaps, documentNames = _documentsByName(batches)
+    annotatorNames = _annotatorNames(batches, annotatorNames)
+
+    labelNames = [None]
+    labelCodes = {None: _noAnnotationCode}
+    rows = []
+    unitDocuments = []
+    unitSpans = []
+    for documentName in documentNames:
+        readBy = [documentMap.get(documentName) is not None for documentMap in documentMaps]
+        annotators = []
+        annotations = []
+        for annotatorIndex, documentMap in enumerate(documentMaps):
+            if readBy[annotatorIndex]:
+                annotations.extend(documentMap[documentName].annotations)
+                annotators.extend([annotatorIndex] * len(documentMap[documentName].annotations))
+
+        for cluster in _overlapClusters(annotations):
+            labelsByAnnotator = {}
+            for index in cluster:
+                labelsByAnnotator.setdefault(annotators[index], []).append(labelFunction(annotations[index]))
+            row = []
+            for annotatorIndex in range(len(documentMaps)):
+                if not readBy[annotatorIndex]:
+                    row.append(_missingCode)
+                    continue
+                labels = labelsByAnnotator.get(annotatorIndex)
+                if not labels:
+                    row.append(_noAnnotationCode)
+                    continue
+                label = min(set(labels), key=lambda candidate: (-labels.count(candidate), candidate))
+                if label not in labelCodes:
+                    labelCodes[label] = len(labelNames)
+                    labelNames.append(label)
+                row.append(labelCodes[label])
+            rows.append(row)
+            unitDocuments.append(documentName)
+            unitSpans.append((min(annotations[index].start for index in cluster), max(annotations[index].end for index in cluster)))
+
+    labelMatrix = np.array(rows, dtype=np.int32).reshape(len(rows), len(documentMaps))
+    return AlignedLabels(labelMatrix, labelNames, annotatorNames, unitDocuments, unitSpans)
+
+
+def AlignDocumentClassifications(batches, annotatorNames=None):
+    """
+    Aligns the document classification labels of several annotators, producing one unit per document.
+
+    :param batches: [list of lists] One list of ClassifiedDocument objects per annotator. Documents are matched across batches by name. An annotator whose batch does not contain a document is treated as not having classified it.
+    :param annotatorNames: [list of strings] Optional names for the annotators, see AlignAnnotations().
+    :return: [AlignedLabels] As returned by AlignAnnotations(), with one unit per document. 'unitSpans' holds None for every unit, and the first entry of 'labelNames', None, is not used.
+    """
+    # numpy is slow to import, so it is only imported when agreement is calculated.
+    import numpy as np
+
+    documentMaps, documentNames = _documentsByName(batches)
+    annotatorNames = _annotatorNames(batches, annotatorNames)
+
+    labelNames = [None]
+    labelCodes = {}
+    rows = []
+    for documentName in documentNames:
+        row = []
+        for documentMap in documentMaps:
+            document = documentMap.get(documentName)
+            if document is None:
+                row.append(_missingCode)
+                continue
+            if not hasattr(document, "documentClass"):
+                raise ValueError("Document classification agreement requires ClassifiedDocument objects. %s has no documentClass." % documentName)
+            if document.documentClass not in labelCodes:
+                labelCodes[document.documentClass] = len(labelNames)
+                labelNames.append(document.documentClass)
+            row.append(labelCodes[document.documentClass])
+        rows.append(row)
+
+    labelMatrix = np.array(rows, dtype=np.int32).reshape(len(rows), len(documentMaps))
+    return AlignedLabels(labelMatrix, labelNames, annotatorNames, documentNames, [None] * len(documentNames))
+
+
+def CohensKappa(labels1, labels2, numLabels=None):
+    """
+    Calculates Cohen's kappa for two annotators from integer label codes. Units where either annotator has a negative code are ignored. The result is the same as sklearn's cohen_kappa_score(), including being NaN when the agreement expected by chance is 1, e.g. when both annotators use the same single label.
+
+    :param labels1: [numpy array] The label code of each unit for the first annotator.
+    :param labels2: [numpy array] The label code of each unit for the second annotator.
+    :param numLabels: [int] Optional number of distinct label codes. Defaults to one more than the largest code.
+    :return: [float] Cohen's kappa.
+    """
+    # numpy is slow to import, so it is only imported when agreement is calculated.
+    import numpy as np
+
+    labels1 = np.asarray(labels1)
+    labels2 = np.asarray(labels2)
+    present = (labels1 >= 0) & (labels2 >= 0)
+    labels1 = labels1[present]
+    labels2 = labels2[present]
+    if len(labels1) == 0:
+        return float('nan')
+    if numLabels is None:
+        numLabels = int(max(labels1.max(), labels2.max())) + 1
+
+    confusion = np.bincount(labels1 * numLabels + labels2, minlength=numLabels * numLabels).reshape(numLabels, numLabels)
+    numUnits = float(len(labels1))
+    observed = np.trace(confusion) / numUnits
+    expected = np.dot(confusion.sum(axis=1), confusion.sum(axis=0)) / numUnits ** 2
+    if expected == 1:
+        return float('nan')
+    return float((observed - expected) / (1 - expected))
+
+
+def KrippendorffsAlpha(labelMatrix, numLabels=None):
+    """
+    Calculates Krippendorff's alpha for nominal data from a matrix of integer label codes with one row per unit and one column per annotator. Negative codes mark missing values, and units with fewer than two values are not pairable and are ignored. The result is NaN if there are no pairable units or if all the pairable values are the same label.
+
+    :param labelMatrix: [numpy array] A 2-dimensional array of label codes.
+    :param numLabels: [int] Optional number of distinct label codes. Defaults to one more than the largest code.
+    :return: [float] Krippendorff's alpha.
+    """
+    # numpy is slow to import, so it is only imported when agreement is calculated.
+    import numpy as np
+
+    labelMatrix = np.asarray(labelMatrix)
+    if numLabels is None:
+        numLabels = int(labelMatrix.max()) + 1 if labelMatrix.size else 1
+
+    # The number of values of each label in each unit.
+    unitIndices, annotatorIndices = np.nonzero(labelMatrix >= 0)
+    valueCounts = np.bincount(unitIndices * numLabels + labelMatrix[unitIndices, annotatorIndices],
+                              minlength=len(labelMatrix) * numLabels).reshape(len(labelMatrix), numLabels)
+    valuesPerUnit = valueCounts.sum(axis=1)
+    pairable = valuesPerUnit >= 2
+    valueCounts = valueCounts[pairable].astype(float)
+    if len(valueCounts) == 0:
+        return float('nan')
+
+    # The coincidence matrix counts every ordered pair of values from different annotators in the same unit, each
+    # unit weighted by 1 / (values in the unit - 1).
+    weightedCounts = valueCounts / (valuesPerUnit[pairable] - 1)[:, np.newaxis]
+    coincidences = np.dot(valueCounts.T, weightedCounts) - np.diag(weightedCounts.sum(axis=0))
+    labelTotals = coincidences.sum(axis=1)
+    numValues = labelTotals.sum()
+
+    observedDisagreement = coincidences.sum() - np.trace(coincidences)
+    expectedDisagreement = (numValues ** 2 - np.dot(labelTotals, labelTotals)) / (numValues - 1)
+    if expectedDisagreement == 0:
+        return float('nan')
+    return float(1 - observedDisagreement / expectedDisagreement)
+
+
+def CalculateAgreement(batches, level="span", annotatorNames=None, labelFunction=None):
+    """
+    Calculates the chance-corrected agreement between several annotators. The annotations are aligned once with AlignAnnotations(), or with AlignDocumentClassifications() if 'level' is "document", and Cohen's kappa, Krippendorff's alpha and the observed agreement of every pair of annotators, as well as Krippendorff's alpha across all of them, are calculated from the aligned labels.
+
+    The pairwise values of two annotators only use the units that both of them read and that at least one of them annotated, so they do not depend on which other annotators are included. At the span level a unit annotated by only one of the pair counts as a disagreement between that annotator's label and the None label.
+
+    :param batches: [list of lists] One list of Document objects per annotator, or ClassifiedDocument objects if 'level' is "document".
+    :param level: [string] Either "span" (default), to calculate agreement on the mention level annotations, or "document", to calculate agreement on the document classifications.
+    :param annotatorNames: [list of strings] Optional names for the annotators, see AlignAnnotations().
+    :param labelFunction: [function] Optional function returning the label of a MentionLevelAnnotation, see AlignAnnotations(). Ignored if 'level' is "document".
+    :return: [AgreementResults] A namedtuple with the fields 'pairwise', a dictionary mapping each (annotatorName1, annotatorName2) pair, in the order of 'batches', to a PairwiseAgreement namedtuple of the form (kappa, alpha, observedAgreement, numUnits), 'alpha', Krippendorff's alpha across all the annotators, 'numUnits', the number of aligned units, and 'labelNames', the labels that occurred.
+    """
+    if level == "span":
+        aligned = AlignAnnotations(batches, annotatorNames, labelFunction)
+    elif level == "document":
+        aligned = AlignDocumentClassifications(batches, annotatorNames)
+    else:
+        raise ValueError("level must either be 'span' or 'document'. Got %s." % level)
+
+    labelMatrix = aligned.labelMatrix
+    numLabels = len(aligned.labelNames)
+    pairwise = {}
+    for index1, index2 in itertools.combinations(range(len(aligned.annotatorNames)), 2):
+        labels1 = labelMatrix[:, index1]
+        labels2 = labelMatrix[:, index2]
+        inPair = (labels1 >= 0) & (labels2 >= 0) & ((labels1 != _noAnnotationCode) | (labels2 != _noAnnotationCode))
+        pairMatrix = labelMatrix[inPair][:, [index1, index2]]
+        numUnits = len(pairMatrix)
+        observedAgreement = float((pairMatrix[:, 0] == pairMatrix[:, 1]).sum()) / numUnits if numUnits else float('nan')
+        pairwise[(aligned.annotatorNames[index1], aligned.annotatorNames[index2])] = PairwiseAgreement(
+            CohensKappa(pairMatrix[:, 0], pairMatrix[:, 1], numLabels), KrippendorffsAlpha(pairMatrix, numLabels),
+            observedAgreement, numUnits)
+
+    return AgreementResults(pairwise, KrippendorffsAlpha(labelMatrix, numLabels), len(labelMatrix), aligned.labelNames)
@@ -0,0 +1,414 @@
+"""
+This module exports :class:`Comparison <eHostess.Analysis.DocumentComparison.Comparison>` objects and the annotations
+in :class:`Document <eHostess.Annotations.Document.Document>` objects to columnar files that dataframe libraries can load
+directly, rather than to TSV files that must be parsed. Columns holding document names, comparison results, annotation
+classes, annotator names and attributes are dictionary encoded, i.e. stored as integer codes into a small table of
+distinct values.
+
+Parquet and Arrow IPC files are written with pyarrow, which is optional. Arrow IPC files can be memory-mapped, e.g. with
+pyarrow.memory_map() and pyarrow.ipc.open_file(). If pyarrow is not installed the columns can be written to a directory
+of plain numpy .npy files instead. LoadNpyExport() memory-maps these files and returns the arrays without converting
+them to Python objects, and ColumnToList() converts a single column to a list when one is needed.
+"""
+
+from collections import OrderedDict, namedtuple
+from itertools import imap
+import json
+import os
+
+fileFormats = ("parquet", "arrow", "npy")
+
+# The columns of an export. 'codes' holds, for each row, the index of its value in 'categories' or -1 if the value is
+# missing. Strings are stored as UTF-8 bytes in 'data', with the bytes of row i in data[offsets[i]:offsets[i + 1]], the
+# same layout Arrow uses. 'valid' is a boolean array that is False for missing values, or None if no value is missing.
+CategoryColumn = namedtuple('CategoryColumn', ['codes', 'categories'])
+StringColumn = namedtuple('StringColumn', ['data', 'offsets', 'valid'])
+IntegerColumn = namedtuple('IntegerColumn', ['values', 'valid'])
+
+_schemaFileName = "schema.json"
+
+
+def _toUnicode(value):
+    """Returns value as unicode, decoding byte strings as UTF-8, or None if value is None."""
+    if value is None or isinstance(value, unicode):
+        return value
+    if isinstance(value, str):
+        return value.decode('utf-8')
+    return unicode(value)
+
+
+def _toBytes(value):
+    """Returns value as a UTF-8 byte string. Byte strings are assumed to already be UTF-8."""
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    if isinstance(value, str):
+        return value
+    return str(value)
+
+
+def _smallestIntegerType(minimum, maximum):
+    """Returns the smallest signed numpy integer type, of at least 8 bits, that holds every value from minimum to maximum."""
+    import numpy as np
+
+    for integerType in (np.int8, np.int16, np.int32):
+        if np.iinfo(integerType).min <= minimum and maximum <= np.iinfo(integerType).max:
+            return integerType
+    return np.int64
+
+
+def _packStrings(strings):
+    """Packs a list of strings, which may contain None, into a StringColumn."""
+    import numpy as np
+
+    valid = np.fromiter((string is not None for string in strings), dtype=bool, count=len(strings))
+    encodedStrings = strings if valid.all() else [string if string is not None else "" for string in strings]
+    # Columns holding only byte strings can be joined as they are. Otherwise every string is converted to UTF-8 first.
+    try:
+        joined = "".join(encodedStrings)
+    except (TypeError, UnicodeError):
+        joined = None
+    if not isinstance(joined, str):
+        encodedStrings = map(_toBytes, encodedStrings)
+        joined = "".join(encodedStrings)
+    lengths = np.fromiter(imap(len, encodedStrings), dtype=np.int64, count=len(encodedStrings))
+    offsets = np.zeros(len(encodedStrings) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    # 32-bit offsets, as used by Arrow's string type, are enough unless the column holds more than 2GB of text.
+    offsets = offsets.astype(np.int32 if offsets[-1] <= np.iinfo(np.int32).max else np.int64)
+    data = np.frombuffer(joined, dtype=np.uint8)
+    return StringColumn(data, offsets, None if valid.all() else valid)
+
+
+def _unpackStrings(column):
+    """Returns the strings of a StringColumn as a list of unicode strings, with None for missing values."""
+    data = column.data.tostring()
+    offsets = column.offsets.tolist()
+    if column.valid is None:
+        return [data[offsets[index]:offsets[index + 1]].decode('utf-8') for index in range(len(offsets) - 1)]
+    return [data[offsets[index]:offsets[index + 1]].decode('utf-8') if isValid else None
+            for index, isValid in enumerate(column.valid.tolist())]
+
+
+class _ColumnBuilder:
+    """
+    Collects the values of the columns of an export. Each column has one of four kinds: "category", a dictionary
+    encoded string column, "json", a column of dictionaries that are serialized as JSON and then dictionary encoded,
+    "string", or "int". The list of values of each column is stored in 'values' under the column's name, with None for
+    missing values.
+    """
+    def __init__(self, columns):
+        self.columns = columns
+        self.values = {}
+        self._jsonCache = {}
+
+    def setValues(self, columnValues):
+        """Stores a sequence of values for each column, in the order of 'columns'. Dictionaries in "json" columns are serialized with toJSON()."""
+        for (name, kind), values in zip(self.columns, columnValues):
+            self.values[name] = map(self.toJSON, values) if kind == "json" else values
+
+    def toJSON(self, value):
+        """Returns value serialized as JSON, or None if value is None. Values that JSON cannot represent are converted with str()."""
+        if value is None:
+            return None
+        # Most annotations share a handful of distinct attribute dictionaries, so their JSON is cached. Only
+        # dictionaries of strings are added to the cache, since equal values of other types, e.g. 1, 1.0 and True, do
+        # not necessarily serialize to the same JSON. A dictionary can then only find a cached entry if its values are
+        # strings too, so it does not need to be checked before the lookup.
+        try:
+            key = frozenset(value.iteritems())
+            serialized = self._jsonCache.get(key)
+        except (TypeError, AttributeError):
+            return json.dumps(value, sort_keys=True, default=str)
+        if serialized is None:
+            serialized = json.dumps(value, sort_keys=True, default=str)
+            if all(isinstance(name, basestring) and isinstance(item, basestring) for name, item in key):
+                self._jsonCache[key] = serialized
+        return serialized
+
+    def encode(self):
+        """Returns an OrderedDict mapping each column name to a (kind, column) tuple, where column is a CategoryColumn, StringColumn or IntegerColumn holding numpy arrays. "json" columns are returned as "category" columns."""
+        import numpy as np
+
+        encoded = OrderedDict()
+        for name, kind in self.columns:
+            values = self.values[name]
+            if kind in ("category", "json"):
+                categories = set(values)
+                categories.discard(None)
+                categories = sorted(categories, key=_toUnicode)
+                categoryCodes = dict((value, code) for code, value in enumerate(categories))
+                categoryCodes[None] = -1
+                codes = np.fromiter(imap(categoryCodes.__getitem__, values), dtype=np.int32, count=len(values))
+                codes = codes.astype(_smallestIntegerType(-1, len(categories) - 1))
+                encoded[name] = ("category", CategoryColumn(codes, map(_toUnicode, categories)))
+            elif kind == "string":
+                encoded[name] = (kind, _packStrings(values))
+            else:
+                valid = None
+                if None in values:
+                    valid = np.fromiter((value is not None for value in values), dtype=bool, count=len(values))
+                    values = [value if value is not None else 0 for value in values]
+                integers = np.array(values, dtype=np.int64)
+                # Spans and document lengths fit in 32 bits unless a note is larger than 2GB.
+                if len(integers) == 0 or _smallestIntegerType(integers.min(), integers.max()) != np.int64:
+                    integers = integers.astype(np.int32)
+                encoded[name] = (kind, IntegerColumn(integers, valid))
+        return encoded
+
+
+_comparisonColumns = [("documentName", "category"), ("comparisonResult", "category"), ("docLength", "int")]
+# Each annotation field is a tuple of the form (comparison column suffix, MentionLevelAnnotation attribute, kind). The
+# fields are in the order used by _annotationFieldValues().
+_annotationFields = [("Annotator", "annotator", "category"), ("Class", "annotationClass", "category"),
+                     ("Id", "annotationId", "string"), ("Text", "text", "string"), ("Start", "start", "int"),
+                     ("End", "end", "int"), ("Attributes", "attributes", "json")]
+for _prefix in ("annotation1", "annotation2"):
+    _comparisonColumns.extend([(_prefix + suffix, kind) for suffix, attributeName, kind in _annotationFields])
+
+_annotationColumns = [("documentName", "category"), ("annotationGroup", "category"), ("documentClass", "category"),
+                      ("numberOfCharacters", "int")]
+_annotationColumns.extend([(attributeName, kind) for suffix, attributeName, kind in _annotationFields])
+
+
+class _MissingAnnotation:
+    """Stands in for a missing annotation. Every field of _annotationFields is None."""
+    annotator = annotationClass = annotationId = text = start = end = attributes = None
+
+_missingAnnotation = _MissingAnnotation()
+
+
+def _annotationFieldValues(annotations):
+    """Returns a list with the values of each field in _annotationFields for a list of annotations, which may contain
+    None for missing annotations. Each column is gathered in a single pass rather than building a tuple per row."""
+    annotations = [annotation if annotation is not None else _missingAnnotation for annotation in annotations]
+    return [[annotation.annotator for annotation in annotations],
+            [annotation.annotationClass for annotation in annotations],
+            [annotation.annotationId for annotation in annotations],
+            [annotation.text for annotation in annotations],
+            [annotation.start for annotation in annotations],
+            [annotation.end for annotation in annotations],
+            [annotation.attributes for annotation in annotations]]
+
+
+def _comparisonColumnValues(comparisons):
+    """Returns a list with the values of each column in _comparisonColumns for a list of comparisons."""
+    columnValues = [[comparison.documentName for comparison in comparisons],
+                    [comparison.comparisonResult for comparison in comparisons],
+                    [comparison.docLength for comparison in comparisons]]
+    columnValues.extend(_annotationFieldValues([comparison.annotation1 for comparison in comparisons]))
+    columnValues.extend(_annotationFieldValues([comparison.annotation2 for comparison in comparisons]))
+    return columnValues
+
+
+def _annotationColumnValues(documents):
+    """Returns a list with the values of each column in _annotationColumns for the annotations in a list of documents."""
+    annotationDocuments = []
+    annotations = []
+    for document in documents:
+        annotationDocuments.extend([document] * len(document.annotations))
+        annotations.extend(document.annotations)
+    columnValues = [[document.documentName for document in annotationDocuments],
+                    [document.annotationGroup for document in annotationDocuments],
+                    [getattr(document, "documentClass", None) for document in annotationDocuments],
+                    [document.numberOfCharacters for document in annotationDocuments]]
+    columnValues.extend(_annotationFieldValues(annotations))
+    return columnValues
+
+
+def _resolveFormat(fileFormat):
+    """Returns the format to write, choosing parquet or npy if fileFormat is None, and checks that pyarrow is available if it is needed."""
+    if fileFormat is not None and fileFormat not in fileFormats:
+        raise ValueError("fileFormat must be None or one of %s. Got %s." % (", ".join(fileFormats), fileFormat))
+    if fileFormat == "npy":
+        return fileFormat
+    try:
+        import pyarrow
+    except ImportError:
+        if fileFormat is None:
+            return "npy"
+        raise ImportError("pyarrow is required to write %s files. Install pyarrow or use fileFormat='npy'." % fileFormat)
+    return fileFormat or "parquet"
+
+
+def _validityBitmap(valid):
+    """Returns the Arrow validity bitmap of a boolean array, in which bit i of the bytes, counting from the least significant bit, is set if row i is valid."""
+    import numpy as np
+
+    padded = np.zeros(-(-len(valid) // 8) * 8, dtype=bool)
+    padded[:len(valid)] = valid
+    return np.packbits(padded.reshape(-1, 8)[:, ::-1])
+
+
+def _arrowStrings(column):
+    """Returns a pyarrow string array sharing the layout of a StringColumn."""
+    import numpy as np
+    import pyarrow as pa
+
+    # Columns holding more than 2GB of text have 64-bit offsets, which Arrow's large_string type uses.
+    arrayType = pa.StringArray if column.offsets.dtype == np.int32 else pa.LargeStringArray
+    offsets = column.offsets
+    if column.valid is None:
+        return arrayType.from_buffers(len(offsets) - 1, pa.py_buffer(offsets), pa.py_buffer(column.data))
+    return arrayType.from_buffers(len(offsets) - 1, pa.py_buffer(offsets), pa.py_buffer(column.data),
+                                  pa.py_buffer(_validityBitmap(column.valid)), int((~column.valid).sum()))
+
+
+def _writeArrow(encoded, outputPath, fileFormat):
+    """Writes the encoded columns to a Parquet or Arrow IPC file with pyarrow. Dictionary indices are always int32 and integers always int64, so that every file has the same schema regardless of its contents."""
+    import numpy as np
+    import pyarrow as pa
+
+    arrays = []
+    for name, (kind, column) in encoded.iteritems():
+        if kind == "category":
+            indices = pa.array(column.codes.astype(np.int32), type=pa.int32(), mask=column.codes < 0)
+            arrays.append(pa.DictionaryArray.from_arrays(indices, pa.array(column.categories, type=pa.string())))
+        elif kind == "string":
+            arrays.append(_arrowStrings(column))
+        else:
+            mask = None if column.valid is None else ~column.valid
+            arrays.append(pa.array(column.values.astype(np.int64), type=pa.int64(), mask=mask))
+    table = pa.Table.from_arrays(arrays, list(encoded.keys()))
+
+    if fileFormat == "parquet":
+        import pyarrow.parquet as pq
+        pq.write_table(table, outputPath)
+        return
+    sink = pa.OSFile(outputPath, 'wb')
+    try:
+        writer = pa.RecordBatchFileWriter(sink, table.schema)
+        writer.write_table(table)
+        writer.close()
+    finally:
+        sink.close()
+
+
+def _columnArrays(kind, column):
+    """Returns the (suffix, array) pairs stored for a column. The array is None for a 'valid' array that is not stored because no value is missing."""
+    if kind == "category":
+        categories = _packStrings(column.categories)
+        return [("codes", column.codes), ("categories.data", categories.data), ("categories.offsets", categories.offsets)]
+    return zip(column._fields, column)
+
+
+def _writeNpy(encoded, outputPath):
+    """
+    Writes the encoded columns to a directory holding one .npy file per array, e.g. 'documentName.codes.npy', and a
+    'schema.json' file listing the columns. The schema is written last, so a directory without one is incomplete.
+    """
+    import numpy as np
+
+    if not os.path.isdir(outputPath):
+        os.makedirs(outputPath)
+    schemaPath = os.path.join(outputPath, _schemaFileName)
+    if os.path.exists(schemaPath):
+        os.remove(schemaPath)
+
+    for name, (kind, column) in encoded.iteritems():
+        for suffix, array in _columnArrays(kind, column):
+            arrayPath = os.path.join(outputPath, "%s.%s.npy" % (name, suffix))
+            if array is not None:
+                # The array is written to a new file that replaces the old one, rather than overwriting it, so arrays
+                # that are still memory-mapped from an earlier export to the same directory remain readable.
+                temporaryPath = arrayPath + ".tmp"
+                with open(temporaryPath, 'wb') as arrayFile:
+                    np.save(arrayFile, array)
+                if os.name == "nt" and os.path.exists(arrayPath):
+                    os.remove(arrayPath)
+                os.rename(temporaryPath, arrayPath)
+            elif os.path.exists(arrayPath):
+                # Left by an earlier export to the same directory, in which some values were missing.
+                os.remove(arrayPath)
+    with open(schemaPath, 'w') as schemaFile:
+        json.dump([[name, kind] for name, (kind, column) in encoded.iteritems()], schemaFile)
+
+
+def _export(builder, outputPath, fileFormat):
+    fileFormat = _resolveFormat(fileFormat)
+    encoded = builder.encode()
+    if fileFormat == "npy":
+        _writeNpy(encoded, outputPath)
+    else:
+        _writeArrow(encoded, outputPath, fileFormat)
+    return fileFormat
+
+
+def ExportComparisons(comparisons, outputPath, fileFormat=None):
+    """
+    Writes a list of Comparison objects to a columnar file with one row per comparison. The columns are 'documentName', 'comparisonResult' and 'docLength', followed by 'Annotator', 'Class', 'Id', 'Text', 'Start', 'End' and 'Attributes' columns for each of the two annotations, prefixed with 'annotation1' and 'annotation2', e.g. 'annotation1Class'. The attributes of each annotation are stored as a JSON object. The fields of a missing annotation are null. The document names, comparison results, annotators, classes and attributes are dictionary encoded.
+
+    :param comparisons: [list of objects] A list of :class:`Comparison <eHostess.Analysis.DocumentComparison.Comparison>` objects.
+    :param outputPath: [string] The path of the file to write or, for "npy", of the directory to write the arrays to. The directory is created if it does not exist.
+    :param fileFormat: [None | string] "parquet", "arrow" for an Arrow IPC file, or "npy" for a directory of numpy .npy files that LoadNpyExport() reads. "parquet" and "arrow" require pyarrow. If None (default) a Parquet file is written if pyarrow is installed and a directory of .npy files otherwise.
+    :return: [string] The format that was written.
+    """
+    builder = _ColumnBuilder(_comparisonColumns)
+    builder.setValues(_comparisonColumnValues(comparisons))
+    return _export(builder, outputPath, fileFormat)
+
+
+def ExportAnnotations(documents, outputPath, fileFormat=None):
+    """
+    Writes the annotations in a list of Document or ClassifiedDocument objects to a columnar file with one row per annotation. The columns are 'documentName', 'annotationGroup', 'documentClass' (null unless the document is a ClassifiedDocument), 'numberOfCharacters', 'annotator', 'annotationClass', 'annotationId', 'text', 'start', 'end' and 'attributes', which holds each annotation's attributes as a JSON object. All but the 'numberOfCharacters', 'annotationId', 'text', 'start' and 'end' columns are dictionary encoded. Documents without annotations do not produce any rows.
+
+    :param documents: [list of objects] A list of :class:`Document <eHostess.Annotations.Document.Document>` objects.
+    :param outputPath: [string] The path of the file or directory to write, see ExportComparisons().
+    :param fileFormat: [None | string] "parquet", "arrow" or "npy", see ExportComparisons().
+    :return: [string] The format that was written.
+    """
+    builder = _ColumnBuilder(_annotationColumns)
+    builder.setValues(_annotationColumnValues(documents))
+    return _export(builder, outputPath, fileFormat)
+
+
+def LoadNpyExport(inputPath, mmapMode='r'):
+    """
+    Reads a directory written by ExportComparisons() or ExportAnnotations() with fileFormat="npy". The arrays are memory-mapped by default, so loading is almost instant and only the parts of the columns that are used are read from disk. No per-row Python objects are created; use ColumnToList() to convert a column to a list.
+
+    :param inputPath: [string] The path of the directory.
+    :param mmapMode: [None | string] Passed to numpy.load() as 'mmap_mode'. Defaults to 'r', which memory-maps the arrays read-only. If None the arrays are read into memory.
+    :return: [OrderedDict] Maps each column name, in order, to a CategoryColumn, StringColumn or IntegerColumn namedtuple. The categories of a CategoryColumn are a list of unicode strings, and all other fields are numpy arrays, or None for a 'valid' array if no value in the column is missing.
+    """
+    import numpy as np
+
+    with open(os.path.join(inputPath, _schemaFileName)) as schemaFile:
+        schema = json.load(schemaFile)
+
+    def loadArray(name, suffix):
+        arrayPath = os.path.join(inputPath, "%s.%s.npy" % (name, suffix))
+        if suffix == "valid" and not os.path.exists(arrayPath):
+            return None
+        return np.load(arrayPath, mmap_mode=mmapMode)
+
+    columns = OrderedDict()
+    for name, kind in schema:
+        if kind == "category":
+            categories = _unpackStrings(StringColumn(loadArray(name, "categories.data"),
+                                                     loadArray(name, "categories.offsets"), None))
+            columns[name] = CategoryColumn(loadArray(name, "codes"), categories)
+        elif kind == "string":
+            columns[name] = StringColumn(*[loadArray(name, field) for field in StringColumn._fields])
+        else:
+            columns[name] = IntegerColumn(*[loadArray(name, field) for field in IntegerColumn._fields])
+    return columns
+
+
+def ColumnToList(column):
+    """
+    Converts a column returned by LoadNpyExport() to a list of Python values.
+
+    :param column: [namedtuple] A CategoryColumn, StringColumn or IntegerColumn.
+    :return: [list] The values of the column, unicode strings for category and string columns and ints for integer columns, with None for missing values.
+    """
+    if isinstance(column, CategoryColumn):
+        # Missing values have the code -1, which selects the None appended to the categories.
+        lookup = list(column.categories) + [None]
+        return [lookup[code] for code in column.codes.tolist()]
+    if isinstance(column, StringColumn):
+        return _unpackStrings(column)
+    if isinstance(column, IntegerColumn):
+        values = column.values.tolist()
+        if column.valid is None:
+            return values
+        return [value if isValid else None for value, isValid in zip(values, column.valid.tolist())]
+    raise ValueError("column must be a CategoryColumn, StringColumn or IntegerColumn. Got %s." % type(column))
@@ -4,8 +4,7 @@ This module is designed to compare two documents, or two sets of documents, and
 
 from ..Annotations.Document import Document
 from ..Annotations.MentionLevelAnnotation import MentionLevelAnnotation
-import numpy as np
-from sklearn.metrics import precision_recall_fscore_support
+from ..Utilities.utilities import resolveWorkers, defaultChunkSize, runInPool
 
 
 def classesMatch(annotation1, annotation2, equivalentClasses):
@@ -54,6 +53,147 @@ def attributesMatch(annotation1, annotation2, equivalentAttributes):
         return True
 
 
+class AnnotationIntervalIndex:
+    """
+    A static, centered interval tree built over a list of MentionLevelAnnotation objects. It is used by
+    Comparison.CompareAllAnnotations to find the annotations that may overlap a given annotation without checking every
+    annotation in the other document. Queries return indices into the list used to build the index, in ascending order,
+    so that callers can visit candidates in the same order as a plain loop over the list would.
+
+    The index returns every annotation whose span touches the query span, i.e. start <= queryEnd and end >= queryStart.
+    This is a superset of the annotations that MentionLevelAnnotation.overlap() considers overlapping, so callers must
+    still confirm each candidate using overlap(). It assumes that each annotation's start is not greater than its end.
+
+    :param annotations: [list of objects] The MentionLevelAnnotation objects to index.
+    """
+    def __init__(self, annotations):
+        intervals = [(annotation.start, annotation.end, index) for index, annotation in enumerate(annotations)]
+        self.root = self._buildNode(intervals)
+
+    def _buildNode(self, intervals):
+        if not intervals:
+            return None
+        endpoints = sorted([interval[0] for interval in intervals] + [interval[1] for interval in intervals])
+        center = endpoints[len(endpoints) // 2]
+
+        leftIntervals = []
+        rightIntervals = []
+        centerIntervals = []
+        for interval in intervals:
+            if interval[1] < center:
+                leftIntervals.append(interval)
+            elif interval[0] > center:
+                rightIntervals.append(interval)
+            else:
+                centerIntervals.append(interval)
+
+        node = _IntervalNode(center)
+        node.byStart = sorted(centerIntervals, key=lambda interval: interval[0])
+        node.byEnd = sorted(centerIntervals, key=lambda interval: interval[1], reverse=True)
+        node.left = self._buildNode(leftIntervals)
+        node.right = self._buildNode(rightIntervals)
+        return node
+
+    def query(self, start, end):
+        """
+        Returns the indices of all the indexed annotations whose span touches the span (start, end).
+
+        :param start: [int] The start of the query span.
+        :param end: [int] The end of the query span.
+        :return: [list] A sorted list of integer indices into the list of annotations used to build the index.
+        """
+        indices = []
+        nodes = [self.root]
+        while nodes:
+            node = nodes.pop()
+            if node is None:
+                continue
+            if end < node.center:
+                # Only intervals at this node starting at or before 'end' can touch the query span.
+                for interval in node.byStart:
+                    if interval[0] > end:
+                        break
+                    indices.append(interval[2])
+                nodes.append(node.left)
+            elif start > node.center:
+                # Only intervals at this node ending at or after 'start' can touch the query span.
+                for interval in node.byEnd:
+                    if interval[1] < start:
+                        break
+                    indices.append(interval[2])
+                nodes.append(node.right)
+            else:
+                # The query span contains the center, so it touches every interval stored at this node.
+                indices.extend([interval[2] for interval in node.byStart])
+                nodes.append(node.left)
+                nodes.append(node.right)
+
+        indices.sort()
+        return indices
+
+
+class _IntervalNode:
+    def __init__(self, center):
+        self.center = center
+        self.byStart = []
+        self.byEnd = []
+        self.left = None
+        self.right = None
+
+
+def CandidateIndexer(annotations, matchingAlgorithm="intervalTree", useIntervalIndex=True):
+    """
+    Returns a function that takes an annotation and returns the indices of the entries of 'annotations' that should be
+    checked for overlap with it, in ascending order. Used by Comparison.CompareAllAnnotations and by the Agreement module
+    to find overlapping annotations.
+
+    :param annotations: [list of objects] The MentionLevelAnnotation objects to search.
+    :param matchingAlgorithm: [string] "intervalTree" (default) to index the annotations in an AnnotationIntervalIndex and return only the annotations whose spans touch the span of the queried annotation, or "nestedLoop" to return every index.
+    :param useIntervalIndex: [bool] If False every index is returned even if matchingAlgorithm is "intervalTree". Callers pass False when an annotation has a start greater than its end, which the interval index cannot handle.
+    :return: [function] A function taking a MentionLevelAnnotation and returning a sorted list of integer indices into 'annotations'.
+    """
+    if matchingAlgorithm == "nestedLoop" or not useIntervalIndex:
+        allIndices = range(len(annotations))
+        return lambda annotation: allIndices
+    index = AnnotationIntervalIndex(annotations)
+    return lambda annotation: index.query(annotation.start, annotation.end)
+
+
+def _compareDocumentPairChunk(chunkArguments):
+    """Compares a chunk of document pairs in a worker process. Takes a tuple of the form (documentPairs, equivalentClasses,
+    equivalentAttributes, countNoOverlapAsMatch, matchingAlgorithm) and returns a flat list of Comparison objects in the
+    same order as the pairs."""
+    documentPairs, equivalentClasses, equivalentAttributes, countNoOverlapAsMatch, matchingAlgorithm = chunkArguments
+    comparisons = []
+    for document1, document2 in documentPairs:
+        comparisons.extend(Comparison.CompareAllAnnotations(document1, document2, equivalentClasses, equivalentAttributes,
+                                                            countNoOverlapAsMatch, matchingAlgorithm))
+    return comparisons
+
+
+def _chunkDocumentPairs(documentPairs, chunkSize):
+    """Splits the list of document pairs into consecutive chunks. A chunk holds up to 'chunkSize' pairs but is closed
+    early once it contains about as many annotations as an average chunk would, so that a handful of very long notes do
+    not all end up in the same task while small notes are still grouped together."""
+    totalAnnotations = sum([len(doc1.annotations) + len(doc2.annotations) for doc1, doc2 in documentPairs])
+    numChunks = max(1, (len(documentPairs) + chunkSize - 1) // chunkSize)
+    annotationsPerChunk = max(1, totalAnnotations // numChunks)
+
+    chunks = []
+    currentChunk = []
+    currentAnnotations = 0
+    for documentPair in documentPairs:
+        currentChunk.append(documentPair)
+        currentAnnotations += len(documentPair[0].annotations) + len(documentPair[1].annotations)
+        if len(currentChunk) >= chunkSize or currentAnnotations >= annotationsPerChunk:
+            chunks.append(currentChunk)
+            currentChunk = []
+            currentAnnotations = 0
+    if currentChunk:
+        chunks.append(currentChunk)
+    return chunks
+
+
 ComparisonResults ={
     "1" : "No Overlap",
     "2" : "Class Mismatch",
@@ -91,7 +231,7 @@ class Comparison:
         self.documentName = documentName
 
     @classmethod
-    def CompareAllAnnotations(cls, document1, document2, equivalentClasses=None, equivalentAttributes=None, countNoOverlapAsMatch=None):
+    def CompareAllAnnotations(cls, document1, document2, equivalentClasses=None, equivalentAttributes=None, countNoOverlapAsMatch=None, matchingAlgorithm="nestedLoop"):
         """
         This function compares the annotation objects contained in two Document or ClassifiedDocument instances. It first makes a list of all the annotations in both documents that do not have matches (see the Comparison class doc_string for more information about what constitutes a match). It then reviews those lists to determine which discrepancies are due to class/attribute mismatches and which are due to non-overlapping spans. Finally, it returns a list of all the annotations along with their match or mismatch types as a list of `Comparison` objects.
 
@@ -100,6 +240,7 @@ class Comparison:
         :param equivalentClasses:[None, False, or list of lists] If None (default) this method will only consider annotation to be matching if they have the same 'annotationClass' attribute. If False this method will not consider 'annotationClass' in the annotation comparison. As a third option, the user may include a list of lists, specifying which classes are equivalent and should be considered a match anyway. For example, the user may have produced annotations using the following four classes: 'condition_present', 'condition_likely', 'condition_absent', 'condition_hypothetical'. If 'equivalentClasses' is None, 'condition_present' annotations will only match other 'condition_present' annotations, 'condition_likely' annotations will only math other 'condition_likely' annotations, etc. However, the user may wish to group class labels into meta-classes, so to speak, and consider both 'condition_present' and 'condition_likely' annotations as the same class and 'condition_absent' and 'condition_hypothetical' as the same class. In this case the user would pass the list [['condition_present', 'condition_likely'],['condition_absent', 'condition_hypothetical']] as the value of 'equivalentClasses' and all annotation pairs whose classes are in the same sublist will be considered a match.
         :param equivalentAttributes: [None, False, or dict] Similar to 'equivalentClasses', except due to the fact that annotations can have multiple attributes this attribute is a dictionary whose keys are the attribute name, and whose values are each a list of lists, specifying equivalent attribute values. If None is passed (default) this method will check all attributes for equality. If False, this method will ignore the annotation attributes in the comparison. Currently this method does not allow the user to ignore only a select set of attributes or consider attributes with different keys as equivalent.
         :param countNoOverlapAsMatch: [None, False, or list] This argument specifies how to treat 'No Overlap' comparisons. If None, this function will count 'No Overlap' comparisons as mismatches. If False, this function will ignore all 'No Overlap' and count them all as matches. As a third option the user may specify a list of annotation classes that should be considered a match when present in a 'No Overlap' comparison. For example, even though one annotation method may have missed an annotation, if the other annotation method marked the annotation as 'negative' or 'hypothetical' the user may wish to consider this result a match, since often it is only the detection of positive events that the user is trying to achieve. In this case the user would pass ['negative', 'hypothetical'] as an argument to 'countNoOverlapAsMatch'. For all cases in which a non-overlap is counted as a match this class will use the 'Non-Overlapping Match' ComparisonResult.
+        :param matchingAlgorithm: [string] Specifies how overlapping annotations are found. If "nestedLoop" (default) every annotation in document1 is checked against every annotation in document2. If "intervalTree" the annotations in document2 are first indexed using an :class:`AnnotationIntervalIndex <eHostess.Analysis.DocumentComparison.AnnotationIntervalIndex>` and only the annotations whose spans touch the span of each document1 annotation are checked, which is much faster for documents with many annotations. Both options produce the same comparisons in the same order. If any annotation in either document has a start greater than its end "intervalTree" falls back to "nestedLoop".
         :return: [list] A list of :class:`Comparison <eHostess.Analysis.DocumentComparison.Comparison>` objects detailing the results of the comparison.
         """
         # TODO add option to count no overlap as a match.
@@ -107,6 +248,8 @@ class Comparison:
             raise ValueError("equivalentAttributes must either be 'None', 'False' or a dictionary. Got %s. see the DocumentComparison.CompareAllAnnotations() class method doc_string for more information." % type(equivalentAttributes))
         if not isinstance(equivalentClasses, list) and equivalentClasses != None and equivalentClasses != False:
             raise ValueError("equivalentClasses must either be 'None', 'False' or a list of lists. Got %s. see the DocumentComparison.CompareAllAnnotations() class method doc_string for more information." % type(equivalentAttributes))
+        if matchingAlgorithm != "nestedLoop" and matchingAlgorithm != "intervalTree":
+            raise ValueError("matchingAlgorithm must either be 'nestedLoop' or 'intervalTree'. Got %s." % matchingAlgorithm)
 
         doc1Annotations = document1.annotations
         doc2Annotations = document2.annotations
@@ -116,12 +259,23 @@ class Comparison:
         documentName = document1.documentName
         comparisons = []
 
+        # The interval index assumes well-formed spans, otherwise its candidates may miss annotations that overlap()
+        # would report as overlapping.
+        useIntervalIndex = True
+        for annotation in doc1Annotations + doc2Annotations:
+            if annotation.start > annotation.end:
+                useIntervalIndex = False
+                break
+
+        doc2Candidates = CandidateIndexer(doc2Annotations, matchingAlgorithm, useIntervalIndex)
+
         for index1, annotation1 in enumerate(doc1Annotations):
             if doc1Matches[index1]:
                 continue
-            for index2, annotation2 in enumerate(doc2Annotations):
+            for index2 in doc2Candidates(annotation1):
                 if doc2Matches[index2]:
                     continue
+                annotation2 = doc2Annotations[index2]
 
                 # If there is a match set the corresponding indices in doc*Matches to True and break
                 # Check overlap
@@ -141,13 +295,15 @@ class Comparison:
         doc2Mismatches = [a for index, a in enumerate(doc2Annotations) if not doc2Matches[index]]
 
         processed2 = [False] * len(doc2Annotations)
+        mismatch2Candidates = CandidateIndexer(doc2Mismatches, matchingAlgorithm, useIntervalIndex)
 
         # Now consider all the annotations that did not have a match and determine which type of mismatch they are.
         for index1, annotation1 in enumerate(doc1Mismatches):
             foundOverlap = False
-            for index2, annotation2 in enumerate(doc2Mismatches):
+            for index2 in mismatch2Candidates(annotation1):
                 if processed2[index2]:
                     continue
+                annotation2 = doc2Mismatches[index2]
                 if MentionLevelAnnotation.overlap(annotation1, annotation2):
                     foundOverlap = True
                     processed2[index2] = True
@@ -212,13 +368,22 @@ class Comparison:
 
 
     @classmethod
-    def CompareDocumentBatches(cls, batch1, batch2, equivalentClasses=None, equivalentAttributes=None, countNoOverlapAsMatch=None):
+    def CompareDocumentBatches(cls, batch1, batch2, equivalentClasses=None, equivalentAttributes=None, countNoOverlapAsMatch=None, matchingAlgorithm="nestedLoop", workers=1, chunkSize=None):
         """This method compares the annotations contained in two sets of Documents. This method assumes that batch1 and batch2 contain the same number of documents and that the set of names in both batches is the same and that all names in a given batch are unique. It returns a list of `Comparison` objects.
 
+        The comparison of one pair of documents does not depend on any other pair, so if 'workers' is greater than 1 the document pairs are split into chunks and compared in a pool of worker processes. The comparisons are always returned in the same order as the serial version produces, i.e. sorted by document name and then in the order produced by CompareAllAnnotations. Note that when workers are used the annotations referenced by the returned Comparison objects are copies of the annotations in batch1 and batch2 rather than the original objects.
+
         :param batch1: [list of objects] A list of `Document` objects.
         :param batch2: [list of objects] A second list of `Document` objects.
+        :param equivalentClasses: See :meth:`CompareAllAnnotations <eHostess.Analysis.DocumentComparison.Comparison.CompareAllAnnotations>`.
+        :param equivalentAttributes: See :meth:`CompareAllAnnotations <eHostess.Analysis.DocumentComparison.Comparison.CompareAllAnnotations>`.
+        :param countNoOverlapAsMatch: See :meth:`CompareAllAnnotations <eHostess.Analysis.DocumentComparison.Comparison.CompareAllAnnotations>`.
+        :param matchingAlgorithm: See :meth:`CompareAllAnnotations <eHostess.Analysis.DocumentComparison.Comparison.CompareAllAnnotations>`.
+        :param workers: [int | None] The number of processes used to compare the document pairs. Defaults to 1, which compares the documents in the current process. If None, one process per CPU is used.
+        :param chunkSize: [int | None] The maximum number of document pairs sent to a worker process in a single task. Chunks are also closed early once they contain about an average chunk's share of the annotations. If None (default) the pairs are split into roughly four chunks per worker. Ignored if 'workers' is 1.
         :return: [list] A list of `Comparison` arrays keyed by document name.
         """
+        workers = resolveWorkers(workers, chunkSize)
 
         comparisons = []
 
@@ -238,7 +403,21 @@ class Comparison:
 
                 raise RuntimeError("The batches were not sorted correctly or contain different documents.")
 
-            comparisons.extend(Comparison.CompareAllAnnotations(sorted1[index], sorted2[index], equivalentClasses, equivalentAttributes, countNoOverlapAsMatch))
+        documentPairs = zip(sorted1, sorted2)
+
+        if workers == 1 or len(documentPairs) < 2:
+            for document1, document2 in documentPairs:
+                comparisons.extend(Comparison.CompareAllAnnotations(document1, document2, equivalentClasses, equivalentAttributes, countNoOverlapAsMatch, matchingAlgorithm))
+            return comparisons
+
+        if chunkSize is None:
+            chunkSize = defaultChunkSize(len(documentPairs), workers)
+        chunks = _chunkDocumentPairs(documentPairs, chunkSize)
+        chunkArguments = [(chunk, equivalentClasses, equivalentAttributes, countNoOverlapAsMatch, matchingAlgorithm) for chunk in chunks]
+
+        # The document pairs are already chunked, so each chunk is sent to a worker as a single task.
+        for chunkComparisons in runInPool(_compareDocumentPairChunk, chunkArguments, workers, chunkSize=1):
+            comparisons.extend(chunkComparisons)
 
         return comparisons
 
@@ -267,6 +446,10 @@ class Comparison:
                     print doc.documentName
                 raise RuntimeError("The names of the documents in classifiedDocumentsGoldStandard must be the same as the names in the classifiedDocumentsTestGroup. The names have been printed above for convenience.")
 
+        # numpy and sklearn are slow to import, so they are only imported when metrics are calculated.
+        import numpy as np
+        from sklearn.metrics import precision_recall_fscore_support
+
         agreementVec = np.zeros(len(classifiedDocumentsGoldStandard))
         goldStandardPositiveVec = np.zeros(len(classifiedDocumentsGoldStandard))
         testGroupPositiveVec = np.zeros(len(classifiedDocumentsGoldStandard))
@@ -1,54 +1,341 @@
 """This module is intended to provide functions to consume Comparison objects and calculate arbitrary metrics."""
 
-import numpy as np
-from sklearn.metrics import precision_recall_fscore_support
 from eHostess.Analysis.DocumentComparison import ComparisonResults
+from collections import namedtuple
+from eHostess.Utilities.utilities import resolveWorkers, runInPool
 
-def CalculateRecallPrecisionFScoreAndAgreement(comparisons, goldStandardPosition='first'):
+# Each comparisonResult is encoded as the integer key of its entry in ComparisonResults.
+_resultCodes = dict((resultName, int(resultKey)) for resultKey, resultName in ComparisonResults.items())
+_matchResultCodes = (_resultCodes[ComparisonResults["5"]], _resultCodes[ComparisonResults["6"]])
+
+# Maps each positive annotation class to None, if every annotation of the class is positive, or to a dictionary of the
+# attribute values an annotation of the class must have to be positive.
+defaultPositiveLabels = {
+    "bleeding_present": None,
+    "doc_classification": {"present_or_absent": "present"},
+}
+
+ComparisonArrays = namedtuple('ComparisonArrays', ['resultCodes', 'goldStandardLabels', 'testLabels',
+                                                   'documentIndices', 'documentNames', 'labelNames'])
+MetricsRow = namedtuple('MetricsRow', ['recall', 'precision', 'fscore', 'agreement', 'numComparisons'])
+GroupedMetrics = namedtuple('GroupedMetrics', ['micro', 'macro', 'perClass', 'perDocument'])
+ConfidenceInterval = namedtuple('ConfidenceInterval', ['estimate', 'lower', 'upper'])
+BootstrapIntervals = namedtuple('BootstrapIntervals', ['recall', 'precision', 'fscore', 'agreement'])
+
+# The resamples are drawn in blocks of this many, each block with its own seed, so that the result for a given seed
+# does not depend on the number of workers.
+_bootstrapBlockSize = 100
+
+
+def _labelCode(annotation, positiveLabels, labelCodes):
+    """Returns the code of the positive label the annotation belongs to, or 0 if it is negative or missing."""
+    # Since missing annotations are considered negative results annotations that are None are negative.
+    if annotation is None or annotation.annotationClass not in positiveLabels:
+        return 0
+    requiredAttributes = positiveLabels[annotation.annotationClass]
+    if requiredAttributes:
+        for attributeName, attributeValue in requiredAttributes.iteritems():
+            if annotation.attributes.get(attributeName) != attributeValue:
+                return 0
+    return labelCodes[annotation.annotationClass]
+
+
+def _metricsFromCounts(truePositives, predictedPositives, actualPositives):
+    """
+    Returns (recall, precision, fscore) from counts, which may be numbers or numpy arrays. As in sklearn, a metric whose
+    denominator is 0 is 0 rather than undefined.
+    """
+    import numpy as np
+
+    truePositives = np.asarray(truePositives, dtype=float)
+    predictedPositives = np.asarray(predictedPositives, dtype=float)
+    actualPositives = np.asarray(actualPositives, dtype=float)
+
+    precision = truePositives / np.where(predictedPositives > 0, predictedPositives, 1)
+    recall = truePositives / np.where(actualPositives > 0, actualPositives, 1)
+    denominator = precision + recall
+    fscore = 2 * precision * recall / np.where(denominator > 0, denominator, 1)
+    return recall, precision, fscore
+
+
+def _ratio(numerators, denominators):
+    """Returns numerators / denominators, with 0 wherever the denominator is 0."""
+    import numpy as np
+
+    denominators = np.asarray(denominators, dtype=float)
+    return np.asarray(numerators, dtype=float) / np.where(denominators > 0, denominators, 1)
+
+
+def EncodeComparisons(comparisons, goldStandardPosition='first', positiveLabels=None):
+    """
+    Converts a list of Comparison objects into compact numpy arrays in a single pass over the comparisons, so that metrics can be calculated with vectorized numpy operations rather than by walking the Comparison objects. A missing annotation is encoded as a negative label, as in CalculateRecallPrecisionFScoreAndAgreement().
+
+    :param comparisons: [list of objects] The Comparison objects to encode, e.g. the output of Comparison.CompareDocumentBatches().
+    :param goldStandardPosition: [string] Either 'first' or 'second', indicating whether annotation1 or annotation2 is the gold standard for all comparisons.
+    :param positiveLabels: [dict] Maps each annotation class that is considered a positive result to either None, if every annotation of that class is positive, or a dictionary of the attribute values an annotation of that class must have to be positive. Annotations of any other class are negative. Defaults to defaultPositiveLabels, under which 'bleeding_present' annotations and 'doc_classification' annotations whose 'present_or_absent' attribute is 'present' are positive.
+    :return: [ComparisonArrays] A namedtuple with the fields 'resultCodes', an int8 array holding the integer key of each comparisonResult in DocumentComparison.ComparisonResults, 'goldStandardLabels' and 'testLabels', int8 arrays holding 0 for a negative annotation and otherwise one plus the index of the annotation's class in 'labelNames', 'documentIndices', an int32 array holding the index of each comparison's document in 'documentNames', 'documentNames', the list of document names in the order they first appear, and 'labelNames', the sorted list of positive annotation classes.
+    """
+    if goldStandardPosition == 'first':
+        goldStandardAttribute, testAttribute = 'annotation1', 'annotation2'
+    elif goldStandardPosition == 'second':
+        goldStandardAttribute, testAttribute = 'annotation2', 'annotation1'
+    else:
+        raise ValueError("goldStandardPosition must be either 'first' or 'second'. Got %s." % goldStandardPosition)
+
+    if positiveLabels is None:
+        positiveLabels = defaultPositiveLabels
+    labelNames = sorted(positiveLabels.keys())
+    if len(labelNames) > 127:
+        raise ValueError("positiveLabels may contain at most 127 annotation classes. Got %i." % len(labelNames))
+    labelCodes = dict((labelName, index + 1) for index, labelName in enumerate(labelNames))
+
+    # numpy is slow to import, so it is only imported when metrics are calculated.
+    import numpy as np
+
+    documentNames = []
+    documentIndexMap = {}
+    encoded = []
+    for comparison in comparisons:
+        documentIndex = documentIndexMap.get(comparison.documentName)
+        if documentIndex is None:
+            documentIndex = documentIndexMap[comparison.documentName] = len(documentNames)
+            documentNames.append(comparison.documentName)
+        encoded.append((_resultCodes[comparison.comparisonResult],
+                        _labelCode(getattr(comparison, goldStandardAttribute), positiveLabels, labelCodes),
+                        _labelCode(getattr(comparison, testAttribute), positiveLabels, labelCodes),
+                        documentIndex))
+    encoded = np.array(encoded, dtype=np.int32).reshape(len(encoded), 4)
+
+    return ComparisonArrays(encoded[:, 0].astype(np.int8), encoded[:, 1].astype(np.int8),
+                            encoded[:, 2].astype(np.int8), encoded[:, 3].copy(), documentNames, labelNames)
+
+
+def CalculateMetricsFromArrays(resultCodes, goldStandardLabels, testLabels):
+    """
+    Calculates the recall, precision, F-score and agreement from the arrays returned by EncodeComparisons() using numpy alone. Any non-zero label is treated as positive. The results are the same as those of sklearn's precision_recall_fscore_support() with average='binary'; in particular precision, recall and F-score are 0 rather than undefined when there are no predicted, actual, or correctly predicted positives respectively.
+
+    :param resultCodes: [numpy array] The integer ComparisonResults key of each comparison.
+    :param goldStandardLabels: [numpy array] Non-zero where the gold standard annotation is positive, 0 otherwise.
+    :param testLabels: [numpy array] Non-zero where the test annotation is positive, 0 otherwise.
+    :return: [tuple (float, float, float, float)] A tuple containing the recall, precision, F-Score, (as decimal values) and agreement.
+    """
+    # numpy is slow to import, so it is only imported when metrics are calculated.
+    import numpy as np
+
+    if len(resultCodes) == 0:
+        raise ValueError("At least one comparison is required to calculate metrics.")
+
+    goldStandardLabels = np.asarray(goldStandardLabels, dtype=bool)
+    testLabels = np.asarray(testLabels, dtype=bool)
+    recall, precision, fscore = _metricsFromCounts(np.count_nonzero(goldStandardLabels & testLabels),
+                                                   np.count_nonzero(testLabels), np.count_nonzero(goldStandardLabels))
+    agreement = float(np.count_nonzero(np.in1d(resultCodes, _matchResultCodes))) / len(resultCodes)
+
+    return float(recall), float(precision), float(fscore), agreement
+
+
+def _documentCounts(encoded):
+    """
+    Returns a (numDocuments, 5) array holding the true positives, predicted positives, actual positives, matches and
+    number of comparisons of each document, with every positive class counted as positive.
+    """
+    import numpy as np
+
+    numDocuments = len(encoded.documentNames)
+    documentIndices = encoded.documentIndices
+    goldStandardPositive = encoded.goldStandardLabels > 0
+    testPositive = encoded.testLabels > 0
+    isMatch = np.in1d(encoded.resultCodes, _matchResultCodes)
+    return np.column_stack([np.bincount(documentIndices[goldStandardPositive & testPositive], minlength=numDocuments),
+                            np.bincount(documentIndices[testPositive], minlength=numDocuments),
+                            np.bincount(documentIndices[goldStandardPositive], minlength=numDocuments),
+                            np.bincount(documentIndices[isMatch], minlength=numDocuments),
+                            np.bincount(documentIndices, minlength=numDocuments)])
+
+
+def CalculateGroupedMetrics(comparisons, goldStandardPosition='first', positiveLabels=None):
+    """
+    Calculates micro and macro averaged, per annotation class, and per document metrics from a single pass over 'comparisons'. The comparisons are encoded once with EncodeComparisons() and every table is then computed from the encoded arrays with numpy.
+
+    Each positive annotation class is treated as its own label, as in a multi-class problem: a comparison is a true positive for a class if both annotations belong to that class, and a comparison whose annotations belong to two different positive classes is a false negative for the gold standard class and a false positive for the test class. The micro averaged metrics pool the counts of all classes and the macro averaged metrics are the unweighted means of the per class metrics, as with sklearn's average='micro' and average='macro'. The per class agreement is the fraction of the comparisons in which either annotation belongs to the class that are matches.
+
+    The per document metrics are binary, with every positive class counted as positive, and are the same as the result of calling CalculateRecallPrecisionFScoreAndAgreement() on the comparisons of each document separately.
+
+    :param comparisons: [list of objects] The Comparison objects to evaluate, e.g. the output of Comparison.CompareDocumentBatches().
+    :param goldStandardPosition: [string] Either 'first' or 'second', indicating whether annotation1 or annotation2 is the gold standard for all comparisons.
+    :param positiveLabels: [dict] The positive annotation classes, see EncodeComparisons(). Defaults to defaultPositiveLabels.
+    :return: [GroupedMetrics] A namedtuple with the fields 'micro' and 'macro', each a MetricsRow, and 'perClass' and 'perDocument', dictionaries mapping each positive annotation class and each document name to a MetricsRow. A MetricsRow is a namedtuple of the recall, precision, F-score, agreement and number of comparisons of the group.
+    """
+    # numpy is slow to import, so it is only imported when metrics are calculated.
+    import numpy as np
+
+    encoded = EncodeComparisons(comparisons, goldStandardPosition, positiveLabels)
+    numComparisons = len(encoded.resultCodes)
+    if numComparisons == 0:
+        raise ValueError("At least one comparison is required to calculate metrics.")
+
+    isMatch = np.in1d(encoded.resultCodes, _matchResultCodes)
+    goldStandardLabels = encoded.goldStandardLabels.astype(np.intp)
+    testLabels = encoded.testLabels.astype(np.intp)
+    sameLabel = goldStandardLabels == testLabels
+
+    # Per class counts, indexed by label code. Index 0 holds the negative label and is dropped.
+    numBins = len(encoded.labelNames) + 1
+    truePositives = np.bincount(goldStandardLabels[sameLabel], minlength=numBins)[1:]
+    predictedPositives = np.bincount(testLabels, minlength=numBins)[1:]
+    actualPositives = np.bincount(goldStandardLabels, minlength=numBins)[1:]
+    # Comparisons involving a class are counted once even if both annotations belong to it.
+    involved = np.bincount(goldStandardLabels, minlength=numBins) + np.bincount(testLabels, minlength=numBins) \
+        - np.bincount(goldStandardLabels[sameLabel], minlength=numBins)
+    involvedMatches = np.bincount(goldStandardLabels[isMatch], minlength=numBins) \
+        + np.bincount(testLabels[isMatch], minlength=numBins) \
+        - np.bincount(goldStandardLabels[isMatch & sameLabel], minlength=numBins)
+    involved = involved[1:]
+    classAgreement = _ratio(involvedMatches[1:], involved)
+
+    classRecall, classPrecision, classFScore = _metricsFromCounts(truePositives, predictedPositives, actualPositives)
+    perClass = {}
+    for index, labelName in enumerate(encoded.labelNames):
+        perClass[labelName] = MetricsRow(float(classRecall[index]), float(classPrecision[index]),
+                                         float(classFScore[index]), float(classAgreement[index]), int(involved[index]))
+
+    microRecall, microPrecision, microFScore = _metricsFromCounts(truePositives.sum(), predictedPositives.sum(),
+                                                                  actualPositives.sum())
+    agreement = float(np.count_nonzero(isMatch)) / numComparisons
+    micro = MetricsRow(float(microRecall), float(microPrecision), float(microFScore), agreement, numComparisons)
+    if len(encoded.labelNames):
+        macro = MetricsRow(float(classRecall.mean()), float(classPrecision.mean()), float(classFScore.mean()),
+                           float(classAgreement.mean()), numComparisons)
+    else:
+        macro = MetricsRow(0.0, 0.0, 0.0, 0.0, numComparisons)
+
+    # Per document counts, with every positive class counted as positive.
+    documentCounts = _documentCounts(encoded)
+    documentRecall, documentPrecision, documentFScore = _metricsFromCounts(documentCounts[:, 0], documentCounts[:, 1],
+                                                                           documentCounts[:, 2])
+    documentSizes = documentCounts[:, 4]
+    documentAgreement = _ratio(documentCounts[:, 3], documentSizes)
+    perDocument = {}
+    for index, documentName in enumerate(encoded.documentNames):
+        perDocument[documentName] = MetricsRow(float(documentRecall[index]), float(documentPrecision[index]),
+                                               float(documentFScore[index]), float(documentAgreement[index]),
+                                               int(documentSizes[index]))
+
+    return GroupedMetrics(micro, macro, perClass, perDocument)
+
+
+def CalculateRecallPrecisionFScoreAndAgreement(comparisons, goldStandardPosition='first', backend='numpy', positiveLabels=None):
     """
     This function calculates the recall, precision, F-score, and support of the two annotation groups represented by 'comparisons'. The policy for handling non-overlapping annotations is to consider all missing annotations as a negative test result, regardless of which group they are in.
     :param comparisons:
     :param goldStandardPosition: [string] Indicates which annotation in each comparison is the gold standard. Acceptable values are 'first' or 'second' to indicate that annotation1 or annotation2 should be used as the gold standard for all comparisons respectively.
+    :param backend: [string] Either 'numpy' (default), which encodes the comparisons with EncodeComparisons() and calculates the metrics with CalculateMetricsFromArrays(), or 'sklearn', which calculates them with sklearn's precision_recall_fscore_support(). Both produce the same results, 'numpy' is faster and does not import sklearn.
+    :param positiveLabels: [dict] The annotation classes considered positive, see EncodeComparisons(). All positive classes are treated as a single positive label. Defaults to defaultPositiveLabels.
     :return: [tuple (float, float, float, float)] A tuple containing the recall, precision, F-Score, (as decimal values) and agreement.
     """
+    if backend not in ('numpy', 'sklearn'):
+        raise ValueError("backend must be either 'numpy' or 'sklearn'. Got %s." % backend)
+
+    encoded = EncodeComparisons(comparisons, goldStandardPosition, positiveLabels)
+
+    if backend == 'numpy':
+        return CalculateMetricsFromArrays(encoded.resultCodes, encoded.goldStandardLabels, encoded.testLabels)
 
-    goldStandardResults = np.zeros(len(comparisons))
-    testGroupResults = np.zeros(len(comparisons))
-    agreementVec = np.zeros(len(comparisons))
-
-    for index, comparison in enumerate(comparisons):
-        goldStandardAnnotation = None
-        testAnnotation = None
-        if goldStandardPosition == 'first':
-            goldStandardAnnotation = comparison.annotation1
-            testAnnotation = comparison.annotation2
-        if goldStandardPosition == 'second':
-            goldStandardAnnotation = comparison.annotation2
-            testAnnotation = comparison.annotation1
-
-        # Determine agreement
-        if comparison.comparisonResult == ComparisonResults["5"] or comparison.comparisonResult == ComparisonResults["6"]: #Match
-            agreementVec[index] = 1
-
-        # Since missing annotations are considered negative results no action needs to be taken for annotations that
-        # are None since the np.arrays were initialized with zeros.
-        if goldStandardAnnotation != None:
-            if goldStandardAnnotation.annotationClass == "doc_classification":
-                if goldStandardAnnotation.attributes["present_or_absent"] == "present":
-                    goldStandardResults[index] = 1
-            else:
-                if goldStandardAnnotation.annotationClass == "bleeding_present":
-                    goldStandardResults[index] = 1
-
-        if testAnnotation != None:
-            if testAnnotation.annotationClass == "doc_classification":
-                if testAnnotation.attributes["present_or_absent"] == "present":
-                    testGroupResults[index] = 1
-            else:
-                if testAnnotation.annotationClass == "bleeding_present":
-                    testGroupResults[index] = 1
+    # numpy and sklearn are slow to import, so they are only imported when metrics are calculated.
+    import numpy as np
+    from sklearn.metrics import precision_recall_fscore_support
 
+    if len(encoded.resultCodes) == 0:
+        raise ValueError("At least one comparison is required to calculate metrics.")
+
+    goldStandardResults = (encoded.goldStandardLabels > 0).astype(np.int8)
+    testGroupResults = (encoded.testLabels > 0).astype(np.int8)
     precision, recall, fscore, support = precision_recall_fscore_support(goldStandardResults, testGroupResults, average='binary')
-    agreement = float(np.sum(agreementVec)) / float(len(agreementVec))
+    agreement = float(np.count_nonzero(np.in1d(encoded.resultCodes, _matchResultCodes))) / float(len(encoded.resultCodes))
 
     return recall, precision, fscore, agreement
+
+
+def _bootstrapCounts(documentCounts, numResamples, seed):
+    """
+    Resamples the documents with replacement 'numResamples' times and returns a (numResamples, 5) array of the summed
+    counts of each resample.
+    """
+    import numpy as np
+
+    randomState = np.random.RandomState(seed)
+    numDocuments = len(documentCounts)
+    sampledDocuments = randomState.randint(0, numDocuments, size=(numResamples, numDocuments))
+    # Each resample is summarized by the number of times each document was drawn, so the summed counts of all the
+    # resamples in the block are a single matrix product.
+    sampledDocuments += np.arange(numResamples)[:, np.newaxis] * numDocuments
+    timesDrawn = np.bincount(sampledDocuments.ravel(), minlength=numResamples * numDocuments)
+    return timesDrawn.reshape(numResamples, numDocuments).dot(documentCounts)
+
+
+_workerDocumentCounts = None
+
+
+def _initializeBootstrapWorker(documentCounts):
+    global _workerDocumentCounts
+    _workerDocumentCounts = documentCounts
+
+
+def _bootstrapBlockInWorker(blockArguments):
+    numResamples, seed = blockArguments
+    return _bootstrapCounts(_workerDocumentCounts, numResamples, seed)
+
+
+def BootstrapConfidenceIntervals(comparisons, numResamples=1000, confidenceLevel=0.95, seed=None, goldStandardPosition='first', positiveLabels=None, workers=1, chunkSize=None):
+    """
+    Calculates bootstrap confidence intervals for the recall, precision, F-score and agreement returned by CalculateRecallPrecisionFScoreAndAgreement(). Comparisons from the same document are not independent, so the documents, rather than the individual comparisons, are resampled with replacement. Only documents that appear in 'comparisons' are resampled, so documents with no annotations in either group, which produce no comparisons, do not contribute.
+
+    The comparisons are encoded once and reduced to per document counts, and each resample is then computed from those counts with numpy, so the cost of a resample depends on the number of documents rather than on the number of comparisons. The intervals are calculated with the percentile method. The resamples are drawn in fixed blocks, each seeded from 'seed', so for a given seed the result is the same regardless of 'workers'.
+
+    :param comparisons: [list of objects] The Comparison objects to evaluate, e.g. the output of Comparison.CompareDocumentBatches().
+    :param numResamples: [int] The number of bootstrap resamples to draw.
+    :param confidenceLevel: [float] The confidence level of the intervals, between 0 and 1. Defaults to 0.95.
+    :param seed: [int | None] Seeds the random number generator so that the intervals are reproducible. If None the intervals will differ between calls.
+    :param goldStandardPosition: [string] Either 'first' or 'second', indicating whether annotation1 or annotation2 is the gold standard for all comparisons.
+    :param positiveLabels: [dict] The annotation classes considered positive, see EncodeComparisons(). Defaults to defaultPositiveLabels.
+    :param workers: [int | None] The number of processes used to compute the resamples. Defaults to 1, which computes them in the current process. If None, one process per CPU is used.
+    :param chunkSize: [int | None] The number of blocks of resamples sent to a worker process in a single task. If None (default) the blocks are split into roughly four tasks per worker. Ignored if 'workers' is 1.
+    :return: [BootstrapIntervals] A namedtuple with the fields 'recall', 'precision', 'fscore' and 'agreement', each a ConfidenceInterval namedtuple of the form (estimate, lower, upper), where 'estimate' is the value calculated from all of the comparisons.
+    """
+    workers = resolveWorkers(workers, chunkSize)
+    if numResamples < 1:
+        raise ValueError("numResamples must be a positive integer. Got %s." % numResamples)
+    if not 0 < confidenceLevel < 1:
+        raise ValueError("confidenceLevel must be between 0 and 1. Got %s." % confidenceLevel)
+
+    # numpy is slow to import, so it is only imported when metrics are calculated.
+    import numpy as np
+
+    encoded = EncodeComparisons(comparisons, goldStandardPosition, positiveLabels)
+    estimates = CalculateMetricsFromArrays(encoded.resultCodes, encoded.goldStandardLabels, encoded.testLabels)
+    documentCounts = _documentCounts(encoded).astype(float)
+
+    blockSizes = [_bootstrapBlockSize] * (numResamples // _bootstrapBlockSize)
+    if numResamples % _bootstrapBlockSize:
+        blockSizes.append(numResamples % _bootstrapBlockSize)
+    blockSeeds = np.random.RandomState(seed).randint(0, 2 ** 31 - 1, size=len(blockSizes))
+    blockArguments = zip(blockSizes, blockSeeds)
+
+    if workers == 1 or len(blockArguments) < 2:
+        blockCounts = [_bootstrapCounts(documentCounts, numBlockResamples, blockSeed)
+                       for numBlockResamples, blockSeed in blockArguments]
+    else:
+        blockCounts = runInPool(_bootstrapBlockInWorker, blockArguments, workers, chunkSize, _initializeBootstrapWorker,
+                                (documentCounts,))
+
+    resampledCounts = np.vstack(blockCounts)
+    recall, precision, fscore = _metricsFromCounts(resampledCounts[:, 0], resampledCounts[:, 1], resampledCounts[:, 2])
+    agreement = _ratio(resampledCounts[:, 3], resampledCounts[:, 4])
+
+    tailPercent = (1 - confidenceLevel) / 2 * 100
+    intervals = []
+    for estimate, samples in zip(estimates, [recall, precision, fscore, agreement]):
+        lower, upper = np.percentile(samples, [tailPercent, 100 - tailPercent])
+        intervals.append(ConfidenceInterval(estimate, float(lower), float(upper)))
+
+    return BootstrapIntervals(*intervals)
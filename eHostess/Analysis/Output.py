@@ -4,170 +4,217 @@ The purpose of this module is to produce human-readable output after conducting
 """
 
 from DocumentComparison import ComparisonResults
-import re
-
-def ConvertComparisonsToTSV(comparisons, outputPath):
-    """
-    This function creates a TSV with a summary of the comparisons. Each line in the output file represents one :class:`Comparison <eHostess.Analysis.DocumentComparison.Comparison>` object. Specifically for each annotation comparison it will show the text highlighted by the two annotators or annotation methods, the type of agreement or disagreement, the span of the text, the annotator name, and the document length.
-
-    This method encloses the text fields in quotes, assuming that any software used to parse the TSV file will know to ignore any tabs inside of quotes. It also assumes that the :class:`MentionLevelAnnotation <eHostess.Annotations.MentionLevelAnnotation.MentionLevelAnnotation>` objects contained in the comparisons all have a value for `annotator` and that all values of `annotator` belong to a set of size 2. In other words, there are only two different values for `annotator` and all annotation objects have exactly one of those two values. This function may not output the tsv file correctly if the annotation text contains both tab characters and double quotes.
-
-    :param comparisons: [list of objects | object] A list of :class:`Comparison <eHostess.Analysis.DocumentComparison.Comparison>` objects or a single comparison object to output.
-    :param outputPath: [string] The path specifying where to write the output TSV file.
-    :return: None
-    """
-
-    # Get the names of the annotators for each annotation group.
+import gzip
+
+_headerFormat = "DocumentName\t%s Text\t%s Text\tComparisonResult\tAgreement\t%s\t%s\t%s Additional Info\t%s Additional Info\tSpanStart\tSpanEnd\tDocLength\tLocationPercentage\n"
+_rowFormat = "\t".join(["%s"] * 13) + "\n"
+
+# Separator characters in the annotation text are replaced with four spaces so that they do not break the TSV layout.
+_separators = ("\t", "\n", "\r")
+_separatorTable = dict((ord(separator), u"    ") for separator in _separators)
+
+_noOverlapResults = (ComparisonResults["1"], ComparisonResults["6"])
+_mismatchResults = (ComparisonResults["2"], ComparisonResults["3"])
+
+
+def _quoteText(annotation):
+    """Returns the text of the annotation enclosed in quotes with any separator characters replaced, or '' if there is no annotation."""
+    if not annotation:
+        return ""
+    text = annotation.text
+    if isinstance(text, unicode):
+        text = text.translate(_separatorTable)
+    elif "\t" in text or "\n" in text or "\r" in text:
+        for separator in _separators:
+            text = text.replace(separator, "    ")
+    # Text must be enclosed in quotes in case it contains tab characters.
+    return '"' + text + '"'
+
+
+def _describeAnnotation(annotation):
+    """Returns the class and attributes of the annotation as they are shown for mismatches and non-overlapping annotations."""
+    if annotation.annotationClass == 'doc_classification':
+        return "DOC CLASS: " + str(annotation.attributes)
+    return annotation.annotationClass + str(annotation.attributes)
+
+
+def _comparisonFields(comparison):
+    """Returns the 13 fields of the TSV row for a comparison, or None if the comparisonResult is not recognized."""
+    annotation1 = comparison.annotation1
+    annotation2 = comparison.annotation2
+    comparisonResult = comparison.comparisonResult
+
+    if comparisonResult in _noOverlapResults:
+        firstResult = ""
+        secondResult = ""
+        dynamicProperties1 = None
+        dynamicProperties2 = None
+        if annotation1:
+            firstResult = _describeAnnotation(annotation1)
+            spanAnnotation = annotation1
+            dynamicProperties1 = annotation1.dynamicProperties
+        elif annotation2:
+            secondResult = _describeAnnotation(annotation2)
+            spanAnnotation = annotation2
+            dynamicProperties2 = annotation2.dynamicProperties
+        else:
+            raise RuntimeError("Either the first annotation or the second annotation should be non-null.")
+        matchIndicator = "1" if comparisonResult == ComparisonResults["6"] else "0"
+    elif comparisonResult in _mismatchResults:
+        firstResult = _describeAnnotation(annotation1)
+        secondResult = _describeAnnotation(annotation2)
+        matchIndicator = "0"
+    elif comparisonResult == ComparisonResults["4"]: # Class and attribute mismatch
+        firstResult = "Class: %s,  Attributes: %s" % (annotation1.annotationClass, annotation1.attributes)
+        secondResult = "Class: %s,  Attributes: %s" % (annotation2.annotationClass, annotation2.attributes)
+        matchIndicator = "0"
+    elif comparisonResult == ComparisonResults["5"]: # Match
+        if annotation1.annotationClass == 'doc_classification':
+            firstResult = "DOC CLASS: " + str(annotation1.attributes)
+            secondResult = "DOC CLASS: " + str(annotation2.attributes)
+        else:
+            firstResult = annotation1.annotationClass
+            secondResult = annotation2.annotationClass
+        matchIndicator = "1"
+    else:
+        return None
+
+    if comparisonResult not in _noOverlapResults:
+        spanAnnotation = annotation1
+        dynamicProperties1 = annotation1.dynamicProperties
+        dynamicProperties2 = annotation2.dynamicProperties
+
+    return (comparison.documentName, _quoteText(annotation1), _quoteText(annotation2), comparisonResult, matchIndicator,
+            firstResult, secondResult, dynamicProperties1, dynamicProperties2, spanAnnotation.start, spanAnnotation.end,
+            comparison.docLength, str(float(spanAnnotation.start) / float(comparison.docLength)))
+
+
+def _annotatorNames(comparisons):
+    """Returns the annotator names of the first and second annotation groups."""
     name1 = ''
     name2 = ''
-    foundNames = False
     for comparison in comparisons:
         if name1 != '' and name2 != '':
-            foundNames = True
             break
         if name1 == '' and comparison.annotation1 != None:
             name1 = comparison.annotation1.annotator
         if name2 == '' and comparison.annotation2 != None:
             name2 = comparison.annotation2.annotator
-    if not foundNames:
+    if name1 == '' or name2 == '':
         raise RuntimeError("No names were found for either group of annotations.")
+    return name1, name2
 
-    #Prepare the column headers for the output file.
-    outFile = open(outputPath, 'w')
-    outFile.write("DocumentName\t%s Text\t%s Text\tComparisonResult\tAgreement\t%s\t%s\t%s Additional Info\t%s Additional Info\tSpanStart\tSpanEnd\tDocLength\tLocationPercentage\n" % (name1, name2, name1, name2, name1, name2))
 
-    for comparison in comparisons:
-        documentName = comparison.documentName
-        annotation1 = comparison.annotation1
-        annotation2 = comparison.annotation2
+class ComparisonTSVWriter:
+    """
+    Writes :class:`Comparison <eHostess.Analysis.DocumentComparison.Comparison>` objects to a TSV file in the format described in ConvertComparisonsToTSV(). Rows are collected in memory and written in large blocks, and the file may optionally be gzip compressed. Instances are context managers, so the file is flushed and closed even if writing fails::
 
+        with ComparisonTSVWriter('/path/to/output.tsv', 'annotator1', 'annotator2') as writer:
+            writer.writeComparisons(comparisons)
+
+    Rows containing unicode text are encoded as UTF-8.
+
+    :param outputPath: [string] The path of the TSV file to write.
+    :param name1: [string] The name of the annotator of the first annotation in each comparison, used in the column headers.
+    :param name2: [string] The name of the annotator of the second annotation in each comparison, used in the column headers.
+    :param compression: [None | string] None (default) to write a plain TSV file or "gzip" to write a gzip compressed one.
+    :param bufferSize: [int] The approximate number of bytes collected before they are written to the file.
+    """
+    def __init__(self, outputPath, name1, name2, compression=None, bufferSize=1 << 20):
+        if compression is not None and compression != "gzip":
+            raise ValueError("compression must either be None or 'gzip'. Got %s." % compression)
+        if bufferSize < 1:
+            raise ValueError("bufferSize must be a positive integer. Got %s." % bufferSize)
+        self.outputPath = outputPath
+        self.bufferSize = bufferSize
+        self._pending = []
+        self._pendingBytes = 0
+
+        if compression == "gzip":
+            self._file = gzip.open(outputPath, 'wb')
+        else:
+            self._file = open(outputPath, 'w', bufferSize)
+        self._write(_headerFormat % (name1, name2, name1, name2, name1, name2))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+        return False
+
+    def _write(self, line):
+        if isinstance(line, unicode):
+            line = line.encode('utf-8')
+        self._pending.append(line)
+        self._pendingBytes += len(line)
+        if self._pendingBytes >= self.bufferSize:
+            self.flush()
+
+    def writeComparison(self, comparison):
+        """
+        Adds the row for one comparison. Comparisons whose comparisonResult is not one of the values in ComparisonResults are skipped.
+
+        :param comparison: [object] A :class:`Comparison <eHostess.Analysis.DocumentComparison.Comparison>` object.
+        :return: None
+        """
+        fields = _comparisonFields(comparison)
+        if fields is not None:
+            self._write(_rowFormat % fields)
+
+    def writeComparisons(self, comparisons):
+        """
+        Adds the rows for a list of comparisons, in order.
+
+        :param comparisons: [list of objects] A list of :class:`Comparison <eHostess.Analysis.DocumentComparison.Comparison>` objects.
+        :return: None
+        """
+        for comparison in comparisons:
+            self.writeComparison(comparison)
+
+    def flush(self):
+        """
+        Writes the collected rows to the file.
+
+        :return: None
+        """
+        if self._pending:
+            self._file.write("".join(self._pending))
+            self._pending = []
+            self._pendingBytes = 0
+
+    def close(self):
+        """
+        Writes any remaining rows and closes the file. The rows collected so far are written even if an exception was raised while adding rows.
+
+        :return: None
+        """
+        if self._file is None:
+            return
+        try:
+            self.flush()
+        finally:
+            self._file.close()
+            self._file = None
+
+
+def ConvertComparisonsToTSV(comparisons, outputPath, compression=None, bufferSize=1 << 20):
+    """
+    This function creates a TSV with a summary of the comparisons. Each line in the output file represents one :class:`Comparison <eHostess.Analysis.DocumentComparison.Comparison>` object. Specifically for each annotation comparison it will show the text highlighted by the two annotators or annotation methods, the type of agreement or disagreement, the span of the text, the annotator name, and the document length.
+
+    This method encloses the text fields in quotes, assuming that any software used to parse the TSV file will know to ignore any tabs inside of quotes. It also assumes that the :class:`MentionLevelAnnotation <eHostess.Annotations.MentionLevelAnnotation.MentionLevelAnnotation>` objects contained in the comparisons all have a value for `annotator` and that all values of `annotator` belong to a set of size 2. In other words, there are only two different values for `annotator` and all annotation objects have exactly one of those two values. This function may not output the tsv file correctly if the annotation text contains both tab characters and double quotes.
+
+    The rows are written with a :class:`ComparisonTSVWriter <eHostess.Analysis.Output.ComparisonTSVWriter>`, which may also be used directly to write comparisons as they are produced.
+
+    :param comparisons: [list of objects | object] A list of :class:`Comparison <eHostess.Analysis.DocumentComparison.Comparison>` objects or a single comparison object to output.
+    :param outputPath: [string] The path specifying where to write the output TSV file.
+    :param compression: [None | string] None (default) to write a plain TSV file or "gzip" to write a gzip compressed one.
+    :param bufferSize: [int] The approximate number of bytes collected before they are written to the file.
+    :return: None
+    """
+    name1, name2 = _annotatorNames(comparisons)
+
+    with ComparisonTSVWriter(outputPath, name1, name2, compression, bufferSize) as writer:
+        writer.writeComparisons(comparisons)
 
-        # Text must be enclosed in quotes in case it contains tab characters.
-        firstNameText = ""
-        if annotation1:
-            firstNameText = '"' + annotation1.text + '"'
-        secondNameText = ""
-        if annotation2:
-            secondNameText = '"' + annotation2.text + '"'
-
-        # Remove any separator characters from the text.
-        firstNameText = re.sub("\t|\n|\r", "    ", firstNameText)
-        secondNameText = re.sub("\t|\n|\r", "    ", secondNameText)
-
-        if comparison.comparisonResult == ComparisonResults["1"] or comparison.comparisonResult == ComparisonResults["6"]: # No Overlap Match or Mismatch
-            firstResult = ""
-            secondResult = ""
-
-            spanStart = None
-            spanEnd = None
-            docLength = None
-            dynamicProperties1 = None
-            dynamicProperties2 = None
-
-            if annotation1:
-                if annotation1.annotationClass == 'doc_classification':
-                    firstResult = "DOC CLASS: " + str(annotation1.attributes)
-                else:
-                    firstResult = annotation1.annotationClass + str(annotation1.attributes)
-
-                spanStart = annotation1.start
-                spanEnd = annotation1.end
-                docLength = comparison.docLength
-                dynamicProperties1 = annotation1.dynamicProperties
-
-            elif annotation2:
-                if annotation2.annotationClass == 'doc_classification':
-                    secondResult = "DOC CLASS: " + str(annotation2.attributes)
-                else:
-                    secondResult = annotation2.annotationClass + str(annotation2.attributes)
-
-                spanStart = annotation2.start
-                spanEnd = annotation2.end
-                docLength = comparison.docLength
-                dynamicProperties2 = annotation2.dynamicProperties
-
-            else:
-                raise RuntimeError("Either the first annotation or the second annotation should be non-null.")
-
-            matchIndicator = "0"
-            if comparison.comparisonResult == ComparisonResults["6"]:
-                matchIndicator = "1"
-
-            outFile.write("%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\n" % (documentName, firstNameText, secondNameText, comparison.comparisonResult,
-                                                                    matchIndicator, firstResult,
-                                                                    secondResult, dynamicProperties1, dynamicProperties2, spanStart,
-                                                                    spanEnd, docLength, str(float(spanStart)/float(docLength))))
-            continue
-
-        if comparison.comparisonResult == ComparisonResults["2"]: # Class mismatch
-            firstResult = None
-            secondResult = None
-            if annotation1.annotationClass == 'doc_classification':
-                firstResult = "DOC CLASS: " + str(annotation1.attributes)
-                secondResult = "DOC CLASS: " + str(annotation2.attributes)
-            else:
-                firstResult = annotation1.annotationClass + str(annotation1.attributes)
-                secondResult = annotation2.annotationClass + str(annotation2.attributes)
-            outFile.write("%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\n" % (documentName, firstNameText, secondNameText, comparison.comparisonResult,
-                                                                    "0", firstResult, secondResult,
-                                                                    comparison.annotation1.dynamicProperties,
-                                                                    comparison.annotation2.dynamicProperties,
-                                                                    comparison.annotation1.start,
-                                                                    comparison.annotation1.end,
-                                                                    comparison.docLength, str(float(comparison.annotation1.start)/float(comparison.docLength))))
-            continue
-
-        if comparison.comparisonResult == ComparisonResults["3"]: # Attribute mismatch
-            firstResult = None
-            secondResult = None
-            if annotation1.annotationClass == 'doc_classification':
-                firstResult = "DOC CLASS: " + str(annotation1.attributes)
-                secondResult = "DOC CLASS: " + str(annotation2.attributes)
-            else:
-                firstResult = annotation1.annotationClass + str(annotation1.attributes)
-                secondResult = annotation2.annotationClass + str(annotation2.attributes)
-            outFile.write("%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\n" % (documentName, firstNameText, secondNameText, comparison.comparisonResult,
-                                                                    "0", firstResult, secondResult,
-                                                                    comparison.annotation1.dynamicProperties,
-                                                                    comparison.annotation2.dynamicProperties,
-                                                                    comparison.annotation1.start,
-                                                                    comparison.annotation1.end,
-                                                                    comparison.docLength, str(float(comparison.annotation1.start)/float(comparison.docLength))))
-            continue
-
-        if comparison.comparisonResult == ComparisonResults["4"]: # Class and attribute mismatch
-            firstResult = "Class: %s,  Attributes: %s" % (annotation1.annotationClass,
-                                                          annotation1.attributes)
-            secondResult = "Class: %s,  Attributes: %s" % (annotation2.annotationClass,
-                                                          annotation2.attributes)
-
-            outFile.write("%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\n" % (documentName, firstNameText, secondNameText, comparison.comparisonResult,
-                                                                    "0", firstResult, secondResult,
-                                                                    comparison.annotation1.dynamicProperties,
-                                                                    comparison.annotation2.dynamicProperties,
-                                                                    comparison.annotation1.start,
-                                                                    comparison.annotation1.end,
-                                                                    comparison.docLength, str(float(comparison.annotation1.start)/float(comparison.docLength))))
-            continue
-
-        if comparison.comparisonResult == ComparisonResults["5"]: # Match
-            firstResult = None
-            secondResult = None
-            if annotation1.annotationClass == 'doc_classification':
-                firstResult = "DOC CLASS: " + str(annotation1.attributes)
-                secondResult = "DOC CLASS: " + str(annotation2.attributes)
-            else:
-                firstResult = annotation1.annotationClass
-                secondResult = annotation2.annotationClass
-
-            outFile.write("%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\n" % (documentName, firstNameText, secondNameText, comparison.comparisonResult,
-                                                                    "1", firstResult, secondResult,
-                                                                    comparison.annotation1.dynamicProperties,
-                                                                    comparison.annotation2.dynamicProperties,
-                                                                    comparison.annotation1.start,
-                                                                    comparison.annotation1.end,
-                                                                    comparison.docLength, str(float(comparison.annotation1.start)/float(comparison.docLength))))
-            continue
-
-    outFile.close()
     print "Done writing TSV file to %s" % outputPath
@@ -0,0 +1,64 @@
+"""
+Times Agreement.CalculateAgreement() on synthetic batches from several annotators and, for reference, the time taken to
+compare every pair of batches with Comparison.CompareDocumentBatches(), which is what pairwise agreement previously
+required. Each annotator marks most of the same mentions, with jittered spans and occasional different classes, plus a
+few mentions of their own.
+
+Run from the eHostess directory, in the same way as UnitTests.py:
+
+    python DevelopmentAids/Benchmarks/AgreementBenchmark.py
+"""
+
+from eHostess.Analysis.Agreement import CalculateAgreement
+from eHostess.Analysis.DocumentComparison import Comparison
+from eHostess.Annotations.Document import Document
+from eHostess.Annotations.MentionLevelAnnotation import MentionLevelAnnotation
+import itertools
+import random
+import time
+
+numAnnotators = 5
+numDocuments = 500
+mentionsPerDocument = 40
+annotationClasses = ["bleeding_present", "bleeding_absent", "bleeding_hypothetical"]
+
+
+def buildBatches():
+    """Returns one batch of 'numDocuments' Documents per annotator."""
+    randomGenerator = random.Random(1234)
+    batches = [[] for annotator in range(numAnnotators)]
+    for documentIndex in range(numDocuments):
+        mentions = [(mentionIndex * 100, randomGenerator.choice(annotationClasses)) for mentionIndex in range(mentionsPerDocument)]
+        for annotatorIndex, batch in enumerate(batches):
+            annotations = []
+            for start, annotationClass in mentions:
+                if randomGenerator.random() < 0.1:
+                    continue
+                if randomGenerator.random() < 0.2:
+                    annotationClass = randomGenerator.choice(annotationClasses)
+                start += randomGenerator.randint(0, 5)
+                annotations.append(MentionLevelAnnotation("text", start, start + randomGenerator.randint(5, 20),
+                                                          "annotator%i" % annotatorIndex, "id", {}, annotationClass))
+            batch.append(Document("note%i" % documentIndex, "annotator%i" % annotatorIndex, annotations, 100 * mentionsPerDocument))
+    return batches
+
+
+if __name__ == "__main__":
+    batches = buildBatches()
+
+    startTime = time.time()
+    results = CalculateAgreement(batches)
+    agreementTime = time.time() - startTime
+
+    startTime = time.time()
+    for batch1, batch2 in itertools.combinations(batches, 2):
+        Comparison.CompareDocumentBatches(batch1, batch2, matchingAlgorithm="intervalTree")
+    pairwiseTime = time.time() - startTime
+
+    print "%i annotators, %i documents, %i aligned units." % (numAnnotators, numDocuments, results.numUnits)
+    print "%-52s %10s" % ("Implementation", "Seconds")
+    print "%-52s %10.3f" % ("CompareDocumentBatches for every pair of annotators", pairwiseTime)
+    print "%-52s %10.3f" % ("CalculateAgreement", agreementTime)
+    print "Krippendorff's alpha across all annotators: %.4f" % results.alpha
+    for pair in sorted(results.pairwise.keys()):
+        print "%-28s kappa %.4f  alpha %.4f" % (" / ".join(pair), results.pairwise[pair].kappa, results.pairwise[pair].alpha)
@@ -0,0 +1,79 @@
+"""
+Times Metrics.BootstrapConfidenceIntervals() on a synthetic batch of Comparison objects spread over many documents,
+with one and with several worker processes, and checks that both give the same intervals for the same seed. For
+reference it also times a few resamples computed the straightforward way, by gathering the comparisons of the resampled
+documents and calling CalculateRecallPrecisionFScoreAndAgreement() with the sklearn backend, and extrapolates that time
+to the full number of resamples.
+
+Run from the eHostess directory, in the same way as UnitTests.py:
+
+    python DevelopmentAids/Benchmarks/BootstrapBenchmark.py
+"""
+
+from eHostess.Analysis.DocumentComparison import Comparison, ComparisonResults
+from eHostess.Analysis.Metrics import BootstrapConfidenceIntervals, CalculateRecallPrecisionFScoreAndAgreement
+from eHostess.Annotations.MentionLevelAnnotation import MentionLevelAnnotation
+import random
+import time
+
+numComparisons = 100000
+numDocuments = 2000
+numResamples = 10000
+numReferenceResamples = 10
+workerCounts = [1, 4]
+annotationClasses = ["bleeding_present", "bleeding_absent"]
+
+
+def buildComparisons():
+    """Returns 'numComparisons' Comparison objects with random results and annotation classes."""
+    randomGenerator = random.Random(1234)
+    annotations = [MentionLevelAnnotation("text", 0, 4, "annotator", "id%i" % index, {}, annotationClass)
+                   for index, annotationClass in enumerate(annotationClasses)]
+    comparisons = []
+    for index in range(numComparisons):
+        resultKey = randomGenerator.choice(ComparisonResults.keys())
+        annotation1 = randomGenerator.choice(annotations)
+        annotation2 = None if resultKey in ("1", "6") else randomGenerator.choice(annotations)
+        comparisons.append(Comparison("note%i" % randomGenerator.randint(0, numDocuments - 1),
+                                      ComparisonResults[resultKey], annotation1, annotation2))
+    return comparisons
+
+
+def referenceResamples(comparisons):
+    """Computes 'numReferenceResamples' document level resamples one at a time and returns the time taken."""
+    randomGenerator = random.Random(1234)
+    comparisonsByDocument = {}
+    for comparison in comparisons:
+        comparisonsByDocument.setdefault(comparison.documentName, []).append(comparison)
+    documentNames = comparisonsByDocument.keys()
+
+    startTime = time.time()
+    for resample in range(numReferenceResamples):
+        resampledComparisons = []
+        for index in range(len(documentNames)):
+            resampledComparisons.extend(comparisonsByDocument[randomGenerator.choice(documentNames)])
+        CalculateRecallPrecisionFScoreAndAgreement(resampledComparisons, backend='sklearn')
+    return time.time() - startTime
+
+
+if __name__ == "__main__":
+    comparisons = buildComparisons()
+
+    results = {}
+    timings = []
+    for workers in workerCounts:
+        startTime = time.time()
+        results[workers] = BootstrapConfidenceIntervals(comparisons, numResamples, seed=1234, workers=workers)
+        timings.append(time.time() - startTime)
+    for workers in workerCounts[1:]:
+        if results[workers] != results[workerCounts[0]]:
+            raise RuntimeError("%i workers produced different intervals than %i." % (workers, workerCounts[0]))
+    referenceTime = referenceResamples(comparisons) / numReferenceResamples * numResamples
+
+    print "%i comparisons in %i documents, %i resamples." % (numComparisons, numDocuments, numResamples)
+    print "%-40s %10s" % ("Implementation", "Seconds")
+    print "%-40s %10.1f" % ("One resample at a time (estimated)", referenceTime)
+    for workers, elapsed in zip(workerCounts, timings):
+        print "%-40s %10.3f" % ("BootstrapConfidenceIntervals, %i worker%s" % (workers, "s" if workers > 1 else ""), elapsed)
+    for metricName, interval in zip(results[workerCounts[0]]._fields, results[workerCounts[0]]):
+        print "%-10s %.4f (%.4f, %.4f)" % (metricName, interval.estimate, interval.lower, interval.upper)
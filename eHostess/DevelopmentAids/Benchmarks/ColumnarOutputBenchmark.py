@@ -0,0 +1,113 @@
+"""
+Compares writing a synthetic batch of Comparison objects to a TSV file with Output.ConvertComparisonsToTSV() and reading
+it back with the csv module, with writing it to a columnar export with ColumnarOutput.ExportComparisons() and reading it
+back. The npy format is always timed, both memory-mapped and converted to lists with ColumnToList(), and Parquet and
+Arrow IPC are also timed if pyarrow is installed.
+
+Run from the eHostess directory, in the same way as UnitTests.py:
+
+    python DevelopmentAids/Benchmarks/ColumnarOutputBenchmark.py
+"""
+
+from eHostess.Analysis.DocumentComparison import Comparison, ComparisonResults
+from eHostess.Analysis.Output import ConvertComparisonsToTSV
+from eHostess.Analysis.ColumnarOutput import ExportComparisons, LoadNpyExport, ColumnToList
+from eHostess.Annotations.MentionLevelAnnotation import MentionLevelAnnotation
+import tempfile
+import shutil
+import random
+import time
+import csv
+import sys
+import os
+
+numComparisons = 200000
+texts = ["Patient denies melena", "History of GI bleed", "small hematoma noted on exam", "BRBPR resolved"]
+annotationClasses = ["bleeding_present", "bleeding_absent"]
+
+
+def buildComparisons():
+    """Returns 'numComparisons' Comparison objects with random results, classes and text."""
+    randomGenerator = random.Random(1234)
+    comparisons = []
+    for index in range(numComparisons):
+        resultKey = randomGenerator.choice(sorted(ComparisonResults.keys()))
+        annotations = []
+        for annotator in ["annotator1", "annotator2"]:
+            start = randomGenerator.randint(0, 5000)
+            annotations.append(MentionLevelAnnotation(randomGenerator.choice(texts), start, start + 20, annotator,
+                                                      "id%i" % index, {"certainty": "definite"},
+                                                      randomGenerator.choice(annotationClasses)))
+        if resultKey in ("1", "6"):
+            annotations[randomGenerator.randint(0, 1)] = None
+        comparisons.append(Comparison("note%i" % (index % 1000), ComparisonResults[resultKey], annotations[0],
+                                      annotations[1], docLength=6000))
+    return comparisons
+
+
+def readTSV(path):
+    with open(path, 'rb') as tsvFile:
+        return list(csv.reader(tsvFile, delimiter='\t'))
+
+
+def readNpyToLists(path):
+    return [ColumnToList(column) for column in LoadNpyExport(path).values()]
+
+
+def readArrow(path):
+    import pyarrow as pa
+    return pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
+
+
+def readParquet(path):
+    import pyarrow.parquet as pq
+    return pq.read_table(path)
+
+
+def exportSize(path):
+    """Returns the size in bytes of an export, which for the npy format is a directory."""
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(path, fileName)) for fileName in os.listdir(path))
+
+
+def timeCall(function, *arguments):
+    """Returns the time, in seconds, taken by one call."""
+    startTime = time.time()
+    function(*arguments)
+    return time.time() - startTime
+
+
+if __name__ == "__main__":
+    comparisons = buildComparisons()
+    configurations = [("npy", "npy", LoadNpyExport), ("npy, lists", "npy", readNpyToLists)]
+    try:
+        import pyarrow
+        configurations += [("parquet", "parquet", readParquet), ("arrow", "arrow", readArrow)]
+    except ImportError:
+        print "pyarrow is not installed, only the npy format is timed."
+
+    workingDir = tempfile.mkdtemp()
+    try:
+        tsvPath = os.path.join(workingDir, "comparisons.tsv")
+        # ConvertComparisonsToTSV prints a message when it is done, which is not part of the timing.
+        stdout = sys.stdout
+        sys.stdout = open(os.devnull, 'w')
+        try:
+            rows = [("TSV", timeCall(ConvertComparisonsToTSV, comparisons, tsvPath), timeCall(readTSV, tsvPath),
+                     os.path.getsize(tsvPath))]
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+
+        for label, fileFormat, reader in configurations:
+            path = os.path.join(workingDir, label.replace(", ", "_") + "." + fileFormat)
+            rows.append((label, timeCall(ExportComparisons, comparisons, path, fileFormat), timeCall(reader, path),
+                         exportSize(path)))
+
+        print "%i comparisons." % numComparisons
+        print "%-12s %14s %14s %12s" % ("Format", "Write seconds", "Read seconds", "Bytes")
+        for label, writeTime, readTime, size in rows:
+            print "%-12s %14.3f %14.3f %12i" % (label, writeTime, readTime, size)
+    finally:
+        shutil.rmtree(workingDir)
@@ -0,0 +1,92 @@
+"""
+Measures how long it takes to import each public eHostess module in a fresh interpreter, and lists the heavy third
+party packages (numpy, sklearn, pyarrow, pyConTextNLP, networkx, pymongo, spacy) each import pulls in. Short-lived scripts and
+worker processes pay this cost every time they start, so importing a module should not load packages it only needs
+once it is used.
+
+When the interpreter supports it (Python 3.7 and later) the cumulative time reported by 'python -X importtime' is used.
+Otherwise, as with Python 2.7, the import is timed with time.time() in the fresh interpreter instead.
+
+Run from the eHostess directory, in the same way as UnitTests.py:
+
+    python DevelopmentAids/Benchmarks/ImportTimeBenchmark.py
+"""
+
+import eHostess
+import subprocess
+import json
+import sys
+import os
+
+entryPoints = [
+    "eHostess.eHostInterface.KnowtatorReader",
+    "eHostess.eHostInterface.KnowtatorWriter",
+    "eHostess.Analysis.DocumentComparison",
+    "eHostess.Analysis.Agreement",
+    "eHostess.Analysis.Metrics",
+    "eHostess.Analysis.Output",
+    "eHostess.Analysis.ColumnarOutput",
+    "eHostess.PyConTextInterface.PyConText",
+    "eHostess.PyConTextInterface.SentenceSplitters.PyConTextBuiltinSplitter",
+    "eHostess.PyConTextInterface.SentenceSplitters.TargetSpanSplitter",
+    "eHostess.PyConTextInterface.SentenceSplitters.SpacySplitter",
+    "eHostess.MongoDBInterface.MongoTools",
+    "eHostess.NotePreprocessing.Preprocessor",
+]
+heavyPackages = ["numpy", "sklearn", "pyarrow", "pyConTextNLP", "networkx", "pymongo", "spacy"]
+repeats = 5
+
+supportsImportTime = sys.version_info >= (3, 7)
+
+timingScript = """
+import sys, time, json
+startTime = time.time()
+import %s
+elapsed = time.time() - startTime
+print(json.dumps({"seconds": elapsed, "loaded": [name for name in %r if name in sys.modules]}))
+"""
+
+
+def parseImportTime(stderrOutput, moduleName):
+    """Returns the cumulative import time, in seconds, reported by -X importtime for moduleName."""
+    for line in stderrOutput.splitlines():
+        fields = line.split("|")
+        if len(fields) == 3 and fields[2].strip() == moduleName:
+            return int(fields[1]) / 1e6
+    return None
+
+
+def timeImport(moduleName):
+    """Imports moduleName in a fresh interpreter and returns (seconds, loadedHeavyPackages), or None if it fails."""
+    environment = dict(os.environ)
+    packageParent = os.path.dirname(os.path.dirname(os.path.abspath(eHostess.__file__)))
+    environment["PYTHONPATH"] = os.pathsep.join([packageParent, environment.get("PYTHONPATH", "")])
+
+    command = [sys.executable]
+    if supportsImportTime:
+        command += ["-X", "importtime"]
+    command += ["-c", timingScript % (moduleName, heavyPackages)]
+
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=environment,
+                               universal_newlines=True)
+    stdoutOutput, stderrOutput = process.communicate()
+    if process.returncode != 0:
+        return None
+
+    result = json.loads(stdoutOutput.strip().splitlines()[-1])
+    seconds = result["seconds"]
+    if supportsImportTime:
+        seconds = parseImportTime(stderrOutput, moduleName) or seconds
+    return seconds, result["loaded"]
+
+
+if __name__ == "__main__":
+    print("Timing method: %s" % ("python -X importtime" if supportsImportTime else "time.time() in a fresh interpreter"))
+    print("%-72s %12s  %s" % ("Module", "Milliseconds", "Heavy packages loaded"))
+    for moduleName in entryPoints:
+        timings = [timeImport(moduleName) for repeat in range(repeats)]
+        if None in timings:
+            print("%-72s %12s  %s" % (moduleName, "-", "import failed, is a dependency missing?"))
+            continue
+        bestSeconds = min(seconds for seconds, loaded in timings)
+        print("%-72s %12.1f  %s" % (moduleName, bestSeconds * 1000, ", ".join(timings[0][1]) or "none"))
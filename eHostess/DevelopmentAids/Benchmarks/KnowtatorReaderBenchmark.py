@@ -0,0 +1,97 @@
+"""
+Times KnowtatorReader.parseSingleKnowtatorFile() on synthetic '.knowtator.xml' files containing 10, 1,000 and 100,000
+annotations, each with two attributes, to check that parsing time grows linearly with the number of mentions. If the
+parser scales linearly the time per mention should stay roughly constant as the files get larger.
+
+Run from the eHostess directory, in the same way as UnitTests.py:
+
+    python DevelopmentAids/Benchmarks/KnowtatorReaderBenchmark.py
+"""
+
+from eHostess.eHostInterface.KnowtatorReader import KnowtatorReader
+import tempfile
+import shutil
+import time
+import os
+
+mentionCounts = [10, 1000, 100000]
+parsers = ["tree", "iterparse"]
+
+
+def writeSyntheticKnowtatorFile(directory, numMentions):
+    """Writes a '.knowtator.xml' file with 'numMentions' annotations, and the corresponding note, in the usual eHost
+    directory structure. Returns the path to the '.knowtator.xml' file."""
+    documentName = "synthetic%i" % numMentions
+    savedDir = os.path.join(directory, "saved")
+    corpusDir = os.path.join(directory, "corpus")
+    for path in [savedDir, corpusDir]:
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+    with open(os.path.join(corpusDir, documentName + ".txt"), 'w') as noteFile:
+        noteFile.write("x" * (numMentions * 10 + 10))
+
+    knowtatorPath = os.path.join(savedDir, documentName + ".txt.knowtator.xml")
+    with open(knowtatorPath, 'w') as outFile:
+        outFile.write('<?xml version="1.0" encoding="UTF-8"?>\n<annotations textSource="%s.txt">\n' % documentName)
+        for index in range(numMentions):
+            start = index * 10
+            outFile.write('    <annotation>\n'
+                          '        <mention id="EHOST_Instance_%i" />\n'
+                          '        <annotator id="eHOST_2010">Benchmark</annotator>\n'
+                          '        <span start="%i" end="%i" />\n'
+                          '        <spannedText>xxxxx</spannedText>\n'
+                          '        <creationDate>Thu Jun 22 11:17:39 MDT 2017</creationDate>\n'
+                          '    </annotation>\n' % (index, start, start + 5))
+            outFile.write('    <stringSlotMention id="EHOST_Slot_%i_1">\n'
+                          '        <mentionSlot id="certainty" />\n'
+                          '        <stringSlotMentionValue value="definite" />\n'
+                          '    </stringSlotMention>\n'
+                          '    <stringSlotMention id="EHOST_Slot_%i_2">\n'
+                          '        <mentionSlot id="present_or_absent" />\n'
+                          '        <stringSlotMentionValue value="present" />\n'
+                          '    </stringSlotMention>\n' % (index, index))
+            outFile.write('    <classMention id="EHOST_Instance_%i">\n'
+                          '        <hasSlotMention id="EHOST_Slot_%i_1" />\n'
+                          '        <hasSlotMention id="EHOST_Slot_%i_2" />\n'
+                          '        <mentionClass id="bleeding_present">xxxxx</mentionClass>\n'
+                          '    </classMention>\n' % (index, index, index))
+        outFile.write('</annotations>\n')
+
+    return knowtatorPath
+
+
+def timeParse(knowtatorPath, parser, numMentions):
+    """Returns the best time, in seconds, of several parses. Small files are parsed more times to reduce noise."""
+    repeats = max(1, min(50, 10000 // numMentions))
+    bestTime = None
+    for repeat in range(repeats):
+        startTime = time.time()
+        document = KnowtatorReader.parseSingleKnowtatorFile(knowtatorPath, parser=parser)
+        elapsed = time.time() - startTime
+        if len(document.annotations) != numMentions:
+            raise RuntimeError("Expected %i annotations but parsed %i." % (numMentions, len(document.annotations)))
+        if bestTime is None or elapsed < bestTime:
+            bestTime = elapsed
+    return bestTime
+
+
+if __name__ == "__main__":
+    workingDir = tempfile.mkdtemp()
+    try:
+        paths = {}
+        for numMentions in mentionCounts:
+            paths[numMentions] = writeSyntheticKnowtatorFile(workingDir, numMentions)
+
+        print "%-10s %10s %12s %18s" % ("Parser", "Mentions", "Seconds", "Microsec/Mention")
+        for parser in parsers:
+            perMention = []
+            for numMentions in mentionCounts:
+                seconds = timeParse(paths[numMentions], parser, numMentions)
+                perMention.append(seconds * 1e6 / numMentions)
+                print "%-10s %10i %12.4f %18.2f" % (parser, numMentions, seconds, perMention[-1])
+            # Compare the two largest files, the smallest is dominated by fixed costs like finding the note.
+            print "%s: time per mention at %i mentions is %.2fx the time per mention at %i mentions.\n" % \
+                  (parser, mentionCounts[-1], perMention[-1] / perMention[-2], mentionCounts[-2])
+    finally:
+        shutil.rmtree(workingDir)
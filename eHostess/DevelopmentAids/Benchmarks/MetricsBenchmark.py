@@ -0,0 +1,88 @@
+"""
+Times Metrics.CalculateRecallPrecisionFScoreAndAgreement() on a synthetic batch of Comparison objects. The previous
+implementation, which filled three numpy arrays one comparison at a time and called sklearn, is compared with the numpy
+backend, and the time spent encoding the comparisons with EncodeComparisons() is reported separately from the time
+spent calculating the metrics from the encoded arrays with CalculateMetricsFromArrays(). The results of both
+implementations are checked to be the same.
+
+Run from the eHostess directory, in the same way as UnitTests.py:
+
+    python DevelopmentAids/Benchmarks/MetricsBenchmark.py
+"""
+
+from eHostess.Analysis.DocumentComparison import Comparison, ComparisonResults
+from eHostess.Analysis.Metrics import CalculateRecallPrecisionFScoreAndAgreement, EncodeComparisons, \
+    CalculateMetricsFromArrays
+from eHostess.Annotations.MentionLevelAnnotation import MentionLevelAnnotation
+import numpy as np
+import random
+import time
+
+numComparisons = 200000
+numArrayElements = 5000000
+annotationClasses = ["bleeding_present", "bleeding_absent"]
+
+
+def previousImplementation(comparisons):
+    """The previous implementation of CalculateRecallPrecisionFScoreAndAgreement(), kept here as a reference."""
+    from sklearn.metrics import precision_recall_fscore_support
+
+    goldStandardResults = np.zeros(len(comparisons))
+    testGroupResults = np.zeros(len(comparisons))
+    agreementVec = np.zeros(len(comparisons))
+    for index, comparison in enumerate(comparisons):
+        if comparison.comparisonResult == ComparisonResults["5"] or comparison.comparisonResult == ComparisonResults["6"]:
+            agreementVec[index] = 1
+        if comparison.annotation1 != None and comparison.annotation1.annotationClass == "bleeding_present":
+            goldStandardResults[index] = 1
+        if comparison.annotation2 != None and comparison.annotation2.annotationClass == "bleeding_present":
+            testGroupResults[index] = 1
+    precision, recall, fscore, support = precision_recall_fscore_support(goldStandardResults, testGroupResults, average='binary')
+    return recall, precision, fscore, float(np.sum(agreementVec)) / float(len(agreementVec))
+
+
+def buildComparisons():
+    """Returns 'numComparisons' Comparison objects with random results and annotation classes."""
+    randomGenerator = random.Random(1234)
+    annotations = [MentionLevelAnnotation("text", 0, 4, "annotator", "id%i" % index, {}, annotationClass)
+                   for index, annotationClass in enumerate(annotationClasses)]
+    comparisons = []
+    for index in range(numComparisons):
+        resultKey = randomGenerator.choice(ComparisonResults.keys())
+        annotation1 = randomGenerator.choice(annotations)
+        annotation2 = None if resultKey in ("1", "6") else randomGenerator.choice(annotations)
+        comparisons.append(Comparison("note%i" % (index % 1000), ComparisonResults[resultKey], annotation1, annotation2))
+    return comparisons
+
+
+def timeCall(function, *arguments):
+    """Returns the time, in seconds, taken by one call and the value returned."""
+    startTime = time.time()
+    result = function(*arguments)
+    return time.time() - startTime, result
+
+
+if __name__ == "__main__":
+    comparisons = buildComparisons()
+    previousTime, previousResults = timeCall(previousImplementation, comparisons)
+    numpyTime, numpyResults = timeCall(CalculateRecallPrecisionFScoreAndAgreement, comparisons)
+    encodeTime, encodedComparisons = timeCall(EncodeComparisons, comparisons)
+    metricsTime, metricsResults = timeCall(CalculateMetricsFromArrays, encodedComparisons.resultCodes,
+                                         encodedComparisons.goldStandardLabels, encodedComparisons.testLabels)
+    if not np.allclose(previousResults, numpyResults) or not np.allclose(numpyResults, metricsResults):
+        raise RuntimeError("The two implementations returned different results.")
+
+    randomState = np.random.RandomState(1234)
+    resultCodes = randomState.randint(1, 7, numArrayElements).astype(np.int8)
+    goldStandardLabels = randomState.randint(0, 2, numArrayElements).astype(np.int8)
+    testLabels = randomState.randint(0, 2, numArrayElements).astype(np.int8)
+    arrayTime, arrayResults = timeCall(CalculateMetricsFromArrays, resultCodes, goldStandardLabels, testLabels)
+
+    print "%i comparisons." % numComparisons
+    print "%-48s %12s" % ("Step", "Milliseconds")
+    print "%-48s %12.1f" % ("Previous implementation (loop and sklearn)", previousTime * 1000)
+    print "%-48s %12.1f" % ("numpy backend (encode and calculate)", numpyTime * 1000)
+    print "%-48s %12.1f" % ("  EncodeComparisons()", encodeTime * 1000)
+    print "%-48s %12.1f" % ("  CalculateMetricsFromArrays()", metricsTime * 1000)
+    print "%-48s %12.1f" % ("CalculateMetricsFromArrays(), %i elements" % numArrayElements, arrayTime * 1000)
+    print "Speedup: %.1fx" % (previousTime / numpyTime)
@@ -0,0 +1,254 @@
+"""
+Times Output.ConvertComparisonsToTSV() on a synthetic batch of Comparison objects covering every ComparisonResult, with
+annotation text that contains separator characters, and checks that the TSV it writes is byte-identical to the output
+of the previous implementation, which is kept here as a reference. The gzip compressed output is also timed and checked
+to decompress to the same bytes.
+
+Run from the eHostess directory, in the same way as UnitTests.py:
+
+    python DevelopmentAids/Benchmarks/OutputBenchmark.py
+"""
+
+from eHostess.Analysis.DocumentComparison import Comparison, ComparisonResults
+from eHostess.Analysis.Output import ConvertComparisonsToTSV
+from eHostess.Annotations.MentionLevelAnnotation import MentionLevelAnnotation
+import tempfile
+import shutil
+import random
+import time
+import gzip
+import sys
+import os
+import re
+
+numComparisons = 200000
+texts = ["Patient denies melena", "History of\tGI bleed", "small hematoma\nnoted on exam", "BRBPR\r\nresolved"]
+annotationClasses = ["bleeding_present", "bleeding_absent", "doc_classification"]
+
+
+def previousImplementation(comparisons, outputPath):
+    """The previous implementation of ConvertComparisonsToTSV(), kept here as a reference."""
+
+    # Get the names of the annotators for each annotation group.
+    name1 = ''
+    name2 = ''
+    foundNames = False
+    for comparison in comparisons:
+        if name1 != '' and name2 != '':
+            foundNames = True
+            break
+        if name1 == '' and comparison.annotation1 != None:
+            name1 = comparison.annotation1.annotator
+        if name2 == '' and comparison.annotation2 != None:
+            name2 = comparison.annotation2.annotator
+    if not foundNames:
+        raise RuntimeError("No names were found for either group of annotations.")
+
+    #Prepare the column headers for the output file.
+    outFile = open(outputPath, 'w')
+    outFile.write("DocumentName\t%s Text\t%s Text\tComparisonResult\tAgreement\t%s\t%s\t%s Additional Info\t%s Additional Info\tSpanStart\tSpanEnd\tDocLength\tLocationPercentage\n" % (name1, name2, name1, name2, name1, name2))
+
+    for comparison in comparisons:
+        documentName = comparison.documentName
+        annotation1 = comparison.annotation1
+        annotation2 = comparison.annotation2
+
+
+        # Text must be enclosed in quotes in case it contains tab characters.
+        firstNameText = ""
+        if annotation1:
+            firstNameText = '"' + annotation1.text + '"'
+        secondNameText = ""
+        if annotation2:
+            secondNameText = '"' + annotation2.text + '"'
+
+        # Remove any separator characters from the text.
+        firstNameText = re.sub("\t|\n|\r", "    ", firstNameText)
+        secondNameText = re.sub("\t|\n|\r", "    ", secondNameText)
+
+        if comparison.comparisonResult == ComparisonResults["1"] or comparison.comparisonResult == ComparisonResults["6"]: # No Overlap Match or Mismatch
+            firstResult = ""
+            secondResult = ""
+
+            spanStart = None
+            spanEnd = None
+            docLength = None
+            dynamicProperties1 = None
+            dynamicProperties2 = None
+
+            if annotation1:
+                if annotation1.annotationClass == 'doc_classification':
+                    firstResult = "DOC CLASS: " + str(annotation1.attributes)
+                else:
+                    firstResult = annotation1.annotationClass + str(annotation1.attributes)
+
+                spanStart = annotation1.start
+                spanEnd = annotation1.end
+                docLength = comparison.docLength
+                dynamicProperties1 = annotation1.dynamicProperties
+
+            elif annotation2:
+                if annotation2.annotationClass == 'doc_classification':
+                    secondResult = "DOC CLASS: " + str(annotation2.attributes)
+                else:
+                    secondResult = annotation2.annotationClass + str(annotation2.attributes)
+
+                spanStart = annotation2.start
+                spanEnd = annotation2.end
+                docLength = comparison.docLength
+                dynamicProperties2 = annotation2.dynamicProperties
+
+            else:
+                raise RuntimeError("Either the first annotation or the second annotation should be non-null.")
+
+            matchIndicator = "0"
+            if comparison.comparisonResult == ComparisonResults["6"]:
+                matchIndicator = "1"
+
+            outFile.write("%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\n" % (documentName, firstNameText, secondNameText, comparison.comparisonResult,
+                                                                    matchIndicator, firstResult,
+                                                                    secondResult, dynamicProperties1, dynamicProperties2, spanStart,
+                                                                    spanEnd, docLength, str(float(spanStart)/float(docLength))))
+            continue
+
+        if comparison.comparisonResult == ComparisonResults["2"]: # Class mismatch
+            firstResult = None
+            secondResult = None
+            if annotation1.annotationClass == 'doc_classification':
+                firstResult = "DOC CLASS: " + str(annotation1.attributes)
+                secondResult = "DOC CLASS: " + str(annotation2.attributes)
+            else:
+                firstResult = annotation1.annotationClass + str(annotation1.attributes)
+                secondResult = annotation2.annotationClass + str(annotation2.attributes)
+            outFile.write("%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\n" % (documentName, firstNameText, secondNameText, comparison.comparisonResult,
+                                                                    "0", firstResult, secondResult,
+                                                                    comparison.annotation1.dynamicProperties,
+                                                                    comparison.annotation2.dynamicProperties,
+                                                                    comparison.annotation1.start,
+                                                                    comparison.annotation1.end,
+                                                                    comparison.docLength, str(float(comparison.annotation1.start)/float(comparison.docLength))))
+            continue
+
+        if comparison.comparisonResult == ComparisonResults["3"]: # Attribute mismatch
+            firstResult = None
+            secondResult = None
+            if annotation1.annotationClass == 'doc_classification':
+                firstResult = "DOC CLASS: " + str(annotation1.attributes)
+                secondResult = "DOC CLASS: " + str(annotation2.attributes)
+            else:
+                firstResult = annotation1.annotationClass + str(annotation1.attributes)
+                secondResult = annotation2.annotationClass + str(annotation2.attributes)
+            outFile.write("%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\n" % (documentName, firstNameText, secondNameText, comparison.comparisonResult,
+                                                                    "0", firstResult, secondResult,
+                                                                    comparison.annotation1.dynamicProperties,
+                                                                    comparison.annotation2.dynamicProperties,
+                                                                    comparison.annotation1.start,
+                                                                    comparison.annotation1.end,
+                                                                    comparison.docLength, str(float(comparison.annotation1.start)/float(comparison.docLength))))
+            continue
+
+        if comparison.comparisonResult == ComparisonResults["4"]: # Class and attribute mismatch
+            firstResult = "Class: %s,  Attributes: %s" % (annotation1.annotationClass,
+                                                          annotation1.attributes)
+            secondResult = "Class: %s,  Attributes: %s" % (annotation2.annotationClass,
+                                                          annotation2.attributes)
+
+            outFile.write("%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\n" % (documentName, firstNameText, secondNameText, comparison.comparisonResult,
+                                                                    "0", firstResult, secondResult,
+                                                                    comparison.annotation1.dynamicProperties,
+                                                                    comparison.annotation2.dynamicProperties,
+                                                                    comparison.annotation1.start,
+                                                                    comparison.annotation1.end,
+                                                                    comparison.docLength, str(float(comparison.annotation1.start)/float(comparison.docLength))))
+            continue
+
+        if comparison.comparisonResult == ComparisonResults["5"]: # Match
+            firstResult = None
+            secondResult = None
+            if annotation1.annotationClass == 'doc_classification':
+                firstResult = "DOC CLASS: " + str(annotation1.attributes)
+                secondResult = "DOC CLASS: " + str(annotation2.attributes)
+            else:
+                firstResult = annotation1.annotationClass
+                secondResult = annotation2.annotationClass
+
+            outFile.write("%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\n" % (documentName, firstNameText, secondNameText, comparison.comparisonResult,
+                                                                    "1", firstResult, secondResult,
+                                                                    comparison.annotation1.dynamicProperties,
+                                                                    comparison.annotation2.dynamicProperties,
+                                                                    comparison.annotation1.start,
+                                                                    comparison.annotation1.end,
+                                                                    comparison.docLength, str(float(comparison.annotation1.start)/float(comparison.docLength))))
+            continue
+
+    outFile.close()
+
+
+def buildComparisons():
+    """Returns 'numComparisons' Comparison objects with random results, classes, attributes and text."""
+    randomGenerator = random.Random(1234)
+    comparisons = []
+    for index in range(numComparisons):
+        resultKey = randomGenerator.choice(sorted(ComparisonResults.keys()))
+        annotations = []
+        for annotator in ["annotator1", "annotator2"]:
+            start = randomGenerator.randint(0, 5000)
+            attributes = {"certainty": randomGenerator.choice(["definite", "possible"])}
+            annotationClass = randomGenerator.choice(annotationClasses)
+            if annotationClass == "doc_classification":
+                attributes["present_or_absent"] = randomGenerator.choice(["present", "absent"])
+            annotations.append(MentionLevelAnnotation(randomGenerator.choice(texts), start, start + 20, annotator,
+                                                      "id%i" % index, attributes, annotationClass))
+        if resultKey in ("1", "6"):
+            annotations[randomGenerator.randint(0, 1)] = None
+        comparisons.append(Comparison("note%i" % (index % 1000), ComparisonResults[resultKey], annotations[0],
+                                      annotations[1], docLength=6000))
+    return comparisons
+
+
+def timeCall(function, *arguments):
+    """Returns the time, in seconds, taken by one call."""
+    startTime = time.time()
+    function(*arguments)
+    return time.time() - startTime
+
+
+if __name__ == "__main__":
+    comparisons = buildComparisons()
+    workingDir = tempfile.mkdtemp()
+    try:
+        previousPath = os.path.join(workingDir, "previous.tsv")
+        currentPath = os.path.join(workingDir, "current.tsv")
+        gzipPath = os.path.join(workingDir, "current.tsv.gz")
+
+        # ConvertComparisonsToTSV prints a message when it is done, which is not part of the timing.
+        stdout = sys.stdout
+        sys.stdout = open(os.devnull, 'w')
+        try:
+            previousTime = timeCall(previousImplementation, comparisons, previousPath)
+            currentTime = timeCall(ConvertComparisonsToTSV, comparisons, currentPath)
+            gzipTime = timeCall(ConvertComparisonsToTSV, comparisons, gzipPath, "gzip")
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+
+        with open(previousPath, 'rb') as previousFile:
+            previousBytes = previousFile.read()
+        with open(currentPath, 'rb') as currentFile:
+            currentBytes = currentFile.read()
+        gzipFile = gzip.open(gzipPath, 'rb')
+        try:
+            gzipBytes = gzipFile.read()
+        finally:
+            gzipFile.close()
+        if currentBytes != previousBytes or gzipBytes != previousBytes:
+            raise RuntimeError("The output is not byte-identical to the previous implementation.")
+
+        print "%i comparisons, %i bytes of TSV." % (numComparisons, len(currentBytes))
+        print "%-36s %10s %12s" % ("Implementation", "Seconds", "Bytes")
+        print "%-36s %10.3f %12i" % ("Previous implementation", previousTime, os.path.getsize(previousPath))
+        print "%-36s %10.3f %12i" % ("ConvertComparisonsToTSV", currentTime, os.path.getsize(currentPath))
+        print "%-36s %10.3f %12i" % ("ConvertComparisonsToTSV, gzip", gzipTime, os.path.getsize(gzipPath))
+        print "Speedup: %.1fx" % (previousTime / currentTime)
+    finally:
+        shutil.rmtree(workingDir)
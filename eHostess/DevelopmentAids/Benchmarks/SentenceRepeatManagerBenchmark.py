@@ -0,0 +1,78 @@
+"""
+Times SentenceRepeatManager.determineSpan() on a synthetic 500-sentence note in which most sentences are copies of a
+small set of templates, as happens with copied-forward clinical text. The current implementation is compared with the
+previous one, which kept the sentences in a list and compiled a regular expression for every call, and the spans
+returned by both are checked to be identical.
+
+Run from the eHostess directory, in the same way as UnitTests.py:
+
+    python DevelopmentAids/Benchmarks/SentenceRepeatManagerBenchmark.py
+"""
+
+from eHostess.PyConTextInterface.SentenceRepeatManager import SentenceRepeatManager, RepeatManagerSentence
+import random
+import time
+import re
+
+numSentences = 500
+numTemplates = 20
+numUniqueSentences = 100
+repeats = 20
+
+
+class ListSentenceRepeatManager(SentenceRepeatManager):
+    """The previous implementation of determineSpan(), kept here as a reference."""
+    def __init__(self, noteText):
+        SentenceRepeatManager.__init__(self, noteText)
+        self.sentences = []
+
+    def determineSpan(self, sentence):
+        foundSentence = None
+        for storedSentence in self.sentences:
+            if storedSentence.text == sentence:
+                foundSentence = storedSentence
+                break
+        if not foundSentence:
+            foundSentence = RepeatManagerSentence(sentence)
+            self.sentences.append(foundSentence)
+        regex = re.compile(re.escape(sentence))
+        match = regex.search(self.noteText, foundSentence.endOfLastSearch)
+        foundSentence.endOfLastSearch = match.end()
+        return (match.start(), match.end())
+
+
+def buildNote():
+    """Returns the list of sentences and the note text. Most sentences repeat one of a few templates, the rest are unique."""
+    randomGenerator = random.Random(1234)
+    templates = ["Patient denies melena or hematochezia, template sentence %i." % index for index in range(numTemplates)]
+    sentences = [randomGenerator.choice(templates) for index in range(numSentences - numUniqueSentences)]
+    for index in range(numUniqueSentences):
+        sentences.insert(randomGenerator.randint(0, len(sentences)), "Vitals recorded at %i:00 were stable (#%i)." % (index % 24, index))
+    return sentences, " ".join(sentences)
+
+
+def timeManager(managerClass, sentences, noteText):
+    """Returns the best time, in seconds, to find every sentence, and the spans found."""
+    bestTime = None
+    for repeat in range(repeats):
+        startTime = time.time()
+        manager = managerClass(noteText)
+        spans = [manager.determineSpan(sentence) for sentence in sentences]
+        elapsed = time.time() - startTime
+        if bestTime is None or elapsed < bestTime:
+            bestTime = elapsed
+    return bestTime, spans
+
+
+if __name__ == "__main__":
+    sentences, noteText = buildNote()
+    listTime, listSpans = timeManager(ListSentenceRepeatManager, sentences, noteText)
+    dictTime, dictSpans = timeManager(SentenceRepeatManager, sentences, noteText)
+    if listSpans != dictSpans:
+        raise RuntimeError("The two implementations returned different spans.")
+
+    print "%i sentences, %i distinct, %i characters." % (len(sentences), len(set(sentences)), len(noteText))
+    print "%-22s %12s" % ("Implementation", "Milliseconds")
+    print "%-22s %12.3f" % ("List and regex", listTime * 1000)
+    print "%-22s %12.3f" % ("Dict and str.find", dictTime * 1000)
+    print "Speedup: %.1fx" % (listTime / dictTime)
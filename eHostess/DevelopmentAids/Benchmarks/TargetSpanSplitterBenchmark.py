@@ -0,0 +1,69 @@
+"""
+Times TargetSpanSplitter.splitSentencesMultipleDocuments() on a synthetic corpus using the default targets in
+PyConTextInterface/TargetsAndModifiers. Half of the notes contain a few target terms and the rest contain none, which
+is typical of a corpus that has not been filtered by keyword. Each scanMode, with one and with several worker processes,
+is timed and checked to produce the same sentences.
+
+Run from the eHostess directory, in the same way as UnitTests.py:
+
+    python DevelopmentAids/Benchmarks/TargetSpanSplitterBenchmark.py
+"""
+
+from eHostess.PyConTextInterface.SentenceSplitters.TargetSpanSplitter import splitSentencesMultipleDocuments
+from eHostess.PyConTextInterface.PyConText import defaultTargetFilePath, loadRules
+import tempfile
+import shutil
+import random
+import time
+import os
+
+numDocuments = 200
+wordsPerDocument = 2000
+# Tuples of the form (scanMode, workers).
+configurations = [("perTarget", 1), ("prefilter", 1), ("prefilter", 4)]
+
+fillerWords = ("the patient was seen today in no acute distress and vitals were stable overnight on the floor with "
+               "plan to continue current medications and follow up in clinic").split()
+targetPhrases = ["history of gi bleed, with", "small hematoma noted", "denies any brbpr", "mild epistaxis overnight"]
+
+
+def writeSyntheticCorpus(directory):
+    """Writes 'numDocuments' notes to directory. Every other note contains a few target phrases."""
+    randomGenerator = random.Random(1234)
+    for index in range(numDocuments):
+        words = [randomGenerator.choice(fillerWords) for wordIndex in range(wordsPerDocument)]
+        if index % 2 == 0:
+            for phrase in randomGenerator.sample(targetPhrases, 2):
+                words.insert(randomGenerator.randint(0, len(words)), phrase)
+        with open(os.path.join(directory, "note%i.txt" % index), 'w') as noteFile:
+            noteFile.write(" ".join(words))
+
+
+def summarize(pyConTextInput):
+    return sorted((key, [(sentence.text, sentence.documentSpan) for sentence in pyConTextInput[key]]
+                   if isinstance(pyConTextInput[key], list) else None) for key in pyConTextInput.keys())
+
+
+if __name__ == "__main__":
+    workingDir = tempfile.mkdtemp()
+    try:
+        writeSyntheticCorpus(workingDir)
+        targets = loadRules(defaultTargetFilePath)
+
+        results = {}
+        timings = []
+        for scanMode, workers in configurations:
+            startTime = time.time()
+            results[(scanMode, workers)] = summarize(splitSentencesMultipleDocuments(workingDir, targets, 4, 4,
+                                                                                     scanMode=scanMode, workers=workers))
+            timings.append(time.time() - startTime)
+
+        print "%-12s %8s %10s %14s" % ("scanMode", "Workers", "Seconds", "Docs/Second")
+        for (scanMode, workers), elapsed in zip(configurations, timings):
+            print "%-12s %8i %10.3f %14.1f" % (scanMode, workers, elapsed, numDocuments / elapsed)
+
+        for configuration in configurations[1:]:
+            if results[configuration] != results[configurations[0]]:
+                raise RuntimeError("%s produced different sentences than %s." % (configuration, configurations[0]))
+    finally:
+        shutil.rmtree(workingDir)
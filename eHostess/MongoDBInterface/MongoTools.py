@@ -2,8 +2,7 @@
 This module contains several functions that allow the user to read and write annotation documents using a MongoDB backing store. I recommend creating a unique index in whichever collection will hold the annotation documents to ensure that no two documents have the same combination of document name, annotator name, and annotation round.
 """
 
-from pymongo import MongoClient
-import pymongo.errors
+# pymongo is imported by the functions that connect to the database, so that importing this module is cheap.
 from ..Annotations.MentionLevelAnnotation import MentionLevelAnnotation
 from ..Annotations.Document import Document
 
@@ -69,6 +68,7 @@ def InsertSingleDocument(document, annotationRound, database='NLP', collection="
     :param port: [string] The port on which the MongoDB server is listening. Defaults to 27017.
     :return: [object] An instance of pymongo.results.InsertOneResult, the default object returned by MongoDB following an "insert_one" operation.
     """
+    from pymongo import MongoClient
     client = MongoClient('mongodb://%s:%s/' % (host, port))
     collection = client[database][collection]
 
@@ -97,12 +97,14 @@ def InsertMultipleDocuments(documents, annotationRound, database='NLP', collecti
     for document in documents:
         mongoDocuments.append(constructMongoDocument(document))
 
+    from pymongo import MongoClient
+    from pymongo.errors import BulkWriteError
     client = MongoClient('mongodb://%s:%s/' % (host, port))
     collection = client[database][collection]
     result = None
     try:
         result = collection.insert_many(mongoDocuments)
-    except pymongo.errors.BulkWriteError as bulkError:
+    except BulkWriteError as bulkError:
         print "A bulk write exception occured:"
         print bulkError.details
         exit(1)
@@ -123,6 +125,7 @@ def FindOneDocument(queryDocument, database='NLP', collection="Annotations", hos
     :return: [object | None] A single Document object if the query matches any documents, otherwise None.
     """
 
+    from pymongo import MongoClient
     client = MongoClient('mongodb://%s:%s/' % (host, port))
     collection = client[database][collection]
 
@@ -143,6 +146,7 @@ def FindMultipleDocuments(queryDocument, database='NLP', collection="Annotations
     :return: [list of objects | None] A list of Document objects, or None if queryDocument does not match any documents in the backing store.
     """
 
+    from pymongo import MongoClient
     client = MongoClient('mongodb://%s:%s/' % (host, port))
     collection = client[database][collection]
 
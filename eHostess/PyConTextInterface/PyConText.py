@@ -11,13 +11,14 @@ to all the annotations it creates.
 
 """
 
-from pyConTextNLP import pyConTextGraph as pyConText
-import pyConTextNLP.itemData as itemData
 from ..Annotations.MentionLevelAnnotation import MentionLevelAnnotation
 from ..Annotations.Document import Document
 from .SentenceSplitters.PyConTextInput import DocumentPlaceholder
+from .SentenceResultCache import hashRules
+from ..Utilities.utilities import resolveWorkers, runInPool
 import re
 import os
+import threading
 from collections import namedtuple
 
 
@@ -31,109 +32,199 @@ defaultModifiersFilePath = os.path.dirname(__file__) + '/TargetsAndModifiers/mod
 
 AnnotationTrio = namedtuple('AnnotationTrio', ['node', 'sentence', 'annotation'])
 
-def _annotateSentences(sentenceList, targets, modifiers, modifierToClassMap, annotationGroup):
-    """Takes a list of sentence objects that all belong to the same document and returns a list of tuples, all of the form (<PyConText Node>, <Sentence Object>, <MentionLevelAnnotation>). If isinstance(sentenceList, DocumentPlaceholder) this function returns an empty list. Similarly, if no annotations are produced by processing the sentences, this function returns an empty list."""
+# Loaded itemData objects keyed by absolute file path. Each value is a tuple of the form (mtime, size, itemData).
+_ruleCache = {}
+_ruleCacheLock = threading.Lock()
+
+def loadRules(filePath, useCache=True):
+    """
+    Returns the pyConTextNLP itemData object for the targets or modifiers TSV file at filePath. Loaded rule sets are
+    cached by absolute path, so repeated calls with an unchanged file return the same itemData object without
+    re-reading it. A file is read again if its modification time or size has changed since it was cached. URLs, which
+    itemData.instantiateFromCSVtoitemData() also accepts, cannot be checked for changes and are never cached.
+
+    :param filePath: [string] The path to a pyConText targets or modifiers TSV file.
+    :param useCache: [bool] If False the file is always read and the cache is neither consulted nor updated.
+    :return: [object] The itemData instance produced by itemData.instantiateFromCSVtoitemData().
+    """
+    # pyConTextNLP, and the networkx and numpy packages it depends on, are only imported once they are needed.
+    import pyConTextNLP.itemData as itemData
+
+    if not useCache or not os.path.isfile(filePath):
+        return itemData.instantiateFromCSVtoitemData(filePath)
+
+    cacheKey = os.path.abspath(filePath)
+    fileStat = os.stat(cacheKey)
+    with _ruleCacheLock:
+        cached = _ruleCache.get(cacheKey)
+        if cached and cached[0] == fileStat.st_mtime and cached[1] == fileStat.st_size:
+            return cached[2]
+
+    rules = itemData.instantiateFromCSVtoitemData(filePath)
+    with _ruleCacheLock:
+        _ruleCache[cacheKey] = (fileStat.st_mtime, fileStat.st_size, rules)
+    return rules
+
+def clearRuleCache(filePath=None):
+    """
+    Removes rule sets loaded by loadRules() from the cache, forcing them to be read again on the next call.
+
+    :param filePath: [string] The path of the file to remove from the cache. If None (default) the whole cache is cleared.
+    :return: None
+    """
+    with _ruleCacheLock:
+        if filePath is None:
+            _ruleCache.clear()
+        else:
+            _ruleCache.pop(os.path.abspath(filePath), None)
+
+def _markupSentence(text, targets, modifiers, pyConText):
+    """Runs the pyConText markup pipeline on the text of a single sentence and returns a tuple of the form (<markup result>, <target nodes>). The markup result is a list with one tuple per target node, of the form (targetPhrase, modifierPhrases, isNegated, isAffirmed), and the target nodes are the corresponding pyConText nodes. 'pyConText' is the pyConTextNLP.pyConTextGraph module, which the caller imports once for all of its sentences."""
+    markup = pyConText.ConTextMarkup()
+    markup.setRawText(text)
+    markup.cleanText()
+    markup.markItems(modifiers, mode="modifier")
+    markup.markItems(targets, mode="target")
+    markup.pruneMarks()
+    markup.applyModifiers()
+    markup.pruneSelfModifyingRelationships()
+    markup.dropInactiveModifiers()
+
+    result = []
+    targetNodes = []
+    for node in markup.nodes():
+        if node.getCategory()[0] == 'target':
+            predecessorPhrases = [predecessor.getPhrase() for predecessor in markup.predecessors(node)]
+            result.append((node.getPhrase(), predecessorPhrases, markup.isModifiedByCategory(node, "NEGATED_EXISTENCE"),
+                           markup.isModifiedByCategory(node, "AFFIRMED_EXISTENCE")))
+            targetNodes.append(node)
+    return result, targetNodes
+
+def _hashRuleSets(targets, modifiers, sentenceCache):
+    """Returns the tuple (targetsHash, modifiersHash) used to key the sentenceCache, or None if there is no cache. Hashing a rule set reads every item in it, so this is called once per batch rather than once per document."""
+    if sentenceCache is None:
+        return None
+    return hashRules(targets), hashRules(modifiers)
+
+def _annotateSentences(sentenceList, targets, modifiers, modifierToClassMap, annotationGroup, sentenceCache=None, ruleHashes=None):
+    """Takes a list of sentence objects that all belong to the same document and returns a list of tuples, all of the form (<PyConText Node>, <Sentence Object>, <MentionLevelAnnotation>). If isinstance(sentenceList, DocumentPlaceholder) this function returns an empty list. Similarly, if no annotations are produced by processing the sentences, this function returns an empty list. If a SentenceResultCache is supplied the markup of sentences whose text has been seen before with the same rules is taken from the cache, and the node of the tuples produced from a cached result is None. 'ruleHashes' is the value returned by _hashRuleSets() for the same targets, modifiers and cache; it is computed here if it is not supplied."""
     annotationTrioTuples = []
 
     if isinstance(sentenceList, DocumentPlaceholder):
         return annotationTrioTuples
 
+    if sentenceCache is not None:
+        if ruleHashes is None:
+            ruleHashes = _hashRuleSets(targets, modifiers, sentenceCache)
+        targetsHash, modifiersHash = ruleHashes
+
+    # pyConTextNLP is only imported once it is needed, and here rather than in _markupSentence() so that the import
+    # statement does not run for every sentence.
+    from pyConTextNLP import pyConTextGraph as pyConText
+
     for sentence in sentenceList:
 
-        markup = pyConText.ConTextMarkup()
-        markup.setRawText(sentence.text)
-        markup.cleanText()
-        markup.markItems(modifiers, mode="modifier")
-        markup.markItems(targets, mode="target")
-        markup.pruneMarks()
-        markup.applyModifiers()
-        markup.pruneSelfModifyingRelationships()
-        markup.dropInactiveModifiers()
+        markupResult = None
+        if sentenceCache is not None:
+            markupResult = sentenceCache.get(sentence.text, targetsHash, modifiersHash)
+        if markupResult is None:
+            markupResult, targetNodes = _markupSentence(sentence.text, targets, modifiers, pyConText)
+            if sentenceCache is not None:
+                sentenceCache.put(sentence.text, targetsHash, modifiersHash, markupResult)
+        else:
+            # The cache only stores what is needed to build the annotations, not the pyConText nodes.
+            targetNodes = [None] * len(markupResult)
 
         # Collect all the nodes before making MentionLevelAnnotation objects to check for duplicate nodes. This is
         # necessary in case the TargetSpanSplitter was used.
-        for node in markup.nodes():
-            if node.getCategory()[0] == 'target':
-                # Give annotationId placeholder with specific number to be assigned at the end of the function when we
-                # know how many unique annotations we have.
-                annotationId = "pyConTextNLP_Instance_"
-                attributes = {
-                    "certainty": "definite"
-                }
-                annotationClass = None
-                if markup.isModifiedByCategory(node, "NEGATED_EXISTENCE") and markup.isModifiedByCategory(node, "AFFIRMED_EXISTENCE"):
-                    # Currently any node that is marked as both affirmed and negated is considered negated.
-                    print(
-                    "Node is modified by both NEGATED_EXISTENCE and AFFIRMED_EXISTENCE....hmmmm.\n\nNote: %s\nSentence: %s" % (
-                    sentence.documentName, sentence.text))
-                    annotationClass = modifierToClassMap["NEGATED_EXISTENCE"]
-                elif markup.isModifiedByCategory(node, "NEGATED_EXISTENCE"):
-                    annotationClass = modifierToClassMap["NEGATED_EXISTENCE"]
-                # If the node is not modified by NEGATED_EXISTENCE assume it is modified by AFFIRMED_EXISTENCE or it
-                # is a target with no modifier and consider it a bleeding_present annotation.
-                else:
-                    annotationClass = modifierToClassMap["AFFIRMED_EXISTENCE"]
-                predecessorList = markup.predecessors(node)
-                predecessorPhrases = []
-                for predecessor in predecessorList:
-                    predecessorPhrases.append(predecessor.getPhrase())
-                targetDict = {"modifiers": predecessorPhrases, "target": node.getPhrase()}
-                newAnnotation = MentionLevelAnnotation(sentence.text, sentence.documentSpan[0],
-                                                       sentence.documentSpan[1], "pyConTextNLP",
-                                                       annotationId, attributes, annotationClass, dynamicProperties=targetDict)
-                annotationTrioTuples.append(AnnotationTrio(node, sentence, newAnnotation))
+        for node, (targetPhrase, modifierPhrases, isNegated, isAffirmed) in zip(targetNodes, markupResult):
+            # Give annotationId placeholder with specific number to be assigned at the end of the function when we
+            # know how many unique annotations we have.
+            annotationId = "pyConTextNLP_Instance_"
+            attributes = {
+                "certainty": "definite"
+            }
+            annotationClass = None
+            if isNegated and isAffirmed:
+                # Currently any node that is marked as both affirmed and negated is considered negated.
+                print(
+                "Node is modified by both NEGATED_EXISTENCE and AFFIRMED_EXISTENCE....hmmmm.\n\nNote: %s\nSentence: %s" % (
+                sentence.documentName, sentence.text))
+                annotationClass = modifierToClassMap["NEGATED_EXISTENCE"]
+            elif isNegated:
+                annotationClass = modifierToClassMap["NEGATED_EXISTENCE"]
+            # If the node is not modified by NEGATED_EXISTENCE assume it is modified by AFFIRMED_EXISTENCE or it
+            # is a target with no modifier and consider it a bleeding_present annotation.
+            else:
+                annotationClass = modifierToClassMap["AFFIRMED_EXISTENCE"]
+            # The annotation is anchored to this sentence's span, so cached results are placed correctly.
+            targetDict = {"modifiers": list(modifierPhrases), "target": targetPhrase}
+            newAnnotation = MentionLevelAnnotation(sentence.text, sentence.documentSpan[0],
+                                                   sentence.documentSpan[1], "pyConTextNLP",
+                                                   annotationId, attributes, annotationClass, dynamicProperties=targetDict)
+            annotationTrioTuples.append(AnnotationTrio(node, sentence, newAnnotation))
 
     return annotationTrioTuples
 
 
-def _performAnnotationInternal(inputObject, targets, modifiers, modifierToClassMap, annotationGroup):
-
-    # Convert each list of sentences into AnnotationTrio tuples and hash them by document name.
-    tuplesGroupedByDoc = {}
-    for key in inputObject.keys():
-        docName = key
-        annotationTrioTuples = _annotateSentences(inputObject[key], targets, modifiers, modifierToClassMap, annotationGroup)
-
-        tuplesGroupedByDoc[docName] = annotationTrioTuples
-
-
-    # Ensure that each annotation is unique within its document.
-    uniqueDocumentGroups = {}
-    for documentName in tuplesGroupedByDoc:
-        uniqueTuples = _removeDuplicateAnnotations(tuplesGroupedByDoc[documentName])
-        uniqueDocumentGroups[documentName] = uniqueTuples
+def _annotateDocument(sentenceList, targets, modifiers, modifierToClassMap, annotationGroup, sentenceCache=None, ruleHashes=None):
+    """Annotates the sentences of a single document and returns a tuple of the form (<list of MentionLevelAnnotations>, <document length>). Duplicate annotations are removed and the remaining annotation Ids are numbered in order. If the document did not produce any sentences or any annotations the tuple ([], 0) is returned."""
+    uniqueTuples = _removeDuplicateAnnotations(_annotateSentences(sentenceList, targets, modifiers,
+                                                                  modifierToClassMap, annotationGroup, sentenceCache,
+                                                                  ruleHashes))
 
     #Add the appropriate number to the annotation Id's
-    for documentName in uniqueDocumentGroups:
-        for index, annotationTrio in enumerate(uniqueDocumentGroups[documentName]):
-            annotationTrio.annotation.annotationId += str(index)
-
-    #Construct the Document Objects
+    for index, annotationTrio in enumerate(uniqueTuples):
+        annotationTrio.annotation.annotationId += str(index)
+
+    if len(uniqueTuples) == 0:
+        return [], 0
+    return [annotationTrio.annotation for annotationTrio in uniqueTuples], uniqueTuples[0].sentence.documentLength
+
+# The targets, modifiers, sentence cache and rule hashes used by a PerformAnnotation worker process. Set once per
+# process by _initializeAnnotationWorker().
+_workerRules = None
+
+def _initializeAnnotationWorker(targetFilePath, modifiersFilePath, useRuleCache, sentenceCache):
+    """Pool initializer which loads and hashes the rule sets a single time in each worker process."""
+    global _workerRules
+    targets = loadRules(targetFilePath, useRuleCache)
+    modifiers = loadRules(modifiersFilePath, useRuleCache)
+    _workerRules = (targets, modifiers, sentenceCache, _hashRuleSets(targets, modifiers, sentenceCache))
+
+def _annotateDocumentInWorker(arguments):
+    """Annotates one document in a worker process using the rules loaded by _initializeAnnotationWorker(). Takes a tuple of the form (sentenceList, modifierToClassMap, annotationGroup) and returns the result of _annotateDocument()."""
+    sentenceList, modifierToClassMap, annotationGroup = arguments
+    targets, modifiers, sentenceCache, ruleHashes = _workerRules
+    return _annotateDocument(sentenceList, targets, modifiers, modifierToClassMap, annotationGroup, sentenceCache,
+                             ruleHashes)
+
+def _buildDocuments(documentNames, documentResults, annotationGroup):
+    """Constructs the Document objects from the (annotations, documentLength) tuples in documentResults, which are in the same order as documentNames. Returns a single Document if there is only one."""
     documents = []
-    for documentName in uniqueDocumentGroups:
-        newDocument = None
-        # The document did not produce any sentences or did not produce any annotations.
-        if len(uniqueDocumentGroups[documentName]) == 0:
-            newDocument = Document(documentName, annotationGroup, [], 0)
-        else:
-            firstTrio = uniqueDocumentGroups[documentName][0]
-            documentLength = firstTrio.sentence.documentLength
-            annotations = map(list, zip(*uniqueDocumentGroups[documentName]))[2]
-            newDocument = Document(documentName, annotationGroup, annotations, documentLength)
-        documents.append(newDocument)
+    for documentName, (annotations, documentLength) in zip(documentNames, documentResults):
+        documents.append(Document(documentName, annotationGroup, annotations, documentLength))
 
     if len(documents) == 1:
         return documents[0]
     else:
         return documents
 
+def _performAnnotationInternal(inputObject, targets, modifiers, modifierToClassMap, annotationGroup, sentenceCache=None):
+    documentNames = inputObject.keys()
+    ruleHashes = _hashRuleSets(targets, modifiers, sentenceCache)
+    documentResults = [_annotateDocument(inputObject[documentName], targets, modifiers, modifierToClassMap,
+                                         annotationGroup, sentenceCache, ruleHashes) for documentName in documentNames]
+    return _buildDocuments(documentNames, documentResults, annotationGroup)
+
 def _removeDuplicateAnnotations(nodeSentenceAnnotationTuples):
     """Checks for duplicate nodes by calculating each target's document span and ensuring that they are all unique.
     :return: [list] A list of unique tuples.
     """
     uniqueAnnotations = []
     for tuple in nodeSentenceAnnotationTuples:
-        node = tuple[0]
+        # The target phrase is read from the annotation, since the node is None for results taken from a SentenceResultCache.
+        targetPhrase = tuple[2].dynamicProperties["target"]
         sentence = tuple[1]
 
         #Append everything if the targetTerm property is not assigned.
@@ -141,7 +232,7 @@ def _removeDuplicateAnnotations(nodeSentenceAnnotationTuples):
             uniqueAnnotations.append(tuple)
             continue
 
-        if re.match(sentence.targetRegex, node.getPhrase(), re.IGNORECASE):
+        if re.match(sentence.targetRegex, targetPhrase, re.IGNORECASE):
             uniqueAnnotations.append(tuple)
 
     return uniqueAnnotations
@@ -154,7 +245,8 @@ class PyConTextInterface:
     @classmethod
     def PerformAnnotation(cls, pyConTextInputObject, targetFilePath=defaultTargetFilePath,
                                modifiersFilePath=defaultModifiersFilePath,
-                               modifierToClassMap=defaultModifierToAnnotationClassMap, annotationGroup="MIMC_v2"):
+                               modifierToClassMap=defaultModifierToAnnotationClassMap, annotationGroup="MIMC_v2", useRuleCache=True,
+                               workers=1, chunkSize=None, sentenceCache=None):
         """
         This method runs PyConText on the input Sentence objects and returns a Document object, or a list of Document
         objects if Sentences from multiple notes are passed as input.
@@ -164,13 +256,62 @@ class PyConTextInterface:
         :param modifiersFilePath: [string] The path to the tsv file containing the PyConText modifier terms.
         :param modifierToClassMap: [dict] A dictionary used to map eHost classes to pyConText modifier types.
         :param annotationGroup: [string] The current annotation round.
+        :param useRuleCache: [bool] If True (default) the targets and modifiers are loaded using :func:`loadRules <eHostess.PyConTextInterface.PyConText.loadRules>`, so repeated calls reuse the rule sets already loaded from unchanged files. Use :func:`clearRuleCache <eHostess.PyConTextInterface.PyConText.clearRuleCache>` to force them to be read again.
+        :param workers: [int | None] The number of processes used to annotate the documents. Defaults to 1, which annotates the documents in the current process. If greater than 1 the documents are annotated in a pool of worker processes, each of which loads the targets and modifiers once when it starts. The returned Documents are in the same order and contain the same annotations as those produced by a single process. If None, one process per CPU is used.
+        :param chunkSize: [int | None] The number of documents sent to a worker process at a time. If None (default) the documents are split into roughly four chunks per worker. Ignored if 'workers' is 1.
+        :param sentenceCache: [object] An optional instance of :class:`SentenceResultCache <eHostess.PyConTextInterface.SentenceResultCache.SentenceResultCache>`. Sentences whose text has already been marked up with the same targets and modifiers reuse the cached result instead of running pyConText again. When workers are used each worker process works with its own copy of the cache.
         :return: [object | list of objects] A single Document instance if all the sentences share a common documentName or a list of Document
         objects if the input sentences are from multiple notes.
         """
 
-        targets = itemData.instantiateFromCSVtoitemData(targetFilePath)
-        modifiers = itemData.instantiateFromCSVtoitemData(modifiersFilePath)
+        workers = resolveWorkers(workers, chunkSize)
+
+        documentNames = pyConTextInputObject.keys()
+        if workers == 1 or len(documentNames) < 2:
+            targets = loadRules(targetFilePath, useRuleCache)
+            modifiers = loadRules(modifiersFilePath, useRuleCache)
+
+            return _performAnnotationInternal(pyConTextInputObject, targets, modifiers,
+                                                   modifierToClassMap, annotationGroup, sentenceCache)
+
+        annotationArguments = [(pyConTextInputObject[documentName], modifierToClassMap, annotationGroup)
+                               for documentName in documentNames]
+
+        # The results are returned in the order of annotationArguments so the documents keep the order of documentNames.
+        documentResults = runInPool(_annotateDocumentInWorker, annotationArguments, workers, chunkSize, _initializeAnnotationWorker,
+                                    (targetFilePath, modifiersFilePath, useRuleCache, sentenceCache))
+
+        return _buildDocuments(documentNames, documentResults, annotationGroup)
+
+    @classmethod
+    def IterPerformAnnotation(cls, documentSentences, targetFilePath=defaultTargetFilePath,
+                              modifiersFilePath=defaultModifiersFilePath,
+                              modifierToClassMap=defaultModifierToAnnotationClassMap, annotationGroup="MIMC_v2",
+                              useRuleCache=True, sentenceCache=None):
+        """
+        A generator version of :meth:`PerformAnnotation <eHostess.PyConTextInterface.PyConText.PyConTextInterface.PerformAnnotation>`
+        which runs PyConText on one document at a time and yields each Document object as soon as it has been annotated.
+        Only the document currently being annotated is held in memory, so if the sentences are also produced lazily
+        very large corpora can be annotated in bounded memory.
+
+        :param documentSentences: [iterable | object] An iterable of tuples of the form (documentName, sentences), where sentences is a list of Sentence objects or a DocumentPlaceholder. An instance of PyConTextInput is also accepted.
+        :param targetFilePath: [string] The path to the tsv file containing the PyConText target terms.
+        :param modifiersFilePath: [string] The path to the tsv file containing the PyConText modifier terms.
+        :param modifierToClassMap: [dict] A dictionary used to map eHost classes to pyConText modifier types.
+        :param annotationGroup: [string] The current annotation round.
+        :param useRuleCache: [bool] If True (default) the targets and modifiers are loaded using :func:`loadRules <eHostess.PyConTextInterface.PyConText.loadRules>`.
+        :param sentenceCache: [object] An optional instance of :class:`SentenceResultCache <eHostess.PyConTextInterface.SentenceResultCache.SentenceResultCache>` used to reuse the markup of repeated sentences.
+        :return: [generator] A generator yielding one Document object per input document, in input order.
+        """
+
+        targets = loadRules(targetFilePath, useRuleCache)
+        modifiers = loadRules(modifiersFilePath, useRuleCache)
+        ruleHashes = _hashRuleSets(targets, modifiers, sentenceCache)
 
-        return _performAnnotationInternal(pyConTextInputObject, targets, modifiers,
-                                               modifierToClassMap, annotationGroup)
+        if isinstance(documentSentences, dict):
+            documentSentences = documentSentences.iteritems()
 
+        for documentName, sentenceList in documentSentences:
+            annotations, documentLength = _annotateDocument(sentenceList, targets, modifiers, modifierToClassMap,
+                                                            annotationGroup, sentenceCache, ruleHashes)
+            yield Document(documentName, annotationGroup, annotations, documentLength)
@@ -14,6 +14,10 @@ characters.
 
 import re
 
+# The whitespace characters the sentence splitter may add or remove.
+_whitespaceCharacters = '\n\r \t'
+_whitespaceRegex = re.compile(r"[\n\r \t]+")
+
 
 class SentenceReconstructor:
     def __init__(self, noteBody=""):
@@ -24,36 +28,53 @@ class SentenceReconstructor:
         self.noteBody = newNoteBody
         self.noteCursor = 0
 
-    def reconstructSentence(self, alteredSentence):
+    def alignSentence(self, alteredSentence):
         """
-        This method first strips the input sentence of all whitespace characters. It then scans through the
-        sentence and through the note (from the last place it left off) checking to see if they match. If there
-        is a mismatch and the note cursor points to a whitespace character it is inserted into the sentence.
-        If there is a mismatch and the note cursor does not point to a whitespace character an exception
-        is raised.
+        Aligns the altered sentence with the note, starting where the previous sentence ended, and returns the
+        sentence's span and its original text. The note and the sentence are walked together: whitespace in the note
+        that is missing from the sentence is skipped over and whitespace in the sentence is ignored. Any whitespace
+        between the end of the previous sentence and the start of this one is included in the span. If a non-whitespace
+        character in the sentence does not match the note an exception is raised.
+
+        Because the span is determined by the alignment itself, no separate search of the note is needed to find it.
+
         :param alteredSentence: [string] The sentence from the note body that has been altered by the sentence splitter.
-        :return: [string] The reconstructed sentence.
+        :return: [tuple] A tuple of the form (spanStart, spanEnd, originalText), where originalText is noteBody[spanStart:spanEnd].
         """
-        sentenceWithoutWhitespace = re.sub(r"\n|\r| |\t","",alteredSentence)
-        sentenceCursor = 0
-        reconstructedSentence = ""
-        while sentenceCursor < len(sentenceWithoutWhitespace):
-            nextNoteCharacter = self.noteBody[self.noteCursor]
-            nextSentenceCharacter = sentenceWithoutWhitespace[sentenceCursor]
-            if nextNoteCharacter == nextSentenceCharacter:
-                reconstructedSentence += nextNoteCharacter
-                self.noteCursor += 1
-                sentenceCursor += 1
+        noteBody = self.noteBody
+        noteLength = len(noteBody)
+        spanStart = self.noteCursor
+        noteCursor = spanStart
+        for token in _whitespaceRegex.split(alteredSentence):
+            if not token:
                 continue
-
-            if nextNoteCharacter in '\n\r \t':
-                reconstructedSentence += self.noteBody[self.noteCursor]
-                self.noteCursor += 1
+            while noteCursor < noteLength and noteBody[noteCursor] in _whitespaceCharacters:
+                noteCursor += 1
+            # Most tokens appear in the note unchanged, check the whole token at once before comparing characters.
+            if noteBody.startswith(token, noteCursor):
+                noteCursor += len(token)
                 continue
 
-            # If we reach this point there is a mismatch and something is wrong
-            raise RuntimeError("There is a non-whitespace mismatch. Note Snippet: %s\nSentence Snippet: %s\n" %
-                               (self.noteBody[self.noteCursor: self.noteCursor + 10],
-                                sentenceWithoutWhitespace[sentenceCursor: sentenceCursor + 10]))
+            for character in token:
+                while noteCursor < noteLength and noteBody[noteCursor] in _whitespaceCharacters:
+                    noteCursor += 1
+                if noteCursor >= noteLength or noteBody[noteCursor] != character:
+                    # If we reach this point there is a mismatch and something is wrong
+                    raise RuntimeError("There is a non-whitespace mismatch. Note Snippet: %s\nSentence Snippet: %s\n" %
+                                       (noteBody[noteCursor: noteCursor + 10], token))
+                noteCursor += 1
+
+        self.noteCursor = noteCursor
+        return (spanStart, noteCursor, noteBody[spanStart:noteCursor])
 
-        return reconstructedSentence
\ No newline at end of file
+    def reconstructSentence(self, alteredSentence):
+        """
+        Restores the whitespace that the sentence splitter removed from or added to the sentence, using
+        :meth:`alignSentence`. Whitespace between the end of the previous sentence and the start of this one is
+        included at the start of the reconstructed sentence. If a non-whitespace character in the sentence does not
+        match the note an exception is raised.
+
+        :param alteredSentence: [string] The sentence from the note body that has been altered by the sentence splitter.
+        :return: [string] The reconstructed sentence.
+        """
+        return self.alignSentence(alteredSentence)[2]
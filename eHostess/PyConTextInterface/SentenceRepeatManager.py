@@ -2,9 +2,6 @@
 This module was created to handle notes with multiple instances of the same sentence. This is only necessary because the PyConTextBuiltinSplitter module determines a sentence's location within a note based on a string search. If a sentence appears multiple times in a note then the string search will return all instances of that sentence. We need some way to keep track of which instance we are analyzing. That is the job of this module.
 """
 
-import re
-
-
 class RepeatManagerSentence:
     def __init__(self, text):
         self.text = text
@@ -17,7 +14,8 @@ class SentenceRepeatManager:
     it has seen duplicate sentences. Each time determineSpan() is called it will return the span of the next instance of
     a repeat sentence, or the span of the first instance of a new sentence."""
     def __init__(self, noteText):
-        self.sentences = []
+        # RepeatManagerSentence objects keyed by sentence text.
+        self.sentences = {}
         self.noteText = noteText
 
     def startNewNote(self, noteText):
@@ -27,7 +25,7 @@ class SentenceRepeatManager:
 
         :return: None
         """
-        self.sentences = []
+        self.sentences = {}
         self.noteText = noteText
 
     def determineSpan(self, sentence):
@@ -41,26 +39,17 @@ class SentenceRepeatManager:
         :param note: [string] The note body which contains `sentence`.
         :return: [tuple] A 2-tuple of integers, (spanStart, spanEnd).
         """
-        foundSentence = None
-
-        # if the sentence has been seen before it will be in self.sentences, search for it there first
-        for storedSentence in self.sentences:
-            if storedSentence.text == sentence:
-                foundSentence = storedSentence
-                break
-
-        # if the sentence is new, add it to the list of sentences.
-        if not foundSentence:
+        # if the sentence has been seen before it will be in self.sentences, otherwise add it.
+        foundSentence = self.sentences.get(sentence)
+        if foundSentence is None:
             foundSentence = RepeatManagerSentence(sentence)
-            self.sentences.append(foundSentence)
+            self.sentences[sentence] = foundSentence
 
-        # find the start and end of the appropriate match and return it as a string-ified tuple
-        regex = re.compile(re.escape(sentence))
         # only search from where we left off last time we saw the sentence
-        match = regex.search(self.noteText, foundSentence.endOfLastSearch)
-        if match:
-            foundSentence.endOfLastSearch = match.end()
-            return (match.start(), match.end())
+        start = self.noteText.find(sentence, foundSentence.endOfLastSearch)
+        if start != -1:
+            foundSentence.endOfLastSearch = start + len(sentence)
+            return (start, foundSentence.endOfLastSearch)
         else:
             raise RuntimeError ("Sentence Repeat Manger: Could not find sentence in note.\n\nSentence:********************************************** \n%s\n\nNote:******************************************************\n %s"
                                 % (sentence, self.noteText))
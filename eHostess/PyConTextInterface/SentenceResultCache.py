@@ -0,0 +1,155 @@
+"""
+This module caches the output of the pyConText markup pipeline for individual sentences. Clinical notes contain a great
+deal of copied-forward text, so the same sentence strings are often marked up many times. The markup of a sentence
+depends only on its text and on the targets and modifiers used, so the result for a sentence that has been seen before
+can be reused and anchored to the span of the new sentence without running pyConText again.
+"""
+
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+def hashRules(rules):
+    """
+    Returns a hash of the contents of a pyConTextNLP itemData object. Two rule sets with the same literals, categories,
+    regular expressions and rules, in the same order, have the same hash.
+
+    :param rules: [object] An itemData instance, e.g. one returned by :func:`loadRules <eHostess.PyConTextInterface.PyConText.loadRules>`.
+    :return: [string] A hexadecimal SHA-1 digest.
+    """
+    digest = hashlib.sha1()
+    for item in rules:
+        fields = [item.getLiteral(), item.categoryString(), item.getRE(), item.getRule()]
+        for field in fields:
+            if field is None:
+                field = u''
+            if isinstance(field, unicode):
+                field = field.encode('utf-8')
+            digest.update(field)
+            digest.update('\x00')
+        digest.update('\x01')
+    return digest.hexdigest()
+
+
+class SentenceResultCache:
+    """
+    A bounded, least recently used cache of pyConText markup results. Entries are keyed by the sentence text and the
+    hashes of the targets and modifiers used to mark it up. Each entry is a tuple with one item per target found in the
+    sentence, of the form (targetPhrase, modifierPhrases, isNegated, isAffirmed).
+
+    The cache may optionally be loaded from and saved to a JSON file so that it can be reused by later runs. Instances
+    are safe to share between threads. When PyConText is run with multiple worker processes each process works with
+    its own copy of the cache, so results computed by the workers are not added to the caller's instance.
+
+    :param maxSize: [int] The maximum number of sentences held in the cache. The least recently used entries are dropped once it is full.
+    :param cachePath: [string] Optional path of a JSON file. If the file exists the cache is loaded from it, and it is the default destination of save().
+    """
+    def __init__(self, maxSize=100000, cachePath=None):
+        if maxSize < 1:
+            raise ValueError("maxSize must be a positive integer. Got %s." % maxSize)
+        self.maxSize = maxSize
+        self.cachePath = cachePath
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        if cachePath and os.path.isfile(cachePath):
+            self.load(cachePath)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __getstate__(self):
+        # Locks cannot be pickled, which is needed to send the cache to worker processes that are spawned rather than
+        # forked, so the lock is left out and each copy creates its own.
+        with self._lock:
+            state = self.__dict__.copy()
+            state["_entries"] = OrderedDict(self._entries)
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def get(self, text, targetsHash, modifiersHash):
+        """
+        Returns the cached markup result for a sentence, or None if it is not in the cache.
+
+        :param text: [string] The text of the sentence.
+        :param targetsHash: [string] The hash of the targets, as returned by hashRules().
+        :param modifiersHash: [string] The hash of the modifiers, as returned by hashRules().
+        :return: [tuple | None] A tuple of (targetPhrase, modifierPhrases, isNegated, isAffirmed) tuples.
+        """
+        key = (text, targetsHash, modifiersHash)
+        with self._lock:
+            result = self._entries.pop(key, None)
+            if result is None:
+                self.misses += 1
+                return None
+            # Re-insert the entry to mark it as the most recently used.
+            self._entries[key] = result
+            self.hits += 1
+            return result
+
+    def put(self, text, targetsHash, modifiersHash, result):
+        """
+        Adds the markup result for a sentence to the cache, dropping the least recently used entry if the cache is full.
+
+        :param text: [string] The text of the sentence.
+        :param targetsHash: [string] The hash of the targets, as returned by hashRules().
+        :param modifiersHash: [string] The hash of the modifiers, as returned by hashRules().
+        :param result: [list] A list of (targetPhrase, modifierPhrases, isNegated, isAffirmed) tuples.
+        :return: None
+        """
+        key = (text, targetsHash, modifiersHash)
+        result = tuple((targetPhrase, tuple(modifierPhrases), bool(isNegated), bool(isAffirmed))
+                       for targetPhrase, modifierPhrases, isNegated, isAffirmed in result)
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = result
+            while len(self._entries) > self.maxSize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """
+        Removes every entry from the cache and resets the hit and miss counts.
+
+        :return: None
+        """
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def save(self, cachePath=None):
+        """
+        Writes the cache to a JSON file, preserving the order in which the entries were last used.
+
+        :param cachePath: [string] The path of the file to write. Defaults to the cachePath the cache was created with.
+        :return: None
+        """
+        cachePath = cachePath or self.cachePath
+        if not cachePath:
+            raise ValueError("A cachePath must be supplied either here or when the SentenceResultCache is created.")
+        with self._lock:
+            entries = [[text, targetsHash, modifiersHash, result]
+                       for (text, targetsHash, modifiersHash), result in self._entries.iteritems()]
+        with open(cachePath, 'w') as cacheFile:
+            json.dump({"entries": entries}, cacheFile)
+
+    def load(self, cachePath):
+        """
+        Adds the entries saved in a JSON file by save() to the cache. Entries already in the cache are kept.
+
+        :param cachePath: [string] The path of the file to read.
+        :return: None
+        """
+        with open(cachePath, 'r') as cacheFile:
+            cached = json.load(cacheFile)
+        for text, targetsHash, modifiersHash, result in cached["entries"]:
+            self.put(text, targetsHash, modifiersHash, result)
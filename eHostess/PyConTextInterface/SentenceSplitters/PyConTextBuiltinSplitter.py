@@ -1,11 +1,9 @@
 """This module contains the logic for splitting sentences and identifying their document span using the built-in PyConText
 sentence splitter found in pyConTextNLP.helpers. Due to the whitespace alterations performed by the built-in splitter
-it is necessary to use the SentenceReconstructor and SentenceRepeatManager modules to determine the sentence's document
-span. You can read more in those two modules about why they are necessary."""
+it is necessary to use the SentenceReconstructor module to restore each sentence's original text and determine its
+document span. You can read more in that module about why it is necessary."""
 
-from pyConTextNLP.helpers import sentenceSplitter
 from eHostess.PyConTextInterface.SentenceReconstructor import SentenceReconstructor as Reconstructor
-from eHostess.PyConTextInterface.SentenceRepeatManager import SentenceRepeatManager as RepeatManger
 from PyConTextInput import PyConTextInput
 from eHostess.Annotations.Document import Document
 import eHostess.Utilities.utilities as utilities
@@ -15,6 +13,9 @@ import glob
 def _splitSentencesSingleDocInternal(documentPath):
     """Takes a string, returns a list of reconstructed sentences of the form (text, docSpanTuple, docName, docLength, None) to be fed to PyConTextInput."""
 
+    # pyConTextNLP is only imported once it is needed, since it is slow to import.
+    from pyConTextNLP.helpers import sentenceSplitter
+
     sentenceTuples = []
 
     with open(documentPath, 'rU') as inFile:
@@ -23,15 +24,15 @@ def _splitSentencesSingleDocInternal(documentPath):
     documentName = Document.ParseDocumentNameFromPath(documentPath)
     docLength = len(documentText)
     sentences = sentenceSplitter().splitSentences(documentText)
-    repeatManager = RepeatManger(documentText)
     reconstructor = Reconstructor(documentText)
 
 
     for sentence in sentences:
-        reconstructedSentence = reconstructor.reconstructSentence(sentence)
-        span = repeatManager.determineSpan(reconstructedSentence)
+        # The alignment walks through the note in order, so it gives the span of the correct instance of repeated
+        # sentences without searching the note again.
+        spanStart, spanEnd, reconstructedSentence = reconstructor.alignSentence(sentence)
 
-        sentenceTuples.append((reconstructedSentence, span, documentName, docLength, None))
+        sentenceTuples.append((reconstructedSentence, (spanStart, spanEnd), documentName, docLength, None))
     return sentenceTuples
 
 def splitSentencesSingleDocument(documentPath):
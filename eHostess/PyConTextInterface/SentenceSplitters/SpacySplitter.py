@@ -2,56 +2,134 @@
 
 from .PyConTextInput import PyConTextInput
 from eHostess.Annotations.Document import Document
-import spacy
-import en_core_web_sm
+from eHostess.Utilities.utilities import resolveWorkers
 import os
 import sys
 import re
+import threading
 
-nlp = en_core_web_sm.load()
+# The pipeline used to split sentences: either the name of an installed spaCy model, or "sentencizer" for spaCy's
+# rule-based sentencizer, which splits on punctuation and is much faster and lighter than a full model. Use setModel()
+# to change it.
+defaultModel = "en_core_web_sm"
+_modelName = defaultModel
+_nlp = None
+_nlpLock = threading.Lock()
 
-def _splitSentencesInternal(documentPath):
-    """Splits a single document."""
+def _loadPipeline(modelName):
+    """Imports spaCy and builds the pipeline named by modelName."""
+    import spacy
+    if modelName != "sentencizer":
+        return spacy.load(modelName)
+
+    pipeline = spacy.blank("en")
+    if int(spacy.__version__.split(".")[0]) < 3:
+        pipeline.add_pipe(pipeline.create_pipe("sentencizer"))
+    else:
+        pipeline.add_pipe("sentencizer")
+    return pipeline
+
+def getNlp():
+    """
+    Returns the spaCy pipeline used to split sentences, loading it the first time it is needed. Neither spaCy nor the
+    model is loaded when this module is imported, so processes that never split a sentence do not pay for them. The
+    pipeline is only loaded once even if several threads call this function at the same time.
+
+    :return: (object) The spaCy Language object.
+    """
+    global _nlp
+    nlp = _nlp
+    if nlp is None:
+        with _nlpLock:
+            if _nlp is None:
+                _nlp = _loadPipeline(_modelName)
+            nlp = _nlp
+    return nlp
+
+def setModel(modelName=defaultModel):
+    """
+    Chooses the pipeline used to split sentences. The pipeline is loaded the next time it is needed.
+
+    :param modelName: (string) The name of an installed spaCy model, e.g. "en_core_web_sm" (default), or "sentencizer" to use spaCy's rule-based sentencizer instead of a statistical model.
+    :return: None
+    """
+    global _modelName, _nlp
+    with _nlpLock:
+        _modelName = modelName
+        _nlp = None
+
+# Pipeline components that sentence segmentation does not need. In the en_core_web_sm models the sentence boundaries are
+# set by the dependency parser, so the tagger and the named entity recognizer can be skipped. Components that are not in
+# the pipeline, e.g. when the sentencizer is used, are ignored.
+unneededComponents = ["tagger", "ner"]
+
+def _readDocument(documentPath):
+    """Returns the text and the name of the document at documentPath."""
     if not os.path.isfile(documentPath):
         raise RuntimeError("File not found: %s" % documentPath)
     with open(documentPath, "rU") as f:
         body = f.read()
-    docLength = len(body)
-    docName = Document.ParseDocumentNameFromPath(documentPath)
-    doc = nlp(unicode(body)) # Necessary in Python2.7
-    #doc = nlp(body) # Necessary in python3.6
-    sentences = []
-    for sent in doc.sents:
-        text = sent.text
-        span = (sent.start_char, sent.end_char)
-        sentences.append((text, span, docName, docLength))
-    return sentences
+    return body, Document.ParseDocumentNameFromPath(documentPath)
+
+def _readDocuments(documentPaths):
+    """Reads the documents one at a time, yielding tuples of the form (text, (docName, docLength)) for nlp.pipe()."""
+    for documentPath in documentPaths:
+        body, docName = _readDocument(documentPath)
+        yield unicode(body), (docName, len(body)) # unicode() is necessary in Python2.7
+
+def _sentenceTuples(doc, docName, docLength):
+    """Returns the sentences of a processed spaCy Doc as tuples to be fed to PyConTextInput."""
+    return [(sent.text, (sent.start_char, sent.end_char), docName, docLength) for sent in doc.sents]
+
+def _splitSentencesInternal(documentPath):
+    """Splits a single document."""
+    body, docName = _readDocument(documentPath)
+    return _splitSentencesInternalRawString(body, docName)
 
 def _splitSentencesInternalRawString(body, name):
     """Splits a raw string."""
-    docLength = len(body)
-    docName = name
-    doc = nlp(unicode(body)) # Necessary in Python2.7
-    #doc = nlp(body) # Necessary in python3.6
-    sentences = []
-    for sent in doc.sents:
-        text = sent.text
-        span = (sent.start_char, sent.end_char)
-        sentences.append((text, span, docName, docLength))
-    return sentences
+    doc = getNlp()(unicode(body)) # Necessary in Python2.7
+    #doc = getNlp()(body) # Necessary in python3.6
+    return _sentenceTuples(doc, name, len(body))
 
 def splitSentencesSingleDocument(documentPath):
     inputObj = PyConTextInput()
     inputObj.addSentence(*_splitSentencesInternal(documentPath)[0])
     return inputObj
 
-def splitSentencesMultipleDocuments(documentPaths):
+def splitSentencesMultipleDocuments(documentPaths, batchSize=None, workers=1):
+    """
+    Splits the documents at documentPaths into sentences using spaCy.
+
+    :param documentPaths: (list of strings) The paths of the documents to split.
+    :param batchSize: (int) If None (default) each document is processed on its own by the full spaCy pipeline. Otherwise the documents are streamed through nlp.pipe() in batches of this many documents, with the pipeline components listed in 'unneededComponents' disabled. The sentences are the same either way, but batching is much faster on large corpora.
+    :param workers: (int | None) The number of processes nlp.pipe() uses to process the batches, passed to it as 'n_process'. Defaults to 1. If None, one process per CPU is used. Values other than 1 require spaCy 2.2 or later. Ignored if 'batchSize' is None.
+    :return: (object) A PyConTextInput instance containing the sentences.
+    """
     inputObj = PyConTextInput()
 
     numDocs = len(documentPaths)
-    for index, docPath in enumerate(documentPaths):
+    if batchSize is None:
+        for index, docPath in enumerate(documentPaths):
+            sys.stdout.write("\rSplitting document %i of %i. (%.3f%%)" % (index + 1, numDocs, float(index + 1) * 100. / float(numDocs)))
+            for sentenceInfo in _splitSentencesInternal(docPath):
+                inputObj.addSentence(*sentenceInfo)
+        return inputObj
+
+    if batchSize < 1:
+        raise ValueError("batchSize must be None or a positive integer. Got %s." % batchSize)
+    workers = resolveWorkers(workers)
+
+    nlp = getNlp()
+    pipeArguments = {"as_tuples": True, "batch_size": batchSize,
+                     "disable": [name for name in unneededComponents if name in nlp.pipe_names]}
+    # Older versions of spaCy do not accept 'n_process', so it is only passed when it is needed.
+    if workers != 1:
+        pipeArguments["n_process"] = workers
+
+    for index, (doc, (docName, docLength)) in enumerate(nlp.pipe(_readDocuments(documentPaths), **pipeArguments)):
         sys.stdout.write("\rSplitting document %i of %i. (%.3f%%)" % (index + 1, numDocs, float(index + 1) * 100. / float(numDocs)))
-        for sentenceInfo in _splitSentencesInternal(docPath):
+        for sentenceInfo in _sentenceTuples(doc, docName, docLength):
             inputObj.addSentence(*sentenceInfo)
 
     return inputObj
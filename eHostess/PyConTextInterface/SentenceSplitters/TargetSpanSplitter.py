@@ -52,35 +52,239 @@ from eHostess.Annotations.Document import Document
 import eHostess.Utilities.utilities as utilities
 import glob
 import sys
-import multiprocessing
-
-def _splitSentencesSingleDocumentInternal(documentPath, targets, numLeadingWords, numTrailingWords, spanTargetPunctuation):
-    """This function takes a document path and splits it up according to the other paramaters, returning a tuple of the form (text, docSpanTuple, docName, docLength, None) to be fed to PyConTextInput. Or (None, <docName>) if no target terms were matched in the input doc."""
-
-    with open(documentPath, 'rU') as inFile:
-        documentText = inFile.read()
-
-    documentName = Document.ParseDocumentNameFromPath(documentPath)
 
+# Matches inline flag groups such as "(?x)", which apply to a whole pattern and so cannot be safely combined into a
+# single alternation with other targets.
+_inlineFlagsRegex = re.compile(r"\(\?[iLmsux]+\)")
+# Matches numbered and named backreferences, and conditional groups. Group numbers would refer to the wrong group once
+# the target is placed in an alternation after other targets.
+_backreferenceRegex = re.compile(r"\\[1-9]|\(\?P=|\(\?\(")
+# Python 2's re module does not support more than 100 groups in one pattern.
+_maximumGroupsPerPattern = 99
+_prefilterGroupPrefix = "_prefilterTarget"
+
+def _buildPrefilterRegexes(targets):
+    """Combines the regular expressions of all the targets into alternations, one named group per target, which are
+    used to find the targets that occur in a document in one pass. Returns a list of tuples of the form (<compiled
+    pattern>, <indices of the targets in the pattern>), as several patterns are needed if the targets contain more groups
+    than a single pattern can hold, or None if the targets cannot be combined safely. The group of the target at index i
+    in targets is named "_prefilterTarget<i>"."""
+    targetRegexes = [item.getRE() for item in targets]
+    if len(targetRegexes) == 0 or any(_inlineFlagsRegex.search(targetRegex) or _backreferenceRegex.search(targetRegex)
+                                      for targetRegex in targetRegexes):
+        return None
+
+    try:
+        prefilterPatterns = []
+        patternRegexes = []
+        patternIndices = []
+        patternGroups = 0
+        for index, targetRegex in enumerate(targetRegexes):
+            numGroups = re.compile(targetRegex).groups + 1
+            if patternRegexes and patternGroups + numGroups > _maximumGroupsPerPattern:
+                prefilterPatterns.append((re.compile("|".join(patternRegexes), flags=re.IGNORECASE), patternIndices))
+                patternRegexes = []
+                patternIndices = []
+                patternGroups = 0
+            patternRegexes.append("(?P<%s%i>%s)" % (_prefilterGroupPrefix, index, targetRegex))
+            patternIndices.append(index)
+            patternGroups += numGroups
+        prefilterPatterns.append((re.compile("|".join(patternRegexes), flags=re.IGNORECASE), patternIndices))
+    except (re.error, AssertionError):
+        # AssertionError is raised by Python 2 for a single target with too many groups.
+        return None
+    return prefilterPatterns
+
+def _punctuationToIgnore(spanTargetPunctuation):
+    """Returns the string inserted after the target regex in the span regex. See splitSentencesSingleDocument()."""
     defaultPunctuationToIgnore = "[,:-]?"
     punctuationToIgnore = ""
     if spanTargetPunctuation == None:
         punctuationToIgnore = defaultPunctuationToIgnore
     if spanTargetPunctuation != False and spanTargetPunctuation != None:
         punctuationToIgnore = spanTargetPunctuation
+    return punctuationToIgnore
 
+def _addSentenceTuples(pyConTextInput, sentenceTuples):
+    """Adds the output of CompiledTargetSpanSplitter._splitText() for one document to pyConTextInput. If the splitter
+    returned (None, <docname>) instead of a list a DocumentPlaceholder is added for the document."""
+    if isinstance(sentenceTuples, list):
+        for sentenceTuple in sentenceTuples:
+            pyConTextInput.addSentence(*sentenceTuple)
+    else:
+        pyConTextInput.addDocumentPlaceholder(sentenceTuples[1])
 
-    regexStrings = [(r"(?:[^\.\s]+\s+){0,%i}(%s)%s(?:\s+[^\.\s]+){0,%i}" %
-                                    (numLeadingWords, item.getRE(), punctuationToIgnore, numTrailingWords), item.getRE()) for item in targets]
+# The CompiledTargetSpanSplitter used by a worker process. Set once per process by _initializeSplitterWorker().
+_workerSplitter = None
 
-    matches = [(match, targetRegex) for regexString, targetRegex in regexStrings for match in re.finditer(regexString, documentText, flags=re.IGNORECASE)]
+def _initializeSplitterWorker(splitter):
+    """Pool initializer which stores the splitter in each worker process so it is not sent with every document."""
+    global _workerSplitter
+    _workerSplitter = splitter
 
-    if len(matches) == 0:
-        return (None, documentName)
-    else:
-        return [(match[0].group(), (match[0].start(), match[0].end()), documentName, len(documentText), match[1]) for match in matches]
+def _splitDocumentInWorker(documentPath):
+    """Splits one document in a worker process using the splitter stored by _initializeSplitterWorker()."""
+    return _workerSplitter._splitDocument(documentPath)
+
+class CompiledTargetSpanSplitter:
+    """
+    A target-span sentence splitter whose regular expressions are built and compiled a single time, so that it can be
+    applied to many documents or strings without the cost of rebuilding them. Python's own cache of compiled regular
+    expressions only holds 100 patterns, so without this object a large target list is recompiled for every document.
+    The module-level functions splitSentencesSingleDocument() and splitSentencesMultipleDocuments() create one of these
+    for each call; create one yourself when splitting documents in several batches or splitting raw strings.
+
+    See :func:`splitSentencesSingleDocument` for an explanation of the arguments.
+
+    :param targets: (pyConText.itemData.itemData) The pyConText itemData instance that contains the target ContextItems.
+    :param numLeadingWords: (int) The number of words before the target term to include in the span.
+    :param numTrailingWords: (int) The number of words following the target term to include in the span.
+    :param spanTargetPunctuation: (optional) The punctuation to ignore after the target term. Defaults to "[,:-]?".
+    :param scanMode: (optional) Either "perTarget" (default) or "prefilter".
+    """
+    def __init__(self, targets, numLeadingWords, numTrailingWords, spanTargetPunctuation=None, scanMode="perTarget"):
+        if scanMode not in ["perTarget", "prefilter"]:
+            raise ValueError("scanMode must be either 'perTarget' or 'prefilter'. Got %s." % scanMode)
+        self.scanMode = scanMode
+
+        punctuationToIgnore = _punctuationToIgnore(spanTargetPunctuation)
+        # Each entry is a tuple of the form (<compiled span regex>, <compiled bare target regex>, <target regex string>).
+        self.targetPatterns = [(re.compile(r"(?:[^\.\s]+\s+){0,%i}(%s)%s(?:\s+[^\.\s]+){0,%i}" %
+                                           (numLeadingWords, item.getRE(), punctuationToIgnore, numTrailingWords), flags=re.IGNORECASE),
+                                re.compile(item.getRE(), flags=re.IGNORECASE), item.getRE()) for item in targets]
+        self.prefilterPatterns = None
+        if scanMode == "prefilter":
+            self.prefilterPatterns = _buildPrefilterRegexes(targets)
+
+    def _findPresentTargets(self, documentText):
+        """Returns the set of the indices of the targets whose bare regex matches somewhere in documentText, using the
+        prefilter patterns.
+
+        Each prefilter pattern is run over the document once and the group of each match identifies a target that is
+        present. An alternation only reports one target per match, so a target is missed if it only occurs where an
+        earlier target in the alternation matched, or inside the match of another target. Every such occurrence starts
+        within one of the matches of its pattern, so the remaining targets are only tried at those positions."""
+        presentTargets = set()
+        for prefilterPattern, targetIndices in self.prefilterPatterns:
+            matchPositions = []
+            for match in prefilterPattern.finditer(documentText):
+                # The target's own group always closes last, so it is the last group of the match.
+                presentTargets.add(int(match.lastgroup[len(_prefilterGroupPrefix):]))
+                matchPositions.extend(xrange(match.start(), max(match.end(), match.start() + 1)))
+            if not matchPositions:
+                continue
+            for targetIndex in targetIndices:
+                if targetIndex in presentTargets:
+                    continue
+                targetPattern = self.targetPatterns[targetIndex][1]
+                if any(targetPattern.match(documentText, position) for position in matchPositions):
+                    presentTargets.add(targetIndex)
+        return presentTargets
+
+    def _findTargetSpans(self, documentText):
+        """Returns a list of (match, targetRegex) tuples with all the matches of each target's span regex, in target order.
+
+        In "prefilter" mode the document is first scanned once for all the targets together, and a target's span regex
+        is only run if the bare target regex matches somewhere in the document. Any match of a span regex contains a
+        match of its bare target regex, so the output is identical to that of the "perTarget" mode, but documents are
+        only scanned once and the comparatively slow span regexes are not run for targets that do not occur. If the
+        targets cannot be combined into prefilter patterns each bare target regex is searched for instead."""
+        targetPatterns = self.targetPatterns
+        if self.scanMode == "prefilter":
+            if self.prefilterPatterns is None:
+                targetPatterns = [patterns for patterns in targetPatterns if patterns[1].search(documentText)]
+            else:
+                presentTargets = self._findPresentTargets(documentText)
+                targetPatterns = [patterns for index, patterns in enumerate(targetPatterns) if index in presentTargets]
+
+        return [(match, targetRegex) for spanPattern, targetPattern, targetRegex in targetPatterns for match in spanPattern.finditer(documentText)]
+
+    def _splitText(self, documentText, documentName):
+        """Returns a list of tuples of the form (text, docSpanTuple, docName, docLength, targetRegex) to be fed to PyConTextInput. Or (None, <docName>) if no target terms were matched in the text."""
+        matches = self._findTargetSpans(documentText)
+
+        if len(matches) == 0:
+            return (None, documentName)
+        else:
+            return [(match[0].group(), (match[0].start(), match[0].end()), documentName, len(documentText), match[1]) for match in matches]
+
+    def _splitDocument(self, documentPath):
+        """Reads the document at documentPath and returns the output of _splitText() for its contents."""
+        with open(documentPath, 'rU') as inFile:
+            documentText = inFile.read()
+
+        return self._splitText(documentText, Document.ParseDocumentNameFromPath(documentPath))
+
+    def splitText(self, documentText, documentName):
+        """
+        Splits a string that has already been read into target-span sentences.
+
+        :param documentText: (string) The text to split.
+        :param documentName: (string) The name of the document the text belongs to.
+        :return: (object) A PyConTextInput instance containing the sentences, or a DocumentPlaceholder for the document if no targets were found.
+        """
+        pyConTextInput = PyConTextInput()
+        _addSentenceTuples(pyConTextInput, self._splitText(documentText, documentName))
+        return pyConTextInput
+
+    def splitSentencesSingleDocument(self, documentPath):
+        """
+        Splits the document at documentPath into target-span sentences. See :func:`splitSentencesSingleDocument`.
+
+        :param documentPath: (string) The path to the document to split into target-span regions.
+        :return: (object) A PyConTextInput instance containing the sentences, or a DocumentPlaceholder for the document if no targets were found.
+        """
+        pyConTextInput = PyConTextInput()
+        _addSentenceTuples(pyConTextInput, self._splitDocument(documentPath))
+        return pyConTextInput
+
+    def splitSentencesMultipleDocuments(self, directoryList, workers=1, chunkSize=None):
+        """
+        Splits every document found in the directories in directoryList into target-span sentences. See
+        :func:`splitSentencesMultipleDocuments`.
+
+        :param directoryList: (string | list) A directory path or a list of directory paths containing the documents to split.
+        :param workers: (int | None) The number of processes used to split the documents. See :func:`splitSentencesMultipleDocuments`.
+        :param chunkSize: (int | None) The number of documents sent to a worker process at a time. See :func:`splitSentencesMultipleDocuments`.
+        :return: (object) A PyConTextInput instance with an entry for every document.
+        """
+        workers = utilities.resolveWorkers(workers, chunkSize)
+
+        if type(directoryList) != list:
+            directoryList = [directoryList]
+
+        cleanList = utilities.cleanDirectoryList(directoryList)
+
+        fileList = [filename for directory in cleanList for filename in glob.glob(directory)]
+
+        def printProgress(index):
+            sys.stdout.write("\rSplitting document %i of %i. (%.2f%%)"% (index + 1, len(fileList) + 1, float(index + 1)/float(len(fileList) + 1) * 100.))
+            sys.stdout.flush()
+
+        sentenceTuples = []
+        if workers == 1 or len(fileList) < 2:
+            for index, filepath in enumerate(fileList):
+                printProgress(index)
+                sentenceTuples.append(self._splitDocument(filepath))
+        else:
+            # The results are returned in the order of fileList so the documents are added in the same order as they
+            # are when splitting in a single process.
+            for index, tupleList in enumerate(utilities.iterInPool(_splitDocumentInWorker, fileList, workers, chunkSize,
+                                                                   _initializeSplitterWorker, (self,))):
+                printProgress(index)
+                sentenceTuples.append(tupleList)
+        print ""
+
+        pyConTextInput = PyConTextInput(numDocs=len(fileList))
+        for tupleList in sentenceTuples:
+            _addSentenceTuples(pyConTextInput, tupleList)
+
+        if not pyConTextInput.containsExpectedNumberOfDocKeys():
+            raise RuntimeError("The PyConTextInput object produced by PyConTextBuiltinSplitter does not contain the expected number of documents. Expected: %i, Contains: %i" % (pyConTextInput.numDocs, len(pyConTextInput.keys())))
+
+        return pyConTextInput
 
-def splitSentencesSingleDocument(documentPath, targets, numLeadingWords, numTrailingWords, spanTargetPunctuation=None):
+def splitSentencesSingleDocument(documentPath, targets, numLeadingWords, numTrailingWords, spanTargetPunctuation=None, scanMode="perTarget"):
     """
     This function splits the input documentText into sections, taking a span around the document as specified by
     numLeadingWords and numTrailingWords. The span is taken by finding all matches of the regular expression
@@ -98,25 +302,20 @@ def splitSentencesSingleDocument(documentPath, targets, numLeadingWords, numTrai
     by passing a string as an argument. This string is inserted without modification at the
      <punctuationToIgnore> position in the regular expression used to find the spans. The default string is "[,:-]?"
      See function doc string for more info about the regular expression used to find the spans.
+    :param scanMode: (optional) Either "perTarget" (default), which runs the span regular expression of every target over
+    the whole document, or "prefilter", which first checks the whole document for all the targets in a single pass and then
+    only runs the span regular expressions of the targets that occur in it. Both modes return the same sentences, but
+    "prefilter" is much faster when most targets do not occur in most documents.
     :return:(list) A list of SpanBasedSentence objects containing information about the spans identified in the docuemnt.
     See `SpanBasedSentence` for more info.
     """
 
-    pyConTextInput = PyConTextInput()
-
-    sentenceTuples = _splitSentencesSingleDocumentInternal(documentPath, targets, numLeadingWords, numTrailingWords, spanTargetPunctuation)
-
-    if sentenceTuples[0][0] == None:
-        pyConTextInput.addDocumentPlaceholder(sentenceTuples[0][1])
-        return pyConTextInput
-    else:
-        for sentenceTuple in sentenceTuples:
-            pyConTextInput.addSentence(*sentenceTuple)
-        return pyConTextInput
+    return CompiledTargetSpanSplitter(targets, numLeadingWords, numTrailingWords, spanTargetPunctuation,
+                                      scanMode).splitSentencesSingleDocument(documentPath)
 
 
 def splitSentencesMultipleDocuments(directoryList, targets, numLeadingWords, numTrailingWords,
-                                 spanTargetPunctuation=None):
+                                 spanTargetPunctuation=None, scanMode="perTarget", workers=1, chunkSize=None):
     """
     This function splits the input documentText into sections, taking a span around the document as specified by
     numLeadingWords and numTrailingWords. The span is taken by finding all matches of the regular expression
@@ -134,58 +333,18 @@ def splitSentencesMultipleDocuments(directoryList, targets, numLeadingWords, num
     by passing a string as an argument. This string is inserted without modification at the
      <punctuationToIgnore> position in the regular expression used to find the spans. The default string is "[,:-]?"
      See function doc string for more info about the regular expression used to find the spans.
+    :param scanMode: (optional) Either "perTarget" (default), which runs the span regular expression of every target over
+    the whole document, or "prefilter", which first checks the whole document for all the targets in a single pass and then
+    only runs the span regular expressions of the targets that occur in it. Both modes return the same sentences, but
+    "prefilter" is much faster when most targets do not occur in most documents.
+    :param workers: (optional) The number of processes used to split the documents. Defaults to 1, which splits the
+    documents one at a time in the current process. If greater than 1 the documents are read and split in a pool of
+    worker processes and the results are added to the PyConTextInput in the same order as they are by a single process,
+    with a DocumentPlaceholder for each document without targets. If None, one process per CPU is used.
+    :param chunkSize: (optional) The number of documents sent to a worker process at a time. If None (default) the
+    documents are split into roughly four chunks per worker. Ignored if 'workers' is 1.
     :return:(list) A list of SpanBasedSentence objects containing information about the spans identified in the docuemnt.
     See `SpanBasedSentence` for more info.
     """
-    if type(directoryList) != list:
-        directoryList = [directoryList]
-
-    cleanList = utilities.cleanDirectoryList(directoryList)
-
-    fileList = [filename for directory in cleanList for filename in glob.glob(directory)]
-
-    sentenceTuples = []
-    for index, filepath in enumerate(fileList):
-        sys.stdout.write("\rSplitting document %i of %i. (%.2f%%)"% (index + 1, len(fileList) + 1, float(index + 1)/float(len(fileList) + 1) * 100.))
-        sys.stdout.flush()
-        tupleList = _splitSentencesSingleDocumentInternal(filepath, targets, numLeadingWords, numTrailingWords,spanTargetPunctuation)
-        #If the splitter returns (None, <docname>) instead of a list then we should append the tuple rather than
-        # extending the list with the contents of the tuple.
-        if isinstance(tupleList, list):
-            sentenceTuples.extend(tupleList)
-        else:
-            sentenceTuples.append(tupleList)
-    print ""
-
-    pyConTextInput = PyConTextInput(numDocs=len(fileList))
-    for sentenceTuple in sentenceTuples:
-        if sentenceTuple[0] == None:
-            pyConTextInput.addDocumentPlaceholder(sentenceTuple[1])
-        else:
-            pyConTextInput.addSentence(*sentenceTuple)
-
-    if not pyConTextInput.containsExpectedNumberOfDocKeys():
-        raise RuntimeError("The PyConTextInput object produced by PyConTextBuiltinSplitter does not contain the expected number of documents. Expected: %i, Contains: %i" % (pyConTextInput.numDocs, len(pyConTextInput.keys())))
-
-    return pyConTextInput
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
+    return CompiledTargetSpanSplitter(targets, numLeadingWords, numTrailingWords, spanTargetPunctuation,
+                                      scanMode).splitSentencesMultipleDocuments(directoryList, workers, chunkSize)
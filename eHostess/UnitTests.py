@@ -51,6 +51,22 @@ length = getOriginalFileLength(
 if length != 8442:
     failed = True
 
+# Using a prebuilt index, optionally persisted to and reloaded from a JSON file.
+import tempfile
+from eHostess.eHostInterface.KnowtatorReader import OriginalFileIndex
+indexCacheDir = tempfile.mkdtemp()
+indexCachePath = os.path.join(indexCacheDir, 'originalFileIndex.json')
+for index in range(2):
+    originalFileIndex = OriginalFileIndex(['./UnitTestDependencies/eHostInterface/OriginalLengthandParseSingle/corpus'], indexCachePath)
+    if index == 1 and originalFileIndex.builtFromDisk:
+        failed = True
+    length = getOriginalFileLength(
+        './UnitTestDependencies/eHostInterface/OriginalLengthandParseSingle/saved/2530.txt.knowtator.xml', originalFileIndex)
+    if length != 8442:
+        failed = True
+os.remove(indexCachePath)
+os.rmdir(indexCacheDir)
+
 if failed:
     failCount += 1
     print failedColor + '*****************Test Failed***************************\n' + resetColor
@@ -81,6 +97,129 @@ else:
     print passedColor + "Passed\n" + resetColor
 
 
+#### Test eHostInterface.KnowtatorReader.parseSingleKnowtatorFile() parser="iterparse" ####
+failed = False
+printTestName('Testing eHostInterface.KnowtatorReader.parseSingleKnowtatorFile() parser="iterparse"')
+
+def annotationSummary(annotation):
+    return (annotation.text, annotation.start, annotation.end, annotation.annotator, annotation.annotationId,
+            annotation.attributes, annotation.annotationClass, annotation.creationDate)
+
+def adjudicationSummary(status):
+    if status is None:
+        return None
+    return (status.overlapping, status.attributes, status.relationship, status.adjudicationClass, status.comment)
+
+knowtatorPaths = glob.glob('./UnitTestDependencies/*/*/*/saved/*.knowtator.xml')
+for knowtatorPath in knowtatorPaths:
+    treeDocument = KnowtatorReader.parseSingleKnowtatorFile(knowtatorPath)
+    iterparseDocument = KnowtatorReader.parseSingleKnowtatorFile(knowtatorPath, parser="iterparse")
+    if treeDocument.documentName != iterparseDocument.documentName \
+            or treeDocument.numberOfCharacters != iterparseDocument.numberOfCharacters \
+            or adjudicationSummary(treeDocument.adjudicationStatus) != adjudicationSummary(iterparseDocument.adjudicationStatus) \
+            or map(annotationSummary, treeDocument.annotations) != map(annotationSummary, iterparseDocument.annotations):
+        failed = True
+if len(knowtatorPaths) == 0:
+    failed = True
+
+if failed:
+    failCount += 1
+    print failedColor + '*****************Test Failed***************************\n' + resetColor
+else:
+    print passedColor + "Passed\n" + resetColor
+
+
+#### Test eHostInterface.KnowtatorReader.iterKnowtatorFiles() ####
+failed = False
+printTestName("Testing eHostInterface.KnowtatorReader.iterKnowtatorFiles()")
+
+knowtatorDirs = ['./UnitTestDependencies/Output/ComparisonsToTSV/annotator1/saved',
+                 './UnitTestDependencies/Output/ComparisonsToTSV/annotator2/saved',
+                 './UnitTestDependencies/eHostInterface/OriginalLengthandParseSingle/saved']
+parsedDocuments = KnowtatorReader.parseMultipleKnowtatorFiles(knowtatorDirs)
+searchDirDocuments = KnowtatorReader.parseMultipleKnowtatorFiles(knowtatorDirs[:2], ['./UnitTestDependencies/Output/ComparisonsToTSV/annotator1/corpus'])
+if [document.numberOfCharacters for document in searchDirDocuments] != [document.numberOfCharacters for document in parsedDocuments[:2]]:
+    failed = True
+for prefetch in [0, 1, 5]:
+    iteratedDocuments = list(KnowtatorReader.iterKnowtatorFiles(knowtatorDirs, prefetch=prefetch))
+    if len(iteratedDocuments) != len(parsedDocuments):
+        failed = True
+        continue
+    for parsedDocument, iteratedDocument in zip(parsedDocuments, iteratedDocuments):
+        if parsedDocument.documentName != iteratedDocument.documentName \
+                or parsedDocument.numberOfCharacters != iteratedDocument.numberOfCharacters \
+                or len(parsedDocument.annotations) != len(iteratedDocument.annotations):
+            failed = True
+
+# Parsing with multiple workers should return the same documents in the same order.
+for workers, chunkSize in [(2, None), (3, 1)]:
+    workerDocuments = KnowtatorReader.parseMultipleKnowtatorFiles(knowtatorDirs, workers=workers, chunkSize=chunkSize)
+    if [document.documentName for document in workerDocuments] != [document.documentName for document in parsedDocuments] \
+            or [len(document.annotations) for document in workerDocuments] != [len(document.annotations) for document in parsedDocuments]:
+        failed = True
+
+# A file that fails to parse is reported in 'failures' along with its traceback, and the other documents are kept,
+# whether or not workers are used. With onError="raise" the parsing error is raised instead.
+from xml.etree.ElementTree import ParseError
+badFilePath = './UnitTestDependencies/Output/ComparisonsToTSV/annotator1/corpus/2530.txt'
+for workers in [1, 2]:
+    collectedDocuments = KnowtatorReader.parseMultipleKnowtatorFiles(knowtatorDirs + [os.path.dirname(badFilePath)], workers=workers)
+    if [document.documentName for document in collectedDocuments] != [document.documentName for document in parsedDocuments] \
+            or len(collectedDocuments.failures) != 1 \
+            or collectedDocuments.failures[0][0] != badFilePath \
+            or "ParseError" not in collectedDocuments.failures[0][1]:
+        failed = True
+    try:
+        KnowtatorReader.parseMultipleKnowtatorFiles(knowtatorDirs + [os.path.dirname(badFilePath)], workers=workers, onError="raise")
+        failed = True
+    except ParseError:
+        pass
+
+for workers, chunkSize, onError in [(0, None, "collect"), (2, 0, "collect"), (2, -1, "collect"), (1, None, "ignore")]:
+    try:
+        KnowtatorReader.parseMultipleKnowtatorFiles(knowtatorDirs, workers=workers, chunkSize=chunkSize, onError=onError)
+        failed = True
+    except ValueError:
+        pass
+
+# Parsing errors should surface when the failing document is reached.
+gotException = False
+try:
+    list(KnowtatorReader.iterKnowtatorFiles(['./UnitTestDependencies/Output/ComparisonsToTSV/annotator1/corpus'], prefetch=2))
+except Exception:
+    gotException = True
+if not gotException:
+    failed = True
+
+# Exceptions that are not Exceptions must also reach the consumer rather than leaving it waiting forever.
+import threading
+originalParseSingleKnowtatorFile = KnowtatorReader.__dict__["parseSingleKnowtatorFile"]
+def exitingParse(*args):
+    raise SystemExit("Stopped while parsing.")
+KnowtatorReader.parseSingleKnowtatorFile = staticmethod(exitingParse)
+prefetchOutcome = []
+def consumePrefetched():
+    try:
+        list(KnowtatorReader.iterKnowtatorFiles(knowtatorDirs, prefetch=2))
+    except SystemExit:
+        prefetchOutcome.append("SystemExit")
+consumerThread = threading.Thread(target=consumePrefetched)
+consumerThread.daemon = True
+try:
+    consumerThread.start()
+    consumerThread.join(10)
+finally:
+    KnowtatorReader.parseSingleKnowtatorFile = originalParseSingleKnowtatorFile
+if prefetchOutcome != ["SystemExit"]:
+    failed = True
+
+if failed:
+    failCount += 1
+    print failedColor + '*****************Test Failed***************************\n' + resetColor
+else:
+    print passedColor + "Passed\n" + resetColor
+
+
 #### Test path cleaner, turns path strings into glob-able directory strings. ####
 from eHostess.Utilities.utilities import cleanDirectoryList as cleaner
 
@@ -96,6 +235,43 @@ for dirName in cleanDirs:
 if not failed:
     print passedColor + "Passed\n" + resetColor
 
+#### Test the worker pool helpers in Utilities ####
+from eHostess.Utilities.utilities import resolveWorkers, runInPool, iterInPool
+
+printTestName('Testing Utilities.runInPool() and Utilities.iterInPool()')
+failed = False
+# Results come back in the order of the arguments whatever the number of workers or the chunk size.
+poolArguments = range(-50, 50)
+for workers, chunkSize in [(1, None), (2, None), (3, 1), (None, 7)]:
+    if runInPool(abs, poolArguments, workers, chunkSize) != map(abs, poolArguments):
+        failed = True
+if runInPool(abs, [], 2) != []:
+    failed = True
+# Closing the generator before it is exhausted stops the pool rather than leaving it running.
+poolResults = iterInPool(abs, poolArguments, 2, 1)
+if next(poolResults) != 50:
+    failed = True
+poolResults.close()
+if resolveWorkers(None) < 1 or resolveWorkers(3, 5) != 3:
+    failed = True
+for workers, chunkSize in [(0, None), (-1, None), (2, 0), (2, -1)]:
+    try:
+        resolveWorkers(workers, chunkSize)
+        failed = True
+    except ValueError:
+        pass
+    try:
+        runInPool(abs, poolArguments, workers, chunkSize)
+        failed = True
+    except ValueError:
+        pass
+
+if failed:
+    failCount += 1
+    print failedColor + '*****************Test Failed***************************\n' + resetColor
+else:
+    print passedColor + "Passed\n" + resetColor
+
 #### Test annotation overlap MentionLevelAnnotation.overlap() ####
 printTestName('Testing MentionLevelAnnotation.overlap()')
 failed = False
@@ -202,6 +378,48 @@ for note in [noteBody1, noteBody2]:
     if reconstructedNote != note:
         failed = True
         break
+
+# alignSentence() should return contiguous spans that match the note text.
+for note in [noteBody1, noteBody2]:
+    reconstructor.startNewNote(note)
+    previousEnd = 0
+    for sentence in Splitter().splitSentences(note):
+        spanStart, spanEnd, originalText = reconstructor.alignSentence(sentence)
+        if spanStart != previousEnd or note[spanStart:spanEnd] != originalText:
+            failed = True
+        previousEnd = spanEnd
+
+# A short sentence that also appears inside an earlier sentence must get its own span.
+reconstructor.startNewNote("one four three. four")
+reconstructor.alignSentence("one four three.")
+if reconstructor.alignSentence("four") != (15, 20, " four"):
+    failed = True
+
+if failed:
+    failCount += 1
+    print failedColor + '*****************Test Failed***************************\n' + resetColor
+else:
+    print passedColor + "Passed\n" + resetColor
+
+#### Test PyConTextInterface.SentenceRepeatManager ####
+from PyConTextInterface.SentenceRepeatManager import SentenceRepeatManager
+printTestName('Testing PyConTextInterface.SentenceRepeatManager.SentenceRepeatManager()')
+
+failed = False
+repeatManager = SentenceRepeatManager("No bleed. Pain (3/10). No bleed. No bleed. Pain (3/10).")
+spans = [repeatManager.determineSpan(sentence) for sentence in
+         ["No bleed.", "Pain (3/10).", "No bleed.", "No bleed.", "Pain (3/10)."]]
+if spans != [(0, 9), (10, 22), (23, 32), (33, 42), (43, 55)]:
+    failed = True
+try:
+    repeatManager.determineSpan("No bleed.")
+    failed = True
+except RuntimeError:
+    pass
+repeatManager.startNewNote("Pain (3/10).")
+if repeatManager.determineSpan("Pain (3/10).") != (0, 12):
+    failed = True
+
 if failed:
     failCount += 1
     print failedColor + '*****************Test Failed***************************\n' + resetColor
@@ -288,12 +506,197 @@ else:
     if not isinstance(pyConTextInput['TestDocToSplit'], list) or not isinstance(pyConTextInput['TestDocToSplit2'], list):
         failed = True
 
+    # scanMode="prefilter" should produce exactly the same sentences as the default scan.
+    def summarizeSplit(splitInput):
+        return sorted((key, None) if isinstance(splitInput[key], DocumentPlaceholder) else
+                      (key, [(sentence.text, sentence.documentSpan, sentence.documentLength, sentence.targetRegex)
+                             for sentence in splitInput[key]]) for key in splitInput.keys())
+
+    defaultTargets = itemData.instantiateFromCSVtoitemData(os.path.join(os.getcwd(), "./PyConTextInterface/TargetsAndModifiers/targets.tsv"))
+    for scanTargets in [targets, defaultTargets]:
+        if summarizeSplit(splitSentencesMultipleDocuments(testDirPath, scanTargets, 4, 4, scanMode="prefilter")) \
+                != summarizeSplit(splitSentencesMultipleDocuments(testDirPath, scanTargets, 4, 4)):
+            failed = True
+    # Targets with inline flags cannot be combined into one pattern, but should still be found.
+    flaggedTargets = itemData.itemData(['flagged', 'TARGET', '(?x) hem orr hage', 'backward'])
+    if summarizeSplit(splitSentencesSingleDocument(testDocPath, flaggedTargets, 4, 4, scanMode="prefilter")) \
+            != summarizeSplit(splitSentencesSingleDocument(testDocPath, flaggedTargets, 4, 4)) \
+            or isinstance(splitSentencesSingleDocument(testDocPath, flaggedTargets, 4, 4)['TestDocToSplit'], DocumentPlaceholder):
+        failed = True
+    # Targets with backreferences cannot be combined either. Targets that only occur inside the match of another target
+    # must still be found, as must targets spread over several prefilter patterns.
+    from eHostess.PyConTextInterface.SentenceSplitters.TargetSpanSplitter import CompiledTargetSpanSplitter
+    scanText = "the patient has a history of gi bleed and an aba pattern"
+    scanTargetLists = [itemData.itemData(['first', 'TARGET', r'(?P<letter>x)y(?P=letter)', 'backward'],
+                                         ['second', 'TARGET', r'(?P<letter>a)b(?P=letter)', 'backward']),
+                       itemData.itemData(['filler', 'TARGET', r'(filler)', 'backward'], ['second', 'TARGET', r'(?P<letter>a)b(?P=letter)', 'backward']),
+                       itemData.itemData(['long', 'TARGET', r'gi\s+bleed', 'backward'], ['short', 'TARGET', r'bleed', 'backward'],
+                                         ['same start', 'TARGET', r'history', 'backward'], ['prefix', 'TARGET', r'hist', 'backward']),
+                       itemData.itemData(*[['filler%i' % index, 'TARGET', r'(filler)(%i)' % index, 'backward'] for index in range(60)]
+                                         + [['last', 'TARGET', r'aba', 'backward']])]
+    for scanTargets in scanTargetLists:
+        perTargetSplit = summarizeSplit(CompiledTargetSpanSplitter(scanTargets, 4, 4).splitText(scanText, 'ScanDoc'))
+        if perTargetSplit == [('ScanDoc', None)] \
+                or summarizeSplit(CompiledTargetSpanSplitter(scanTargets, 4, 4, scanMode="prefilter").splitText(scanText, 'ScanDoc')) != perTargetSplit:
+            failed = True
+    if len(summarizeSplit(CompiledTargetSpanSplitter(scanTargetLists[2], 4, 4, scanMode="prefilter").splitText(scanText, 'ScanDoc'))[0][1]) != 4:
+        failed = True
+    try:
+        splitSentencesSingleDocument(testDocPath, targets, 4, 4, scanMode="combined")
+        failed = True
+    except ValueError:
+        pass
+
+    # A CompiledTargetSpanSplitter can be reused across documents and raw strings.
+    for scanMode in ["perTarget", "prefilter"]:
+        compiledSplitter = CompiledTargetSpanSplitter(targets, 4, 4, scanMode=scanMode)
+        for repeat in range(2):
+            if summarizeSplit(compiledSplitter.splitSentencesMultipleDocuments(testDirPath)) \
+                    != summarizeSplit(splitSentencesMultipleDocuments(testDirPath, targets, 4, 4)):
+                failed = True
+        with open(testDocPath, 'rU') as testDocFile:
+            testDocText = testDocFile.read()
+        if summarizeSplit(compiledSplitter.splitText(testDocText, 'TestDocToSplit')) \
+                != summarizeSplit(splitSentencesSingleDocument(testDocPath, targets, 4, 4)):
+            failed = True
+        if not isinstance(compiledSplitter.splitText('nothing to see here', 'EmptyDoc')['EmptyDoc'], DocumentPlaceholder):
+            failed = True
+    if not isinstance(splitSentencesSingleDocument(testDirPath + '/TestDocToSplit3.txt', targets, 4, 4)['TestDocToSplit3'], DocumentPlaceholder):
+        failed = True
+
+    # Splitting with multiple workers should add the same sentences, and placeholders, in the same order.
+    serialSplit = splitSentencesMultipleDocuments(testDirPath, targets, 4, 4)
+    for workers, chunkSize in [(2, None), (3, 1)]:
+        workerSplit = splitSentencesMultipleDocuments(testDirPath, targets, 4, 4, workers=workers, chunkSize=chunkSize)
+        if workerSplit.keys() != serialSplit.keys() or summarizeSplit(workerSplit) != summarizeSplit(serialSplit) \
+                or not isinstance(workerSplit['TestDocToSplit3'], DocumentPlaceholder):
+            failed = True
+    for workers, chunkSize in [(0, None), (2, 0), (2, -1)]:
+        try:
+            splitSentencesMultipleDocuments(testDirPath, targets, 4, 4, workers=workers, chunkSize=chunkSize)
+            failed = True
+        except ValueError:
+            pass
+
     if failed:
         failCount += 1
         print failedColor + '*****************Test Failed***************************\n' + resetColor
     else:
         print passedColor + "Passed\n" + resetColor
 
+#### Test PyConTextInterface.SentenceSplitters.SpacySplitter ####
+# spaCy is replaced by a fake pipeline, so these tests check how the splitter drives the pipeline rather than spaCy's
+# sentence boundaries.
+printTestName('Testing PyConTextInterface.SentenceSplitters.SpacySplitter')
+import eHostess.PyConTextInterface.SentenceSplitters.SpacySplitter as SpacySplitter
+import threading
+import re
+nlpLoadedAtImport = SpacySplitter._nlp is not None
+
+class FakeSpan:
+    def __init__(self, text, start, end):
+        self.text = text
+        self.start_char = start
+        self.end_char = end
+
+class FakeDoc:
+    def __init__(self, text):
+        self.sents = [FakeSpan(match.group(), match.start(), match.end()) for match in re.finditer(r'[^.]+\.?', text)]
+
+class FakePipeline:
+    def __init__(self, modelName):
+        self.modelName = modelName
+        self.pipe_names = ["tagger", "parser", "ner"]
+        self.pipeCalls = []
+
+    def __call__(self, text):
+        return FakeDoc(text)
+
+    def pipe(self, stream, **pipeArguments):
+        self.pipeCalls.append(pipeArguments)
+        for text, context in stream:
+            yield FakeDoc(text), context
+
+loadedModels = []
+def fakeLoadPipeline(modelName):
+    loadedModels.append(modelName)
+    return FakePipeline(modelName)
+
+originalLoadPipeline = SpacySplitter._loadPipeline
+SpacySplitter._loadPipeline = fakeLoadPipeline
+SpacySplitter.setModel()
+
+failed = False
+# Importing the module must not load a pipeline.
+if nlpLoadedAtImport:
+    failed = True
+spacyDocPaths = sorted(glob.glob("./UnitTestDependencies/PyConText/SentenceSplitters/*/Docs/*.txt"))
+
+def summarizeSpacySplit(splitInput):
+    return sorted((key, [(sentence.text, sentence.documentSpan, sentence.documentName, sentence.documentLength)
+                         for sentence in splitInput[key]]) for key in splitInput.keys())
+
+try:
+    unbatchedSplit = summarizeSpacySplit(SpacySplitter.splitSentencesMultipleDocuments(spacyDocPaths))
+    if len(unbatchedSplit) != len(set([os.path.basename(path) for path in spacyDocPaths])) \
+            or SpacySplitter.getNlp().pipeCalls != []:
+        failed = True
+
+    # Batching must give the same sentences, and only pass n_process to nlp.pipe() when it is needed.
+    for batchSize, workers, expectedArguments in [
+            (2, 1, {"as_tuples": True, "batch_size": 2, "disable": ["tagger", "ner"]}),
+            (1, 3, {"as_tuples": True, "batch_size": 1, "disable": ["tagger", "ner"], "n_process": 3})]:
+        nlp = SpacySplitter.getNlp()
+        nlp.pipeCalls = []
+        if summarizeSpacySplit(SpacySplitter.splitSentencesMultipleDocuments(spacyDocPaths, batchSize, workers)) != unbatchedSplit:
+            failed = True
+        if nlp.pipeCalls != [expectedArguments]:
+            failed = True
+
+    # Components that are not in the pipeline are not disabled.
+    nlp.pipe_names = ["sentencizer"]
+    nlp.pipeCalls = []
+    SpacySplitter.splitSentencesMultipleDocuments(spacyDocPaths, batchSize=4)
+    if nlp.pipeCalls != [{"as_tuples": True, "batch_size": 4, "disable": []}]:
+        failed = True
+
+    for batchSize, workers in [(0, 1), (-1, 1), (2, 0), (2, -1)]:
+        try:
+            SpacySplitter.splitSentencesMultipleDocuments(spacyDocPaths, batchSize, workers)
+            failed = True
+        except ValueError:
+            pass
+
+    # The pipeline is loaded lazily, only once, and again after setModel() chooses a different one.
+    SpacySplitter.setModel("sentencizer")
+    del loadedModels[:]
+    if SpacySplitter._nlp is not None:
+        failed = True
+    loaderThreads = [threading.Thread(target=SpacySplitter.getNlp) for index in range(8)]
+    for thread in loaderThreads:
+        thread.start()
+    for thread in loaderThreads:
+        thread.join()
+    nlp = SpacySplitter.getNlp()
+    SpacySplitter.splitSentencesRawString("One. Two.", "rawString")
+    if loadedModels != ["sentencizer"] or nlp.modelName != "sentencizer" or SpacySplitter.getNlp() is not nlp:
+        failed = True
+    SpacySplitter.setModel()
+    if SpacySplitter._nlp is not None or loadedModels != ["sentencizer"]:
+        failed = True
+    if SpacySplitter.getNlp().modelName != SpacySplitter.defaultModel or loadedModels != ["sentencizer", SpacySplitter.defaultModel]:
+        failed = True
+finally:
+    SpacySplitter._loadPipeline = originalLoadPipeline
+    SpacySplitter.setModel()
+print ""
+
+if failed:
+    failCount += 1
+    print failedColor + '*****************Test Failed***************************\n' + resetColor
+else:
+    print passedColor + "Passed\n" + resetColor
+
 #### Test PyConTextInterface.PyConText.AnnotateSentences() ####
 printTestName('Testing PyConTextInterface.PyConText.AnnotateSingleDocument()')
 from eHostess.PyConTextInterface.PyConText import PyConTextInterface
@@ -371,6 +774,45 @@ if failed:
 else:
     print passedColor + "Passed\n" + resetColor
 
+#### Test PyConTextInterface.PyConText.PerformAnnotation() with workers ####
+printTestName('Testing PyConTextInterface.PyConText.PerformAnnotation() with workers and IterPerformAnnotation()')
+
+failed = False
+
+def summarizeDocuments(documentList):
+    return [(document.documentName, document.numberOfCharacters,
+             [(annotation.annotationId, annotation.start, annotation.end, annotation.annotationClass)
+              for annotation in document.annotations]) for document in documentList]
+
+serialDocuments = PyConTextInterface.PerformAnnotation(sentences)
+parallelDocuments = PyConTextInterface.PerformAnnotation(sentences, workers=2)
+if summarizeDocuments(serialDocuments) != summarizeDocuments(parallelDocuments):
+    failed = True
+if summarizeDocuments(PyConTextInterface.PerformAnnotation(sentences, workers=3, chunkSize=1)) \
+        != summarizeDocuments(serialDocuments):
+    failed = True
+
+for workers, chunkSize in [(0, None), (2, 0), (2, -1)]:
+    try:
+        PyConTextInterface.PerformAnnotation(sentences, workers=workers, chunkSize=chunkSize)
+        failed = True
+    except ValueError:
+        pass
+
+#### Test PyConTextInterface.PyConText.IterPerformAnnotation() ####
+# The generator should yield the same documents in input order, from either a PyConTextInput or a stream of pairs.
+streamedDocuments = PyConTextInterface.IterPerformAnnotation((name, sentences[name]) for name in sentences.keys())
+if summarizeDocuments(streamedDocuments) != summarizeDocuments(serialDocuments):
+    failed = True
+if summarizeDocuments(PyConTextInterface.IterPerformAnnotation(sentences)) != summarizeDocuments(serialDocuments):
+    failed = True
+
+if failed:
+    failCount += 1
+    print failedColor + '*****************Test Failed***************************\n' + resetColor
+else:
+    print passedColor + "Passed\n" + resetColor
+
 
 #### Test PyConTextInterface.PyConText.AnnotateSentences() ability to Remove Duplicate Annotations####
 printTestName('Testing PyConTextInterface.PyConText.AnnotateSingleDocument() ability to Remove Duplicate Annotations.')
@@ -396,13 +838,130 @@ if failed:
 else:
     print passedColor + "Passed\n" + resetColor
 
+#### Test PyConTextInterface.PyConText.loadRules() cache ####
+printTestName('Testing PyConTextInterface.PyConText.loadRules() cache')
+from eHostess.PyConTextInterface.PyConText import loadRules, clearRuleCache
+import shutil
+
+failed = False
+
+ruleCacheDir = tempfile.mkdtemp()
+cachedTargetsPath = os.path.join(ruleCacheDir, 'targets.tsv')
+shutil.copy("./UnitTestDependencies/PyConText/RemoveDuplicateAnnotations/testTargets.tsv", cachedTargetsPath)
+
+firstRules = loadRules(cachedTargetsPath)
+if loadRules(cachedTargetsPath) is not firstRules:
+    failed = True
+if loadRules(cachedTargetsPath, useCache=False) is firstRules:
+    failed = True
+
+# A changed file should be read again.
+fileStat = os.stat(cachedTargetsPath)
+os.utime(cachedTargetsPath, (fileStat.st_atime, fileStat.st_mtime + 10))
+secondRules = loadRules(cachedTargetsPath)
+if secondRules is firstRules or len(secondRules) != len(firstRules):
+    failed = True
+
+# Explicit invalidation.
+clearRuleCache(cachedTargetsPath)
+if loadRules(cachedTargetsPath) is secondRules:
+    failed = True
+clearRuleCache()
+
+cachedDocument = PyConTextInterface.PerformAnnotation(sentences)
+uncachedDocument = PyConTextInterface.PerformAnnotation(sentences, useRuleCache=False)
+if [annotation.annotationClass for annotation in cachedDocument.annotations] != [annotation.annotationClass for annotation in uncachedDocument.annotations]:
+    failed = True
+
+shutil.rmtree(ruleCacheDir)
+
+if failed:
+    failCount += 1
+    print failedColor + '*****************Test Failed***************************\n' + resetColor
+else:
+    print passedColor + "Passed\n" + resetColor
+
+#### Test PyConTextInterface.SentenceResultCache ####
+printTestName('Testing PyConTextInterface.SentenceResultCache')
+from eHostess.PyConTextInterface.SentenceResultCache import SentenceResultCache
+
+failed = False
+
+# The documents in this directory share their sentences in different orders, so the cache must re-anchor them.
+multipleDocumentSentences = splitBuiltinMultiple(directories)
+uncachedDocuments = summarizeDocuments(PyConTextInterface.PerformAnnotation(multipleDocumentSentences))
+sentenceCache = SentenceResultCache()
+if summarizeDocuments(PyConTextInterface.PerformAnnotation(multipleDocumentSentences, sentenceCache=sentenceCache)) != uncachedDocuments:
+    failed = True
+if sentenceCache.hits == 0 or len(sentenceCache) != sentenceCache.misses:
+    failed = True
+misses = sentenceCache.misses
+if summarizeDocuments(PyConTextInterface.IterPerformAnnotation(multipleDocumentSentences, sentenceCache=sentenceCache)) != uncachedDocuments \
+        or sentenceCache.misses != misses:
+    failed = True
+
+# The rule sets are hashed once per call rather than once per document.
+import eHostess.PyConTextInterface.PyConText as pyConTextModule
+originalHashRules = pyConTextModule.hashRules
+hashedRules = []
+def countingHashRules(rules):
+    hashedRules.append(rules)
+    return originalHashRules(rules)
+pyConTextModule.hashRules = countingHashRules
+try:
+    PyConTextInterface.PerformAnnotation(multipleDocumentSentences, sentenceCache=sentenceCache)
+    list(PyConTextInterface.IterPerformAnnotation(multipleDocumentSentences, sentenceCache=sentenceCache))
+finally:
+    pyConTextModule.hashRules = originalHashRules
+if len(multipleDocumentSentences.keys()) < 2 or len(hashedRules) != 4:
+    failed = True
+
+# Save and reload.
+sentenceCacheDir = tempfile.mkdtemp()
+sentenceCachePath = os.path.join(sentenceCacheDir, 'sentenceCache.json')
+sentenceCache.save(sentenceCachePath)
+loadedCache = SentenceResultCache(cachePath=sentenceCachePath)
+if len(loadedCache) != len(sentenceCache):
+    failed = True
+if summarizeDocuments(PyConTextInterface.PerformAnnotation(multipleDocumentSentences, sentenceCache=loadedCache)) != uncachedDocuments \
+        or loadedCache.misses != 0:
+    failed = True
+shutil.rmtree(sentenceCacheDir)
+
+# The least recently used entries are dropped once the cache is full.
+smallCache = SentenceResultCache(maxSize=2)
+smallCache.put('a', 't', 'm', [])
+smallCache.put('b', 't', 'm', [])
+smallCache.get('a', 't', 'm')
+smallCache.put('c', 't', 'm', [])
+if len(smallCache) != 2 or smallCache.get('b', 't', 'm') is not None or smallCache.get('a', 't', 'm') is None:
+    failed = True
+
+# The cache can be pickled, e.g. to send it to worker processes that are not forked, and the copy has its own lock.
+import cPickle
+pickledCache = cPickle.loads(cPickle.dumps(smallCache, cPickle.HIGHEST_PROTOCOL))
+pickledCache.put('d', 't', 'm', [])
+if pickledCache._lock is smallCache._lock or pickledCache.get('a', 't', 'm') != () or len(pickledCache) != 2 \
+        or smallCache.get('d', 't', 'm') is not None:
+    failed = True
+
+if pyConTextModule.AnnotationTrio._fields != ('node', 'sentence', 'annotation'):
+    failed = True
+
+if failed:
+    failCount += 1
+    print failedColor + '*****************Test Failed***************************\n' + resetColor
+else:
+    print passedColor + "Passed\n" + resetColor
+
 #### Test Analysis.Output.ConvertComparisonsToTSV() ####
 printTestName('Testing Analysis.Output.ConvertComparisonsToTSV()')
 # !!!!! This test doesn't really verify anything except that ConvertComparisonToTSV() doesn't raise any exceptions.
 # To verify that the method is working correctly it is currently necessary to check the output file located at
 # ./UnitTestDependencies/Output/ComparisonsToTSV/TestOutput/discrepancies.tsv
 from eHostess.Analysis.Output import ConvertComparisonsToTSV
-from eHostess.Analysis.DocumentComparison import Comparison
+from eHostess.Analysis.DocumentComparison import Comparison, ComparisonResults
+from eHostess.Annotations.MentionLevelAnnotation import MentionLevelAnnotation
 
 failed = False
 
@@ -414,6 +973,182 @@ doc2 = KnowtatorReader.parseSingleKnowtatorFile(
 discrepancies = Comparison.CompareAllAnnotations(doc1, doc2)
 ConvertComparisonsToTSV(discrepancies, './UnitTestDependencies/Output/ComparisonsToTSV/TestOutput/discrepancies.tsv')
 
+# The gzip output and the output of a writer with a tiny buffer must contain the same bytes as the plain output.
+from eHostess.Analysis.Output import ComparisonTSVWriter
+import gzip
+tsvDir = tempfile.mkdtemp()
+ConvertComparisonsToTSV(discrepancies, os.path.join(tsvDir, 'discrepancies.tsv.gz'), compression="gzip")
+with ComparisonTSVWriter(os.path.join(tsvDir, 'buffered.tsv'), 'TestAnnotator1', 'TestAnnotator2', bufferSize=10) as writer:
+    writer.writeComparisons(discrepancies)
+with open('./UnitTestDependencies/Output/ComparisonsToTSV/TestOutput/discrepancies.tsv', 'rb') as tsvFile:
+    plainBytes = tsvFile.read()
+gzipFile = gzip.open(os.path.join(tsvDir, 'discrepancies.tsv.gz'), 'rb')
+if gzipFile.read() != plainBytes:
+    failed = True
+gzipFile.close()
+with open(os.path.join(tsvDir, 'buffered.tsv'), 'rb') as tsvFile:
+    if tsvFile.read() != plainBytes:
+        failed = True
+if len(plainBytes.splitlines()) != len(discrepancies) + 1:
+    failed = True
+
+# Separator characters in the annotation text are replaced with four spaces.
+separatorComparison = Comparison("doc", ComparisonResults["5"], MentionLevelAnnotation("a\tb\nc", 0, 5, "A", "id", {}, "bleeding_present"),
+                                 MentionLevelAnnotation(u"a\rb", 0, 4, "B", "id", {}, "bleeding_present"), docLength=10)
+with ComparisonTSVWriter(os.path.join(tsvDir, 'separators.tsv'), 'A', 'B') as writer:
+    writer.writeComparison(separatorComparison)
+with open(os.path.join(tsvDir, 'separators.tsv'), 'rb') as tsvFile:
+    if tsvFile.read().splitlines()[1].split('\t')[1:3] != ['"a    b    c"', '"a    b"']:
+        failed = True
+
+gotException = False
+try:
+    ComparisonTSVWriter(os.path.join(tsvDir, 'bad.tsv'), 'A', 'B', compression="bz2")
+except ValueError:
+    gotException = True
+if not gotException:
+    failed = True
+shutil.rmtree(tsvDir)
+
+if failed:
+    failCount += 1
+    print failedColor + '*****************Test Failed***************************\n' + resetColor
+else:
+    print passedColor + "Passed\n" + resetColor
+
+#### Test Analysis.ColumnarOutput ####
+printTestName('Analysis.ColumnarOutput')
+from eHostess.Analysis.ColumnarOutput import ExportComparisons, ExportAnnotations, LoadNpyExport, ColumnToList
+from eHostess.Analysis.ColumnarOutput import CategoryColumn, StringColumn, IntegerColumn
+import numpy as np
+from eHostess.Annotations.Document import Document, ClassifiedDocument
+import json
+import sys
+failed = False
+
+columnarDir = tempfile.mkdtemp()
+comparisonsPath = os.path.join(columnarDir, 'comparisons')
+if ExportComparisons(discrepancies, comparisonsPath, fileFormat="npy") != "npy":
+    failed = True
+loadedColumns = LoadNpyExport(comparisonsPath)
+comparisonColumns = dict((name, ColumnToList(column)) for name, column in loadedColumns.iteritems())
+if len(comparisonColumns["documentName"]) != len(discrepancies):
+    failed = True
+for index, comparison in enumerate(discrepancies):
+    if comparisonColumns["comparisonResult"][index] != comparison.comparisonResult \
+            or comparisonColumns["docLength"][index] != comparison.docLength:
+        failed = True
+    for prefix, annotation in [("annotation1", comparison.annotation1), ("annotation2", comparison.annotation2)]:
+        if annotation is None:
+            if comparisonColumns[prefix + "Text"][index] is not None or comparisonColumns[prefix + "Start"][index] is not None:
+                failed = True
+            continue
+        if comparisonColumns[prefix + "Text"][index] != annotation.text or comparisonColumns[prefix + "Start"][index] != annotation.start \
+                or comparisonColumns[prefix + "End"][index] != annotation.end or comparisonColumns[prefix + "Class"][index] != annotation.annotationClass \
+                or comparisonColumns[prefix + "Annotator"][index] != annotation.annotator \
+                or json.loads(comparisonColumns[prefix + "Attributes"][index]) != annotation.attributes:
+            failed = True
+
+# The columns are memory-mapped arrays, and dictionary encoded columns store each distinct value once.
+annotatorColumn = loadedColumns["annotation1Annotator"]
+if not isinstance(annotatorColumn, CategoryColumn) or not isinstance(annotatorColumn.codes, np.memmap) \
+        or annotatorColumn.categories != ["TestAnnotator1"] or annotatorColumn.codes.dtype != np.int8:
+    failed = True
+if not isinstance(loadedColumns["annotation1Text"], StringColumn) or not isinstance(loadedColumns["annotation1Text"].data, np.memmap) \
+        or not isinstance(loadedColumns["docLength"], IntegerColumn) or loadedColumns["docLength"].valid is not None:
+    failed = True
+if isinstance(LoadNpyExport(comparisonsPath, mmapMode=None)["docLength"].values, np.memmap):
+    failed = True
+# Exporting again to the same directory replaces the export. The validity array of the first export must not be read
+# once no value is missing, and the arrays mapped from the first export must remain readable.
+reexportPath = os.path.join(columnarDir, 'reexport')
+ExportComparisons([comparison for comparison in discrepancies if comparison.annotation2 is None], reexportPath, fileFormat="npy")
+firstExport = LoadNpyExport(reexportPath)
+completeComparisons = [comparison for comparison in discrepancies if comparison.annotation2 is not None]
+ExportComparisons(completeComparisons, reexportPath, fileFormat="npy")
+if ColumnToList(firstExport["annotation2Start"]) != [None] \
+        or ColumnToList(LoadNpyExport(reexportPath)["annotation2Start"]) != [comparison.annotation2.start for comparison in completeComparisons]:
+    failed = True
+
+annotationsPath = os.path.join(columnarDir, 'annotations')
+classifiedDoc2 = ClassifiedDocument.CreateFromDocument(doc2, u"positive \u2713")
+ExportAnnotations([doc1, classifiedDoc2], annotationsPath, fileFormat="npy")
+annotationColumns = LoadNpyExport(annotationsPath)
+exportedAnnotations = doc1.annotations + doc2.annotations
+if ColumnToList(annotationColumns["text"]) != [annotation.text for annotation in exportedAnnotations] \
+        or ColumnToList(annotationColumns["start"]) != [annotation.start for annotation in exportedAnnotations] \
+        or ColumnToList(annotationColumns["documentClass"]) != [None] * len(doc1.annotations) + [u"positive \u2713"] * len(doc2.annotations):
+    failed = True
+
+# An empty export can be loaded.
+ExportAnnotations([], annotationsPath, fileFormat="npy")
+if [len(ColumnToList(column)) for column in LoadNpyExport(annotationsPath).values()] != [0] * len(annotationColumns):
+    failed = True
+
+# Attribute dictionaries that compare equal but hold values of different types must keep their own JSON.
+attributeValues = [1, True, 1.0, "1", u"1", {"nested": 1}, {"nested": True}, [1], "1"]
+attributeDocument = Document("AttributeDoc", "MIMC_v2", [MentionLevelAnnotation("text", 0, 4, "annotator", "id%i" % index, {"value": value})
+                                                         for index, value in enumerate(attributeValues)], 100)
+attributesPath = os.path.join(columnarDir, 'attributes')
+ExportAnnotations([attributeDocument], attributesPath, fileFormat="npy")
+if ColumnToList(LoadNpyExport(attributesPath)["attributes"]) != [json.dumps({"value": value}, sort_keys=True) for value in attributeValues]:
+    failed = True
+
+gotException = False
+try:
+    ExportComparisons(discrepancies, os.path.join(columnarDir, 'comparisons.csv'), fileFormat="csv")
+except ValueError:
+    gotException = True
+if not gotException:
+    failed = True
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+    pyarrowInstalled = True
+except ImportError:
+    pyarrowInstalled = False
+
+if pyarrowInstalled:
+    # The Parquet and Arrow IPC files must hold the same values as the npy export, with nulls for missing values.
+    for fileFormat in ["parquet", "arrow"]:
+        path = os.path.join(columnarDir, 'comparisons.' + fileFormat)
+        ExportComparisons(discrepancies, path, fileFormat=fileFormat)
+        if fileFormat == "parquet":
+            table = pyarrow.parquet.read_table(path)
+        else:
+            table = pyarrow.ipc.open_file(pyarrow.memory_map(path, 'r')).read_all()
+        if table.schema.names != loadedColumns.keys() \
+                or dict(table.to_pydict()) != dict((name, ColumnToList(column)) for name, column in loadedColumns.iteritems()):
+            failed = True
+        if table.schema.field_by_name("annotation1Class").type != pyarrow.dictionary(pyarrow.int32(), pyarrow.string()) \
+                or table.schema.field_by_name("annotation1Start").type != pyarrow.int64() \
+                or table.column("annotation2Text").null_count != comparisonColumns["annotation2Text"].count(None):
+            failed = True
+    ExportAnnotations([doc1], os.path.join(columnarDir, 'annotations.arrow'), fileFormat="arrow")
+    table = pyarrow.ipc.open_file(pyarrow.memory_map(os.path.join(columnarDir, 'annotations.arrow'), 'r')).read_all()
+    if table.column("documentClass").to_pylist() != [None] * len(doc1.annotations):
+        failed = True
+
+# Without pyarrow the default format falls back to npy and asking for parquet raises ImportError. A None entry in
+# sys.modules makes importing pyarrow fail.
+savedModules = dict((name, module) for name, module in sys.modules.items() if name == "pyarrow" or name.startswith("pyarrow."))
+sys.modules["pyarrow"] = None
+try:
+    if ExportComparisons(discrepancies, os.path.join(columnarDir, 'default')) != "npy":
+        failed = True
+    gotException = False
+    try:
+        ExportComparisons(discrepancies, os.path.join(columnarDir, 'comparisons.parquet'), fileFormat="parquet")
+    except ImportError:
+        gotException = True
+    if not gotException:
+        failed = True
+finally:
+    del sys.modules["pyarrow"]
+    sys.modules.update(savedModules)
+shutil.rmtree(columnarDir)
+
 if failed:
     failCount += 1
     print failedColor + '*****************Test Failed***************************\n' + resetColor
@@ -430,6 +1165,235 @@ recall, precision, fscore, agreement = CalculateRecallPrecisionFScoreAndAgreemen
 if recall != .25 or precision != .5:
     failed = True
 
+# The numpy backend must produce the same results as sklearn.
+from eHostess.Analysis.Metrics import EncodeComparisons, CalculateMetricsFromArrays
+from sklearn.metrics import precision_recall_fscore_support
+import numpy as np
+for goldStandardPosition in ['first', 'second']:
+    numpyResults = CalculateRecallPrecisionFScoreAndAgreement(discrepancies, goldStandardPosition, backend='numpy')
+    sklearnResults = CalculateRecallPrecisionFScoreAndAgreement(discrepancies, goldStandardPosition, backend='sklearn')
+    if not np.allclose(numpyResults, sklearnResults):
+        failed = True
+
+encodedComparisons = EncodeComparisons(discrepancies)
+if len(encodedComparisons.resultCodes) != len(discrepancies) or encodedComparisons.testLabels.dtype != np.int8:
+    failed = True
+
+randomGenerator = np.random.RandomState(1234)
+labelCases = [(randomGenerator.randint(0, 2, 1000), randomGenerator.randint(0, 2, 1000)),
+              (np.zeros(10), np.zeros(10)),
+              (np.ones(10), np.zeros(10)),
+              (np.zeros(10), np.ones(10))]
+for goldStandardLabels, testLabels in labelCases:
+    recall, precision, fscore, agreement = CalculateMetricsFromArrays(np.full(len(testLabels), 5), goldStandardLabels, testLabels)
+    sklearnPrecision, sklearnRecall, sklearnFScore, support = precision_recall_fscore_support(goldStandardLabels, testLabels, average='binary')
+    if not np.allclose((recall, precision, fscore), (sklearnRecall, sklearnPrecision, sklearnFScore)) or agreement != 1:
+        failed = True
+
+gotException = False
+try:
+    CalculateRecallPrecisionFScoreAndAgreement(discrepancies, backend='pandas')
+except ValueError:
+    gotException = True
+if not gotException:
+    failed = True
+
+if failed:
+    failCount += 1
+    print failedColor + '*****************Test Failed***************************\n' + resetColor
+else:
+    print passedColor + "Passed\n" + resetColor
+
+
+#### Test Analysis.Metrics.CalculateGroupedMetrics() ####
+printTestName('Analysis.Metrics.CalculateGroupedMetrics()')
+from eHostess.Analysis.Metrics import CalculateGroupedMetrics
+from eHostess.Analysis.DocumentComparison import ComparisonResults
+from eHostess.Annotations.MentionLevelAnnotation import MentionLevelAnnotation
+import random
+failed = False
+
+groupedPositiveLabels = {"bleeding_present": None, "hematoma": None, "doc_classification": {"present_or_absent": "present"}}
+groupedAnnotations = [MentionLevelAnnotation("text", 0, 4, "annotator", "id", {}, annotationClass)
+                      for annotationClass in ["bleeding_present", "bleeding_absent", "hematoma"]]
+groupedAnnotations.append(MentionLevelAnnotation("", 0, 0, "annotator", "id", {"present_or_absent": "present"}, "doc_classification"))
+groupedAnnotations.append(MentionLevelAnnotation("", 0, 0, "annotator", "id", {"present_or_absent": "absent"}, "doc_classification"))
+randomGenerator = random.Random(1234)
+groupedComparisons = []
+for index in range(2000):
+    resultKey = randomGenerator.choice(ComparisonResults.keys())
+    annotation2 = None if resultKey in ("1", "6") else randomGenerator.choice(groupedAnnotations)
+    groupedComparisons.append(Comparison("doc%i" % randomGenerator.randint(0, 19), ComparisonResults[resultKey],
+                                         randomGenerator.choice(groupedAnnotations), annotation2))
+
+groupedMetrics = CalculateGroupedMetrics(groupedComparisons, positiveLabels=groupedPositiveLabels)
+
+# The micro, macro and per class metrics must match sklearn's multi-class metrics.
+encodedComparisons = EncodeComparisons(groupedComparisons, positiveLabels=groupedPositiveLabels)
+labelCodes = range(1, len(encodedComparisons.labelNames) + 1)
+for average, row in [('micro', groupedMetrics.micro), ('macro', groupedMetrics.macro)]:
+    sklearnPrecision, sklearnRecall, sklearnFScore, support = precision_recall_fscore_support(
+        encodedComparisons.goldStandardLabels, encodedComparisons.testLabels, labels=labelCodes, average=average)
+    if not np.allclose((row.recall, row.precision, row.fscore), (sklearnRecall, sklearnPrecision, sklearnFScore)):
+        failed = True
+sklearnPrecision, sklearnRecall, sklearnFScore, support = precision_recall_fscore_support(
+    encodedComparisons.goldStandardLabels, encodedComparisons.testLabels, labels=labelCodes, average=None)
+for index, labelName in enumerate(encodedComparisons.labelNames):
+    row = groupedMetrics.perClass[labelName]
+    if not np.allclose((row.recall, row.precision, row.fscore), (sklearnRecall[index], sklearnPrecision[index], sklearnFScore[index])):
+        failed = True
+    classComparisons = [comparison for comparison in groupedComparisons
+                        if labelName in [annotation.annotationClass for annotation in [comparison.annotation1, comparison.annotation2] if annotation]
+                        and (labelName != "doc_classification" or "present" in [annotation.attributes.get("present_or_absent") for annotation in [comparison.annotation1, comparison.annotation2] if annotation])]
+    if row.numComparisons != len(classComparisons) or not np.isclose(row.agreement, CalculateRecallPrecisionFScoreAndAgreement(classComparisons)[3]):
+        failed = True
+if sorted(groupedMetrics.perClass.keys()) != sorted(groupedPositiveLabels.keys()):
+    failed = True
+if groupedMetrics.micro.agreement != CalculateRecallPrecisionFScoreAndAgreement(groupedComparisons)[3]:
+    failed = True
+
+# The per document metrics must match the binary metrics of each document's comparisons.
+if len(groupedMetrics.perDocument) != len(set(comparison.documentName for comparison in groupedComparisons)):
+    failed = True
+for documentName, row in groupedMetrics.perDocument.items():
+    documentComparisons = [comparison for comparison in groupedComparisons if comparison.documentName == documentName]
+    expected = CalculateRecallPrecisionFScoreAndAgreement(documentComparisons, backend='sklearn', positiveLabels=groupedPositiveLabels)
+    if not np.allclose(row[:4], expected) or row.numComparisons != len(documentComparisons):
+        failed = True
+
+# With a single positive class the micro averaged metrics are the binary metrics.
+singleLabel = {"bleeding_present": None}
+if not np.allclose(CalculateGroupedMetrics(groupedComparisons, 'second', singleLabel).micro[:4],
+                   CalculateRecallPrecisionFScoreAndAgreement(groupedComparisons, 'second', backend='sklearn', positiveLabels=singleLabel)):
+    failed = True
+
+if failed:
+    failCount += 1
+    print failedColor + '*****************Test Failed***************************\n' + resetColor
+else:
+    print passedColor + "Passed\n" + resetColor
+
+
+#### Test Analysis.Metrics.BootstrapConfidenceIntervals() ####
+printTestName('Analysis.Metrics.BootstrapConfidenceIntervals()')
+from eHostess.Analysis.Metrics import BootstrapConfidenceIntervals
+failed = False
+
+# With a fixed seed the intervals are reproducible, whatever the number of workers.
+intervals = BootstrapConfidenceIntervals(groupedComparisons, numResamples=250, seed=42)
+for workers, chunkSize in [(1, None), (2, None), (2, 1)]:
+    if intervals != BootstrapConfidenceIntervals(groupedComparisons, numResamples=250, seed=42, workers=workers, chunkSize=chunkSize):
+        failed = True
+if not np.allclose([interval.estimate for interval in intervals], CalculateRecallPrecisionFScoreAndAgreement(groupedComparisons)):
+    failed = True
+for interval in intervals:
+    if not interval.lower < interval.estimate < interval.upper:
+        failed = True
+narrowIntervals = BootstrapConfidenceIntervals(groupedComparisons, numResamples=250, confidenceLevel=0.5, seed=42)
+for interval, narrowInterval in zip(intervals, narrowIntervals):
+    if not interval.lower <= narrowInterval.lower <= narrowInterval.upper <= interval.upper:
+        failed = True
+
+# With a single document every resample is the same, so the intervals collapse to the estimate.
+singleDocumentComparisons = [comparison for comparison in groupedComparisons if comparison.documentName == "doc0"]
+for interval in BootstrapConfidenceIntervals(singleDocumentComparisons, numResamples=20, seed=1):
+    if not np.isclose(interval.lower, interval.estimate) or not np.isclose(interval.upper, interval.estimate):
+        failed = True
+
+for badArguments in [{'numResamples': 0}, {'confidenceLevel': 1}, {'workers': 0},
+                     {'workers': 2, 'chunkSize': 0}]:
+    gotException = False
+    try:
+        BootstrapConfidenceIntervals(groupedComparisons, **badArguments)
+    except ValueError:
+        gotException = True
+    if not gotException:
+        failed = True
+
+if failed:
+    failCount += 1
+    print failedColor + '*****************Test Failed***************************\n' + resetColor
+else:
+    print passedColor + "Passed\n" + resetColor
+
+
+#### Test Analysis.Agreement ####
+printTestName('Analysis.Agreement')
+from eHostess.Analysis.Agreement import CalculateAgreement, AlignAnnotations, CohensKappa, KrippendorffsAlpha
+from eHostess.Annotations.Document import Document, ClassifiedDocument
+from sklearn.metrics import cohen_kappa_score
+failed = False
+
+# The nominal example from Krippendorff's "Computing Krippendorff's Alpha-Reliability", alpha = 0.743.
+krippendorffExample = np.array([[1, 2, 3, 3, 2, 1, 4, 1, 2, -1, -1, -1],
+                                [1, 2, 3, 3, 2, 2, 4, 1, 2, 5, -1, 3],
+                                [-1, 3, 3, 3, 2, 3, 4, 2, 2, 5, 1, -1],
+                                [1, 2, 3, 3, 2, 4, 4, 1, 2, 5, 1, -1]]).T
+if round(KrippendorffsAlpha(krippendorffExample), 3) != 0.743:
+    failed = True
+
+randomState = np.random.RandomState(0)
+kappaLabels1 = randomState.randint(0, 4, 300)
+kappaLabels2 = np.where(randomState.rand(300) < .6, kappaLabels1, randomState.randint(0, 4, 300))
+if not np.isclose(CohensKappa(kappaLabels1, kappaLabels2), cohen_kappa_score(kappaLabels1, kappaLabels2)):
+    failed = True
+
+
+def agreementAnnotation(start, end, annotationClass):
+    return MentionLevelAnnotation("text", start, end, "annotator", "id", {}, annotationClass)
+
+# Annotator C's annotation at 20-35 joins annotator A's two annotations into a single unit.
+annotatorA = [Document("note1", "A", [agreementAnnotation(0, 10, "bleeding_present"), agreementAnnotation(20, 30, "bleeding_absent"),
+                                      agreementAnnotation(32, 40, "bleeding_absent")], 100),
+              Document("note2", "A", [agreementAnnotation(5, 8, "bleeding_present")], 100)]
+annotatorB = [Document("note1", "B", [agreementAnnotation(2, 6, "bleeding_present"), agreementAnnotation(50, 60, "bleeding_present")], 100),
+              Document("note2", "B", [], 100)]
+annotatorC = [Document("note1", "C", [agreementAnnotation(20, 35, "bleeding_absent"), agreementAnnotation(50, 55, "bleeding_absent")], 100)]
+
+aligned = AlignAnnotations([annotatorA, annotatorB, annotatorC])
+labels = [[aligned.labelNames[code] if code >= 0 else "missing" for code in row] for row in aligned.labelMatrix]
+if aligned.annotatorNames != ["A", "B", "C"] or aligned.unitDocuments != ["note1", "note1", "note1", "note2"] \
+        or aligned.unitSpans != [(0, 10), (20, 40), (50, 60), (5, 8)]:
+    failed = True
+if labels != [["bleeding_present", "bleeding_present", None], ["bleeding_absent", None, "bleeding_absent"],
+              [None, "bleeding_present", "bleeding_absent"], ["bleeding_present", None, "missing"]]:
+    failed = True
+
+spanAgreement = CalculateAgreement([annotatorA, annotatorB, annotatorC])
+if spanAgreement.numUnits != 4 or sorted(spanAgreement.pairwise.keys()) != [("A", "B"), ("A", "C"), ("B", "C")]:
+    failed = True
+if spanAgreement.pairwise[("A", "B")].numUnits != 4 or spanAgreement.pairwise[("A", "B")].observedAgreement != .25 \
+        or spanAgreement.pairwise[("A", "C")].numUnits != 3 or not np.isclose(spanAgreement.pairwise[("A", "C")].observedAgreement, 1 / 3.0):
+    failed = True
+if not np.isclose(spanAgreement.alpha, KrippendorffsAlpha(aligned.labelMatrix)):
+    failed = True
+
+# Two annotators aligned once must give the same kappa as sklearn on the aligned labels.
+realAligned = AlignAnnotations([[doc1], [doc2]])
+realAgreement = CalculateAgreement([[doc1], [doc2]], annotatorNames=["first", "second"])
+if realAgreement.numUnits != len(realAligned.labelMatrix) or realAgreement.numUnits == 0:
+    failed = True
+if not np.isclose(realAgreement.pairwise[("first", "second")].kappa,
+                  cohen_kappa_score(realAligned.labelMatrix[:, 0], realAligned.labelMatrix[:, 1])):
+    failed = True
+
+classifiedBatches = [[ClassifiedDocument("note%i" % index, group, [], 100, documentClass)
+                      for index, documentClass in enumerate(documentClasses)]
+                     for group, documentClasses in [("A", ["pos", "pos", "neg", "neg"]), ("B", ["pos", "neg", "neg", "neg"])]]
+documentAgreement = CalculateAgreement(classifiedBatches, level="document")
+if documentAgreement.numUnits != 4 or documentAgreement.pairwise[("A", "B")].observedAgreement != .75 \
+        or not np.isclose(documentAgreement.pairwise[("A", "B")].kappa, cohen_kappa_score(["pos", "pos", "neg", "neg"], ["pos", "neg", "neg", "neg"])):
+    failed = True
+
+for badArguments in [([annotatorA],), ([annotatorA, annotatorB], "sentence"), ([annotatorA, annotatorB], "document")]:
+    gotException = False
+    try:
+        CalculateAgreement(*badArguments)
+    except ValueError:
+        gotException = True
+    if not gotException:
+        failed = True
+
 if failed:
     failCount += 1
     print failedColor + '*****************Test Failed***************************\n' + resetColor
@@ -527,6 +1491,81 @@ for result in results:
             attributeMismatches += 1
             # TODO Include a unit test for the modified DocumentComparison methods using the new options to ensure comparison is still happening correctly.
 
+#### Test Analysis.DocumentComparison.CompareAllAnnotations() matchingAlgorithm="intervalTree" ####
+printTestName('Analysis.DocumentComparison.CompareAllAnnotations() matchingAlgorithm="intervalTree"')
+import random
+failed = False
+
+# Build two documents with many randomly placed, frequently overlapping annotations and ensure that the interval tree
+# produces exactly the same comparisons, in the same order, as the nested loop.
+randomGenerator = random.Random(1234)
+def makeRandomAnnotations(numAnnotations):
+    randomAnnotations = []
+    for index in range(numAnnotations):
+        start = randomGenerator.randint(0, 2000)
+        end = start + randomGenerator.choice([0, 1, 5, 10, 40, 300])
+        attributes = {'key1': randomGenerator.choice(['positive', 'negative'])}
+        annotationClass = randomGenerator.choice(['classPositive', 'classNegative'])
+        randomAnnotations.append(MentionLevelAnnotation("", start, end, "", "%i" % index, attributes, annotationClass))
+    return randomAnnotations
+
+randomDocument1 = Document("document", "test", makeRandomAnnotations(400), 2300)
+randomDocument2 = Document("document", "test", makeRandomAnnotations(350), 2300)
+
+optionSets = [{}, {'equivalentAttributes': False}, {'equivalentClasses': False},
+              {'countNoOverlapAsMatch': ['classNegative']}]
+for options in optionSets:
+    for firstDoc, secondDoc in [(randomDocument1, randomDocument2), (randomDocument2, randomDocument1),
+                                (documentAllSame, documentAllDifferent)]:
+        nestedComparisons = Comparison.CompareAllAnnotations(firstDoc, secondDoc, **options)
+        treeComparisons = Comparison.CompareAllAnnotations(firstDoc, secondDoc, matchingAlgorithm="intervalTree", **options)
+        nestedSummary = [(c.comparisonResult, c.annotation1, c.annotation2) for c in nestedComparisons]
+        treeSummary = [(c.comparisonResult, c.annotation1, c.annotation2) for c in treeComparisons]
+        if nestedSummary != treeSummary:
+            failed = True
+
+if failed:
+    failCount += 1
+    print failedColor + '*****************Test Failed***************************\n' + resetColor
+else:
+    print passedColor + "Passed\n" + resetColor
+
+#### Test Analysis.DocumentComparison.CompareDocumentBatches() workers ####
+printTestName('Analysis.DocumentComparison.CompareDocumentBatches() workers')
+failed = False
+
+batch1 = [Document("doc%i" % index, "test", makeRandomAnnotations(randomGenerator.randint(0, 60)), 2300) for index in range(12)]
+batch2 = [Document("doc%i" % index, "test", makeRandomAnnotations(randomGenerator.randint(0, 60)), 2300) for index in range(12)]
+randomGenerator.shuffle(batch2)
+
+def summarizeComparisons(comparisons):
+    summary = []
+    for comparison in comparisons:
+        id1 = comparison.annotation1.annotationId if comparison.annotation1 else None
+        id2 = comparison.annotation2.annotationId if comparison.annotation2 else None
+        summary.append((comparison.documentName, comparison.comparisonResult, id1, id2))
+    return summary
+
+serialComparisons = Comparison.CompareDocumentBatches(batch1, batch2)
+for workers, chunkSize in [(2, None), (3, 1), (4, 5)]:
+    parallelComparisons = Comparison.CompareDocumentBatches(batch1, batch2, workers=workers, chunkSize=chunkSize,
+                                                            matchingAlgorithm="intervalTree")
+    if summarizeComparisons(parallelComparisons) != summarizeComparisons(serialComparisons):
+        failed = True
+
+for workers, chunkSize in [(0, None), (2, 0), (2, -1)]:
+    try:
+        Comparison.CompareDocumentBatches(batch1, batch2, workers=workers, chunkSize=chunkSize)
+        failed = True
+    except ValueError:
+        pass
+
+if failed:
+    failCount += 1
+    print failedColor + '*****************Test Failed***************************\n' + resetColor
+else:
+    print passedColor + "Passed\n" + resetColor
+
 #### Test Analysis.DocumentComparison.CalculateTestMetricsForDocumentClassification() ####
 printTestName('Analysis.DocumentComparison.CalculateTestMetricsForDocumentClassification')
 
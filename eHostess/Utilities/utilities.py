@@ -1,3 +1,6 @@
+import multiprocessing
+
+
 def cleanDirectoryList(corpusDirectoryList):
     newList = []
     for dirName in corpusDirectoryList:
@@ -12,4 +15,71 @@ def cleanDirectoryList(corpusDirectoryList):
         if dirName[-2:] == '/*':
             newList.append(dirName)
 
-    return newList
\ No newline at end of file
+    return newList
+
+
+def resolveWorkers(workers, chunkSize=None):
+    """
+    Validates the 'workers' and 'chunkSize' arguments accepted by the functions that can run in a pool of worker
+    processes and returns the number of processes to use.
+
+    :param workers: [int | None] The number of processes requested. If None, one process per CPU is used.
+    :param chunkSize: [int | None] The number of items sent to a worker process at a time, or None for the default.
+    :return: [int] The number of processes to use.
+    """
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    if workers < 1:
+        raise ValueError("workers must be None or a positive integer. Got %s." % workers)
+    if chunkSize is not None and chunkSize < 1:
+        raise ValueError("chunkSize must be None or a positive integer. Got %s." % chunkSize)
+    return workers
+
+
+def defaultChunkSize(numItems, workers):
+    """Returns the default chunk size, which splits numItems items into roughly four chunks per worker."""
+    return max(1, numItems // (workers * 4))
+
+
+def iterInPool(function, arguments, workers=None, chunkSize=None, initializer=None, initargs=()):
+    """
+    A generator which applies function to each item in arguments in a pool of worker processes and yields the results in
+    the order of arguments as they become available. The pool is terminated if an error is raised or the generator is
+    closed before it is exhausted.
+
+    :param function: [function] A module-level function, so that it can be pickled, taking a single argument.
+    :param arguments: [list] The arguments to apply function to.
+    :param workers: [int | None] The number of processes. If None, one process per CPU is used. No more processes than there are arguments are started.
+    :param chunkSize: [int | None] The number of arguments sent to a worker process at a time. If None (default) the arguments are split into roughly four chunks per worker.
+    :param initializer: [function] An optional module-level function called once in each worker process when it starts.
+    :param initargs: [tuple] The arguments passed to initializer.
+    :return: [generator] A generator yielding the result for each item in arguments.
+    """
+    workers = resolveWorkers(workers, chunkSize)
+    if len(arguments) == 0:
+        return
+    if chunkSize is None:
+        chunkSize = defaultChunkSize(len(arguments), workers)
+
+    pool = multiprocessing.Pool(min(workers, len(arguments)), initializer, initargs)
+    finished = False
+    try:
+        # Pool.imap returns the results in the order of its input so the output is deterministic.
+        for result in pool.imap(function, arguments, chunkSize):
+            yield result
+        finished = True
+    finally:
+        # The workers are stopped straight away if an error was raised or the generator was closed early.
+        if finished:
+            pool.close()
+        else:
+            pool.terminate()
+        pool.join()
+
+
+def runInPool(function, arguments, workers=None, chunkSize=None, initializer=None, initargs=()):
+    """
+    Applies function to each item in arguments in a pool of worker processes and returns the list of results in the
+    order of arguments. See :func:`iterInPool` for an explanation of the arguments.
+    """
+    return list(iterInPool(function, arguments, workers, chunkSize, initializer, initargs))
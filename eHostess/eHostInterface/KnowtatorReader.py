@@ -1,13 +1,21 @@
 """This module is meant to interface with eHost by reading the '.knowtator.xml' files produced by eHost and parsing
 them into eHostess.Annotations.Document objects which can be analyzed, possibly using other tools in eHostess."""
 
-from ..Utilities.utilities import cleanDirectoryList
+from ..Utilities.utilities import cleanDirectoryList, resolveWorkers, runInPool
 from ..Annotations.MentionLevelAnnotation import MentionLevelAnnotation
 from ..Annotations.Document import Document, AdjudicationStatus
 from ..Utilities.utilities import cleanDirectoryList
 from xml.etree import ElementTree
+from xml.etree import cElementTree
 import os
+import sys
+import json
 import glob
+import threading
+import Queue
+import traceback
+import cPickle
+import copy
 
 
 def evalTrueFalse(string):
@@ -29,39 +37,56 @@ def parseAdjudicationStatus(xmlElement):
     return AdjudicationStatus(overlapping, attributes, relationship, adjudicationClass, comment)
 
 
+def _parseAnnotationElement(annotationXml):
+    """Converts a single 'annotation' element into a MentionLevelAnnotation without a class or attributes."""
+    text = annotationXml.find("spannedText").text
+    start = annotationXml.find("span").attrib["start"]
+    end = annotationXml.find("span").attrib["end"]
+    annotator = annotationXml.find("annotator").text
+    annotationId = annotationXml.find("mention").attrib["id"]
+    creationDate = annotationXml.find("creationDate").text
+
+    return MentionLevelAnnotation(text, start, end, annotator, annotationId, attributes={}, creationDate=creationDate)
+
+def _parseClassMentionElement(mentionXml):
+    """Returns a tuple of the form (mentionId, mentionClass, [stringSlotMentionIds]) for a 'classMention' element."""
+    mentionId = mentionXml.attrib["id"]
+    mentionClass = mentionXml.find("mentionClass").attrib["id"]
+    slotMentionIds = [hasSlotMentionElement.attrib["id"] for hasSlotMentionElement in mentionXml.findall("hasSlotMention")]
+    return mentionId, mentionClass, slotMentionIds
+
+def _parseStringSlotMentionElement(stringSlotMentionElement):
+    """Returns a tuple of the form (stringSlotMentionId, attributeKey, attributeValue) for a 'stringSlotMention' element."""
+    id = stringSlotMentionElement.attrib["id"]
+    key = stringSlotMentionElement.find("mentionSlot").attrib["id"]
+    value = stringSlotMentionElement.find("stringSlotMentionValue").attrib["value"]
+    return id, key, value
+
 def parseMentionLevelAnnotations(annotationElements, classMentionElements, stringSlotMentionElements):
     """This function takes a list of annotation elements, classMention elements, and stringSlotMention elements from
     .knowtator files and combines corresponding elements into MentionLevelAnnotation objects."""
     annotations = {}
 
     for annotationXml in annotationElements:
-        text = annotationXml.find("spannedText").text
-        start = annotationXml.find("span").attrib["start"]
-        end = annotationXml.find("span").attrib["end"]
-        annotator = annotationXml.find("annotator").text
-        annotationId = annotationXml.find("mention").attrib["id"]
-        creationDate = annotationXml.find("creationDate").text
-
-        newAnnotationObj = MentionLevelAnnotation(text, start, end, annotator, annotationId, attributes={}, creationDate=creationDate)
+        newAnnotationObj = _parseAnnotationElement(annotationXml)
         annotations[newAnnotationObj.annotationId] = newAnnotationObj
 
+    # Index the stringSlotMentions by id once per file so that resolving the attributes of each classMention is a
+    # dictionary lookup rather than a pass over every stringSlotMention in the file.
+    stringSlotMentionElementDict = {}
+    for stringSlotMentionElement in stringSlotMentionElements:
+        id = stringSlotMentionElement.attrib["id"]
+        stringSlotMentionElementDict[id] = stringSlotMentionElement
+
     for mentionXml in classMentionElements:
         # Get the classMention information.
-        mentionId = mentionXml.attrib["id"]
-        mentionClass = mentionXml.find("mentionClass").attrib["id"]
+        mentionId, mentionClass, slotMentionIds = _parseClassMentionElement(mentionXml)
 
         # Get the attributes associated with this classMention.
-        stringSlotMentionElementDict = {}
-        for stringSlotMentionElement in stringSlotMentionElements:
-            id = stringSlotMentionElement.attrib["id"]
-            stringSlotMentionElementDict[id] = stringSlotMentionElement
-
         attributes = {}
-        for hasSlotMentionElement in mentionXml.findall("hasSlotMention"):
-            stringSlotMentionId = hasSlotMentionElement.attrib["id"]
+        for stringSlotMentionId in slotMentionIds:
             stringSlotMentionElement = stringSlotMentionElementDict[stringSlotMentionId]
-            key = stringSlotMentionElement.find("mentionSlot").attrib["id"]
-            value = stringSlotMentionElement.find("stringSlotMentionValue").attrib["value"]
+            id, key, value = _parseStringSlotMentionElement(stringSlotMentionElement)
             attributes[key] = value
 
         # Update the corresponding annotation object with the classMention information and attributes
@@ -71,8 +96,136 @@ def parseMentionLevelAnnotations(annotationElements, classMentionElements, strin
 
     return annotations.values()
 
+def _iterparseKnowtatorFile(filePath):
+    """Parses a '.knowtator.xml' file incrementally using iterparse. Each top-level element is converted to plain python
+    objects as soon as it has been read and is then discarded, so memory usage does not grow with the size of the XML
+    tree. Returns a tuple of the form (annotations, adjudicationStatus) identical to what parsing the whole tree with
+    parseMentionLevelAnnotations() would produce."""
+    annotations = {}
+    classMentions = []
+    stringSlotMentions = {}
+    adjudicationStatus = None
+
+    depth = 0
+    root = None
+    for event, element in cElementTree.iterparse(filePath, events=("start", "end")):
+        if event == "start":
+            if root is None:
+                root = element
+            depth += 1
+            continue
+
+        depth -= 1
+        # Only process the direct children of the root once they have been read completely.
+        if depth != 1:
+            continue
+        if element.tag == "annotation":
+            newAnnotationObj = _parseAnnotationElement(element)
+            annotations[newAnnotationObj.annotationId] = newAnnotationObj
+        elif element.tag == "classMention":
+            classMentions.append(_parseClassMentionElement(element))
+        elif element.tag == "stringSlotMention":
+            id, key, value = _parseStringSlotMentionElement(element)
+            stringSlotMentions[id] = (key, value)
+        elif element.tag == "eHOST_Adjudication_Status":
+            adjudicationStatus = parseAdjudicationStatus(element)
+        # Detach the finished element from the root so that it can be garbage collected.
+        root.clear()
+
+    for mentionId, mentionClass, slotMentionIds in classMentions:
+        attributes = {}
+        for stringSlotMentionId in slotMentionIds:
+            key, value = stringSlotMentions[stringSlotMentionId]
+            attributes[key] = value
+
+        correspondingAnnotation = annotations[mentionId]
+        correspondingAnnotation.annotationClass = mentionClass
+        correspondingAnnotation.attributes = attributes
+
+    return annotations.values(), adjudicationStatus
+
+def _countCharacters(filePath):
+    """Returns the number of characters that reading the file at filePath in 'r' mode would produce, without reading
+    the whole file into memory. Where text mode does not translate line endings the file size is used directly."""
+    if os.linesep == '\n' and os.path.isfile(filePath):
+        return os.path.getsize(filePath)
+    numCharacters = 0
+    with open(filePath, 'r') as infile:
+        for chunk in iter(lambda: infile.read(1024 * 1024), ''):
+            numCharacters += len(chunk)
+    return numCharacters
+
+class OriginalFileIndex:
+    """
+    Maps note names to the paths of the original notes found in a list of search directories, so that the directories
+    only need to be searched once when reading many '.knowtator.xml' files. As with getOriginalFileLength(), a note
+    name is the file name without any extensions and the first file found with a given name is used.
+
+    The index may optionally be saved to a JSON file and reused by later runs that use the same search directories. If
+    a name is missing from a loaded index, or the file it points to no longer exists, the directories are searched
+    again and the saved index is updated.
+
+    :param searchPaths: [string | list of strings] A directory path or a list of directory paths containing the original notes.
+    :param cachePath: [string] Optional path of a JSON file used to persist the index between runs.
+    """
+    def __init__(self, searchPaths, cachePath=None):
+        if not isinstance(searchPaths, list):
+            searchPaths = [searchPaths]
+        self.searchPaths = searchPaths
+        self.cleanPaths = cleanDirectoryList(searchPaths)
+        self.cachePath = cachePath
+        self.paths = None
+        self.builtFromDisk = False
+
+        if cachePath and os.path.isfile(cachePath):
+            with open(cachePath, 'r') as cacheFile:
+                cached = json.load(cacheFile)
+            if cached.get("searchPaths") == self.cleanPaths:
+                self.paths = cached["paths"]
+        if self.paths is None:
+            self._build()
+
+    def _build(self):
+        self.paths = {}
+        for path in self.cleanPaths:
+            for filepath in glob.glob(path):
+                name = os.path.split(filepath)[1].split('.')[0]
+                if name not in self.paths:
+                    self.paths[name] = filepath
+        self.builtFromDisk = True
+
+        if self.cachePath:
+            with open(self.cachePath, 'w') as cacheFile:
+                json.dump({"searchPaths": self.cleanPaths, "paths": self.paths}, cacheFile)
+
+    def findFile(self, fileName):
+        """
+        Returns the path of the original note named fileName.
+
+        :param fileName: [string] The name of the note without an extension.
+        :return: [string] The path to the note.
+        """
+        filepath = self.paths.get(fileName)
+        if (filepath is None or not os.path.isfile(filepath)) and not self.builtFromDisk:
+            self._build()
+            filepath = self.paths.get(fileName)
+        if filepath is None:
+            raise RuntimeError("Could not find %s in the specified paths: %s" % (fileName, self.searchPaths))
+        return filepath
+
+    def getLength(self, knowtatorFilePath):
+        """
+        Returns the number of characters in the original note corresponding to the '.knowtator.xml' file at knowtatorFilePath.
+
+        :param knowtatorFilePath: [string] The path to a '.knowtator.xml' file.
+        :return: [int] The number of characters in the original note.
+        """
+        fileName = os.path.split(knowtatorFilePath)[1].split('.')[0]
+        return _countCharacters(self.findFile(fileName))
+
 def getOriginalFileLength(knowtatorFilePath, searchPaths):
-    """This class assumes that fileName is passed as a name without an extension."""
+    """This class assumes that fileName is passed as a name without an extension. searchPaths may be a directory, a list
+    of directories, or an OriginalFileIndex that has already been built from the search directories."""
     fileNameWithExt = os.path.split(knowtatorFilePath)[1]
     fileName = fileNameWithExt.split('.')[0]
 
@@ -80,23 +233,104 @@ def getOriginalFileLength(knowtatorFilePath, searchPaths):
     if not searchPaths:
         batchDirPath = os.path.split(os.path.split(knowtatorFilePath)[0])[0]
         originalFilePath = os.path.join(batchDirPath, 'corpus', fileName + '.txt')
-        with open(originalFilePath, 'r') as infile:
-            return len(infile.read())
-
-    filepaths = []
-    if not isinstance(searchPaths, list):
-        searchPaths = [searchPaths]
-    cleanPaths = cleanDirectoryList(searchPaths)
-    for path in cleanPaths:
-        filepaths.extend(glob.glob(path))
-
-    for filepath in filepaths:
-        name = os.path.split(filepath)[1].split('.')[0]
-        if name == fileName:
-            with open(filepath, 'r') as infile:
-                return len(infile.read())
+        return _countCharacters(originalFilePath)
+
+    if not isinstance(searchPaths, OriginalFileIndex):
+        searchPaths = OriginalFileIndex(searchPaths)
+    return searchPaths.getLength(knowtatorFilePath)
+
+def _findKnowtatorFiles(directoryList):
+    """Globs the directories in directoryList and returns the list of file paths found. Raises a RuntimeError if no files
+    are found."""
+    if not isinstance(directoryList, list):
+        directoryList = [directoryList]
+    fileNames = []
+    cleanDirNames = cleanDirectoryList(directoryList)
+    for dirPath in cleanDirNames:
+        fileNames.extend(glob.glob(dirPath))
+
+    if len(fileNames) == 0:
+        raise RuntimeError("KnowtatorReader was unable to find any files in the directories listed in directoryList, please ensure that the paths are valid.")
+    warnBoldColor = '\033[1;33m'
+    resetColor = '\033[0m'
+    if len(fileNames) < len(directoryList):
+       print warnBoldColor + "WARNING: There are fewer knowtator files to read than there were directories in 'directoryList' please ensure that you entered the directory paths correctly." + resetColor
+
+    return fileNames
+
+class _PrefetchingParser:
+    """Parses knowtator files in a background thread, keeping up to 'prefetch' parsed Documents ready in a queue so that
+    the consumer of KnowtatorReader.iterKnowtatorFiles() can work on one document while the next ones are parsed."""
+
+    _finished = object()
+
+    def __init__(self, parseFunction, filePaths, prefetch):
+        self.parseFunction = parseFunction
+        self.filePaths = filePaths
+        self.queue = Queue.Queue(maxsize=prefetch)
+        self.stopEvent = threading.Event()
+        self.thread = threading.Thread(target=self._parseAll)
+        self.thread.daemon = True
+
+    def _put(self, item):
+        # Use a timeout so the thread notices if the consumer has stopped iterating while the queue is full.
+        while not self.stopEvent.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except Queue.Full:
+                continue
+        return False
 
-    raise RuntimeError("Could not find %s in the specified paths: %s" % (fileName, searchPaths))
+    def _parseAll(self):
+        # The consumer waits until it receives either the end sentinel or an error, so one of them is always put on the
+        # queue, including when parsing is stopped by an exception that is not an Exception, e.g. SystemExit.
+        lastItem = (self._finished, None)
+        try:
+            for filePath in self.filePaths:
+                if not self._put((self.parseFunction(filePath), None)):
+                    return
+        except BaseException:
+            lastItem = (None, sys.exc_info())
+        finally:
+            self._put(lastItem)
+
+    def __iter__(self):
+        self.thread.start()
+        try:
+            while True:
+                document, errorInfo = self.queue.get()
+                if errorInfo is not None:
+                    raise errorInfo[0], errorInfo[1], errorInfo[2]
+                if document is self._finished:
+                    return
+                yield document
+        finally:
+            self.stopEvent.set()
+
+def _parseKnowtatorFileInWorker(parseArguments):
+    """Parses one file, possibly in a worker process. Takes a tuple of the form (filePath, originalFileSearchDirs,
+    annotationGroup, parser) and returns a tuple of the form (document, None) on success or (None, (exception,
+    <formatted traceback>)) on failure so that a single bad file does not abort the rest of the batch. Exceptions that
+    cannot be pickled are replaced by a RuntimeError containing the formatted traceback."""
+    filePath, originalFileSearchDirs, annotationGroup, parser = parseArguments
+    try:
+        return KnowtatorReader.parseSingleKnowtatorFile(filePath, originalFileSearchDirs, annotationGroup, parser), None
+    except Exception as exception:
+        errorMessage = traceback.format_exc()
+        try:
+            cPickle.dumps(exception, cPickle.HIGHEST_PROTOCOL)
+        except Exception:
+            exception = RuntimeError("Could not parse %s:\n%s" % (filePath, errorMessage))
+        return None, (exception, errorMessage)
+
+class ParsedDocumentList(list):
+    """A list of the Document objects produced by KnowtatorReader.parseMultipleKnowtatorFiles(). It behaves exactly like
+    a regular list but also has a 'failures' attribute, which is a list of (filePath, errorMessage) tuples for the files
+    that could not be parsed, where errorMessage is the formatted traceback of the error raised while parsing the file."""
+    def __init__(self, *args):
+        super(ParsedDocumentList, self).__init__(*args)
+        self.failures = []
 
 class KnowtatorReader:
     """A class for parsing '.knowtator.xml' files generated by eHost.
@@ -111,19 +345,28 @@ class KnowtatorReader:
     that the original file has a .txt extension."""
 
     @classmethod
-    def parseSingleKnowtatorFile(cls, filePath, originalFileSearchDirs=None, annotationGroup="MIMC_v2"):
+    def parseSingleKnowtatorFile(cls, filePath, originalFileSearchDirs=None, annotationGroup="MIMC_v2", parser="tree"):
         """
         This class method will parse a single '.knowtator.xml' file and return an annotation :class:`Document <eHostess.Annotations.Document.Document>`.
 
         :param filePath: [string] The relative or absolute path to the '.knowtator.xml' file whose annotations will be parsed.
-        :param originalFileSearchDirs: [list of strings] A list of directories that will be searched to find the original note. It is necessary to find the original note in order to determine the note's length. If no value is provided then it is assumed that the original file may be found one file-tree level up from the '.knowtator.xml' file in the 'corpus' directory as per eHost's usual scheme.
+        :param originalFileSearchDirs: [list of strings | object] A list of directories that will be searched to find the original note. It is necessary to find the original note in order to determine the note's length. If no value is provided then it is assumed that the original file may be found one file-tree level up from the '.knowtator.xml' file in the 'corpus' directory as per eHost's usual scheme. An :class:`OriginalFileIndex <eHostess.eHostInterface.KnowtatorReader.OriginalFileIndex>` may be passed instead of a list of directories to avoid searching the directories again.
         :param annotationGroup: [string] The annotation-round in which this note was annotated. This value defaults to "MIMC_v2" but may be changed if the same notes are annotated for multiple times for different purposes.
+        :param parser: [string] Either "tree" (default), which loads the whole XML tree into memory before reading it, or "iterparse", which reads the file incrementally and discards each element as soon as it has been consumed. "iterparse" keeps memory usage flat on very large '.knowtator.xml' files and produces an identical Document.
         :return: [object] A single :class:`Document <eHostess.Annotations.Document.Document>` instance containing the annotations from the '.knowtator.xml' file found at filePath.
 
         In order to standardize querying and working with notes this  method assigns the document name to be the
         value returned by Document.ParseDocumentNameFromPath()."""
         fileName = filePath.split('/')[-1]
 
+        if parser == "iterparse":
+            annotations, adjudicationStatus = _iterparseKnowtatorFile(filePath)
+            documentName = Document.ParseDocumentNameFromPath(filePath)
+            documentLength = getOriginalFileLength(filePath, originalFileSearchDirs)
+            return Document(documentName, annotationGroup, annotations, documentLength, adjudicationStatus=adjudicationStatus)
+        if parser != "tree":
+            raise ValueError("parser must either be 'tree' or 'iterparse'. Got %s." % parser)
+
         tree = ElementTree.parse(filePath)
         root = tree.getroot()
         annotationElements = []
@@ -149,34 +392,79 @@ class KnowtatorReader:
 
 
     @classmethod
-    def parseMultipleKnowtatorFiles(cls, directoryList, originalFileSearchDirs=None, annotationGroup="MIMC_v2"):
+    def parseMultipleKnowtatorFiles(cls, directoryList, originalFileSearchDirs=None, annotationGroup="MIMC_v2", parser="tree", originalFileIndexCachePath=None, workers=1, chunkSize=None, onError="collect"):
         """
         A class method for parsing multiple '.knowtator.xml' files. This method simply calls 'parseSingleKnowtatorFile
         multiple times and returns a list of Document objects.
 
         :param directoryList: [string] A list of directories containing '.knowtator.xml' files to be parsed. This may be entered as a list of directory paths or a single directory path.
-        :param originalFileSearchDirs: [list of strings] A list of directories that will be searched to find the original note. It is necessary to find the original note in order to determine the note's length. If no value is provided then it is assumed that the original file may be found one file-tree level up from the '.knowtator.xml' file in the 'corpus' directory as per eHost's usual scheme.
+        :param originalFileSearchDirs: [list of strings] A list of directories that will be searched to find the original note. It is necessary to find the original note in order to determine the note's length. If no value is provided then it is assumed that the original file may be found one file-tree level up from the '.knowtator.xml' file in the 'corpus' directory as per eHost's usual scheme. The directories are searched once per call and the result is stored in an :class:`OriginalFileIndex <eHostess.eHostInterface.KnowtatorReader.OriginalFileIndex>` that is shared by all the files.
         :param annotationGroup: [string] The annotation-round in which this note was annotated. This value defaults to "MIMC_v2" but may be changed if the same notes are annotated for multiple times for different purposes.
-        :return: [list of objects] A list of :class:`Document <eHostess.Annotations.Document.Document>` objects.
+        :param parser: [string] Either "tree" or "iterparse". See parseSingleKnowtatorFile().
+        :param originalFileIndexCachePath: [string] Optional path of a JSON file in which to save the index of original notes so that later runs using the same originalFileSearchDirs do not need to search the directories again. Ignored if originalFileSearchDirs is not provided.
+        :param workers: [int | None] The number of processes used to parse the files. Defaults to 1, which parses the files one at a time in the current process. If greater than 1 the files are parsed in a pool of worker processes and the documents are returned in the same order as they would be by a single process. If None, one process per CPU is used.
+        :param chunkSize: [int | None] The number of files sent to a worker process at a time. If None (default) the files are split into roughly four chunks per worker. Ignored if 'workers' is 1.
+        :param onError: [string] Either "collect" (default) or "raise". With "collect" a file that fails to parse does not abort the batch; a warning is printed, the file is left out of the returned list, and the file path and formatted traceback are recorded in the returned list's 'failures' attribute. With "raise" the error of the first file that fails to parse is raised instead; with multiple workers this happens once the pool has finished and the worker's traceback is printed first, since it is lost when the error is passed back to the main process.
+        :return: [list of objects] A :class:`ParsedDocumentList <eHostess.eHostInterface.KnowtatorReader.ParsedDocumentList>` of :class:`Document <eHostess.Annotations.Document.Document>` objects.
 
         In order to standardize querying and working with notes this  method assigns the document name to be the
         value returned by Document.ParseDocumentNameFromPath().
         """
-        if not isinstance(directoryList, list):
-            directoryList = [directoryList]
-        annotationDocuments = []
-        fileNames = []
-        cleanDirNames = cleanDirectoryList(directoryList)
-        for dirPath in cleanDirNames:
-            fileNames.extend(glob.glob(dirPath))
-
-        if len(fileNames) == 0:
-            raise RuntimeError("KnowtatorReader was unable to find any files in the directories listed in directoryList, please ensure that the paths are valid.")
+        workers = resolveWorkers(workers, chunkSize)
+        if onError not in ("collect", "raise"):
+            raise ValueError("onError must either be 'collect' or 'raise'. Got %s." % onError)
+        if workers == 1 and onError == "raise":
+            return ParsedDocumentList(cls.iterKnowtatorFiles(directoryList, originalFileSearchDirs, annotationGroup, parser=parser,
+                                                             originalFileIndexCachePath=originalFileIndexCachePath))
+
+        fileNames = _findKnowtatorFiles(directoryList)
+        if originalFileSearchDirs:
+            if not isinstance(originalFileSearchDirs, OriginalFileIndex):
+                originalFileSearchDirs = OriginalFileIndex(originalFileSearchDirs, originalFileIndexCachePath)
+            if workers > 1:
+                # Keep the workers from rewriting the cache file concurrently if one of them has to rebuild its index.
+                originalFileSearchDirs = copy.copy(originalFileSearchDirs)
+                originalFileSearchDirs.cachePath = None
+
+        parseArguments = [(filePath, originalFileSearchDirs, annotationGroup, parser) for filePath in fileNames]
+        if workers == 1:
+            results = map(_parseKnowtatorFileInWorker, parseArguments)
+        else:
+            # The results are returned in the order of parseArguments so the documents keep the order of fileNames.
+            results = runInPool(_parseKnowtatorFileInWorker, parseArguments, workers, chunkSize)
+
         warnBoldColor = '\033[1;33m'
         resetColor = '\033[0m'
-        if len(fileNames) < len(directoryList):
-           print warnBoldColor + "WARNING: There are fewer knowtator files to read than there were directories in 'directoryList' please ensure that you entered the directory paths correctly." + resetColor
+        annotationDocuments = ParsedDocumentList()
+        for filePath, (document, error) in zip(fileNames, results):
+            if error is None:
+                annotationDocuments.append(document)
+                continue
+            exception, errorMessage = error
+            print warnBoldColor + "WARNING: Could not parse %s:\n%s" % (filePath, errorMessage) + resetColor
+            if onError == "raise":
+                raise exception
+            annotationDocuments.failures.append((filePath, errorMessage))
+        return annotationDocuments
+
+    @classmethod
+    def iterKnowtatorFiles(cls, directoryList, originalFileSearchDirs=None, annotationGroup="MIMC_v2", prefetch=0, parser="tree", originalFileIndexCachePath=None):
+        """
+        A generator version of :meth:`parseMultipleKnowtatorFiles <eHostess.eHostInterface.KnowtatorReader.KnowtatorReader.parseMultipleKnowtatorFiles>`. Rather than parsing every file before returning, it yields one Document at a time as each '.knowtator.xml' file is parsed, in the same order that parseMultipleKnowtatorFiles() would return them. This allows downstream work, e.g. comparison or insertion into MongoDB, to begin immediately and keeps memory usage independent of the number of files. The directories are searched when this method is called, so a RuntimeError is raised immediately if no files are found.
 
-        for filePath in fileNames:
-            annotationDocuments.append(cls.parseSingleKnowtatorFile(filePath, originalFileSearchDirs, annotationGroup))
-        return annotationDocuments
\ No newline at end of file
+        :param directoryList: [string] A list of directories containing '.knowtator.xml' files to be parsed. This may be entered as a list of directory paths or a single directory path.
+        :param originalFileSearchDirs: [list of strings] See parseMultipleKnowtatorFiles().
+        :param annotationGroup: [string] See parseMultipleKnowtatorFiles().
+        :param prefetch: [int] The number of documents to parse ahead of the consumer in a background thread. If 0 (default) each file is parsed only when the next document is requested. Errors raised while parsing a file are re-raised when the corresponding document would have been yielded.
+        :param parser: [string] Either "tree" or "iterparse". See parseSingleKnowtatorFile().
+        :param originalFileIndexCachePath: [string] See parseMultipleKnowtatorFiles().
+        :return: [generator] A generator that yields :class:`Document <eHostess.Annotations.Document.Document>` objects.
+        """
+        fileNames = _findKnowtatorFiles(directoryList)
+        if originalFileSearchDirs and not isinstance(originalFileSearchDirs, OriginalFileIndex):
+            originalFileSearchDirs = OriginalFileIndex(originalFileSearchDirs, originalFileIndexCachePath)
+        parseFunction = lambda filePath: cls.parseSingleKnowtatorFile(filePath, originalFileSearchDirs, annotationGroup, parser)
+
+        if prefetch > 0:
+            return iter(_PrefetchingParser(parseFunction, fileNames, prefetch))
+        return (parseFunction(filePath) for filePath in fileNames)
\ No newline at end of file